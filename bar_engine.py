@@ -0,0 +1,207 @@
+import datetime
+import clock
+import threading
+from collections import defaultdict, deque
+import numpy as np
+import pandas as pd
+import pytz
+from config import *
+
+EASTERN = pytz.timezone('US/Eastern')
+TIMEFRAME_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "1h": 60, "1d": 1440}
+
+
+def _to_eastern(timestamp):
+    """统一转换为美东时间的 datetime，支持 datetime 和 Unix 时间戳"""
+    if isinstance(timestamp, (int, float)):
+        return datetime.datetime.fromtimestamp(timestamp, EASTERN)
+    if timestamp.tzinfo is None:
+        return EASTERN.localize(timestamp)
+    return timestamp.astimezone(EASTERN)
+
+
+def bucket_start(timestamp, timeframe):
+    """返回时间戳所属K线的起始时间（美东时间）"""
+    ts = _to_eastern(timestamp)
+    if timeframe == "1d":
+        return EASTERN.localize(datetime.datetime(ts.year, ts.month, ts.day))
+    minutes = TIMEFRAME_MINUTES[timeframe]
+    minute_of_day = ts.hour * 60 + ts.minute
+    start = minute_of_day - minute_of_day % minutes
+    return ts.replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+
+
+def _bar_expired(bar, timeframe, now):
+    """判断K线的周期是否已经结束，日线在收盘时结束"""
+    if timeframe == "1d":
+        close_hour = 20 if TRADE_EXTENDED_HOURS else 16
+        return now >= bar["start"].replace(hour=close_hour) or bucket_start(now, "1d") != bar["start"]
+    return bucket_start(now, timeframe) != bar["start"]
+
+
+def _new_bar(start, open_price, high, low, close, volume):
+    return {"start": start, "open": open_price, "high": high, "low": low, "close": close, "volume": volume}
+
+
+class BarEngine:
+    """
+    多周期K线引擎
+
+    逐笔成交（或轮询得到的价格）先合成1分钟K线，每根1分钟K线收盘后增量汇总到更高周期。
+    每个周期只保留固定数量的已完成K线，指标通过 subscribe 订阅对应周期的收盘事件，
+    只有该周期的K线真正收盘时才会重新计算。
+    """
+
+    def __init__(self, timeframes=None, buffer_sizes=None):
+        self.timeframes = list(timeframes or BAR_TIMEFRAMES)
+        self.higher_timeframes = [tf for tf in self.timeframes if tf != "1m"]
+        self.buffer_sizes = dict(BAR_BUFFER_SIZES, **(buffer_sizes or {}))
+        self.bars = {}      # (symbol, timeframe) -> deque，已完成的K线
+        self.current = {}   # (symbol, timeframe) -> 正在形成的K线
+        self.subscribers = defaultdict(list)
+        self.lock = threading.RLock()
+
+    def _buffer(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self.bars:
+            self.bars[key] = deque(maxlen=self.buffer_sizes.get(timeframe, 500))
+        return self.bars[key]
+
+    def subscribe(self, timeframe, callback):
+        """订阅某个周期的K线收盘事件，callback(symbol, timeframe, bar)"""
+        self.subscribers[timeframe].append(callback)
+
+    def seed(self, symbol, timeframe, history):
+        """用历史K线（包含 Open/High/Low/Close/Volume 列的 DataFrame）初始化缓冲区"""
+        with self.lock:
+            buffer = self._buffer(symbol, timeframe)
+            buffer.clear()
+            history = history.tail(buffer.maxlen)
+
+            # 批量计算每根K线的起始时间
+            index = pd.DatetimeIndex(history.index)
+            index = index.tz_localize(EASTERN) if index.tz is None else index.tz_convert(EASTERN)
+            starts = index.normalize() if timeframe == "1d" else index.floor(f"{TIMEFRAME_MINUTES[timeframe]}min")
+
+            volumes = history["Volume"] if "Volume" in history else [0.0] * len(history)
+            columns = zip(starts.to_pydatetime(), history["Open"], history["High"], history["Low"],
+                          history["Close"], volumes)
+            for start, open_price, high, low, close, volume in columns:
+                buffer.append(_new_bar(start, float(open_price), float(high), float(low), float(close),
+                                       float(volume)))
+
+    def on_trade(self, symbol, timestamp, price, size=0):
+        """处理一笔成交"""
+        start = bucket_start(timestamp, "1m")
+        with self.lock:
+            key = (symbol, "1m")
+            bar = self.current.get(key)
+            if bar is not None and bar["start"] != start:
+                self._close_minute(symbol, bar)
+                bar = None
+
+            if bar is None:
+                self.current[key] = _new_bar(start, price, price, price, price, size)
+            else:
+                bar["high"] = max(bar["high"], price)
+                bar["low"] = min(bar["low"], price)
+                bar["close"] = price
+                bar["volume"] += size
+
+    def _close_minute(self, symbol, minute_bar):
+        """1分钟K线收盘：写入缓冲区并汇总到更高周期"""
+        del self.current[(symbol, "1m")]
+        self._emit(symbol, "1m", minute_bar)
+
+        for timeframe in self.higher_timeframes:
+            key = (symbol, timeframe)
+            start = bucket_start(minute_bar["start"], timeframe)
+            bar = self.current.get(key)
+            if bar is not None and bar["start"] != start:
+                del self.current[key]
+                self._emit(symbol, timeframe, bar)
+                bar = None
+
+            if bar is None:
+                self.current[key] = _new_bar(start, minute_bar["open"], minute_bar["high"], minute_bar["low"],
+                                             minute_bar["close"], minute_bar["volume"])
+            else:
+                bar["high"] = max(bar["high"], minute_bar["high"])
+                bar["low"] = min(bar["low"], minute_bar["low"])
+                bar["close"] = minute_bar["close"]
+                bar["volume"] += minute_bar["volume"]
+
+    def _emit(self, symbol, timeframe, bar):
+        self._buffer(symbol, timeframe).append(bar)
+        for callback in self.subscribers.get(timeframe, ()):
+            try:
+                callback(symbol, timeframe, bar)
+            except Exception as e:
+                print(f"处理{symbol} {timeframe}K线收盘事件出错: {e}")
+
+    def flush(self, now=None, symbol=None):
+        """
+        关闭所有已经到期的K线
+
+        成交稀疏时（例如收盘后不再有新成交），K线不会被下一笔成交触发收盘，需要定期调用。
+        """
+        now = _to_eastern(now or clock.now(EASTERN))
+        with self.lock:
+            symbols = [symbol] if symbol else sorted({s for s, _ in self.current})
+            for sym in symbols:
+                minute_bar = self.current.get((sym, "1m"))
+                if minute_bar is not None and _bar_expired(minute_bar, "1m", now):
+                    self._close_minute(sym, minute_bar)
+
+                for timeframe in self.higher_timeframes:
+                    bar = self.current.get((sym, timeframe))
+                    if bar is not None and _bar_expired(bar, timeframe, now):
+                        del self.current[(sym, timeframe)]
+                        self._emit(sym, timeframe, bar)
+
+    def get_bars(self, symbol, timeframe):
+        """返回已完成的K线列表（从旧到新）"""
+        with self.lock:
+            return list(self.bars.get((symbol, timeframe), ()))
+
+    def current_bar(self, symbol, timeframe):
+        """正在形成的K线（包含当前分钟内的成交），没有时返回 None"""
+        with self.lock:
+            bar = self.current.get((symbol, timeframe))
+            minute_bar = self.current.get((symbol, "1m"))
+            if timeframe == "1m" or minute_bar is None:
+                return dict(bar) if bar is not None else None
+            if bar is None or bucket_start(minute_bar["start"], timeframe) != bar["start"]:
+                return dict(minute_bar, start=bucket_start(minute_bar["start"], timeframe))
+            return dict(bar, high=max(bar["high"], minute_bar["high"]), low=min(bar["low"], minute_bar["low"]),
+                        close=minute_bar["close"], volume=bar["volume"] + minute_bar["volume"])
+
+    def closes(self, symbol, timeframe):
+        """返回已完成K线的收盘价数组"""
+        with self.lock:
+            return np.fromiter((bar["close"] for bar in self.bars.get((symbol, timeframe), ())), dtype=float)
+
+    def last_price(self, symbol):
+        """最近一笔成交价"""
+        with self.lock:
+            bar = self.current.get((symbol, "1m"))
+            if bar is not None:
+                return bar["close"]
+            buffer = self.bars.get((symbol, "1m"))
+            return buffer[-1]["close"] if buffer else None
+
+
+def start_trade_stream(engine, symbols):
+    """订阅 Alpaca 实时成交推送并写入K线引擎，在后台线程中运行"""
+    from alpaca_trade_api.stream import Stream
+    from broker import key, secret, url
+
+    stream = Stream(key, secret, base_url=url, data_feed=BAR_STREAM_FEED)
+
+    async def on_trade(trade):
+        engine.on_trade(trade.symbol, trade.timestamp, float(trade.price), float(trade.size))
+
+    stream.subscribe_trades(on_trade, *symbols)
+    thread = threading.Thread(target=stream.run, daemon=True)
+    thread.start()
+    return stream
@@ -1,6 +1,10 @@
 import os
+import time
+import requests
 import alpaca_trade_api as tradeapi
 from dotenv import load_dotenv
+from metrics import metrics
+from config import *
 
 loaded = load_dotenv()  # 加载.env文件中的变量
 print("dotenv loaded:", loaded)
@@ -20,28 +24,122 @@ api = tradeapi.REST(
     base_url=url,
 )
 
+
+class _TimeoutSession(requests.Session):
+    """给每个券商请求加上超时，一个卡住的连接不会拖住整个周期"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", BROKER_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+api._session = _TimeoutSession()
+
+@metrics.counted("broker.get_price")
 def get_price(symbol):
     return float(api.get_latest_trade(symbol).price)
 
+@metrics.counted("broker.get_position")
 def get_position(symbol):
     try:
         pos = api.get_position(symbol)
         return float(pos.avg_entry_price), int(float(pos.qty))
-    except:
-        return None, 0
+    except tradeapi.rest.APIError as e:
+        # 只有"没有持仓"表示空仓；超时等其他错误向上抛出，由调用方沿用上次的持仓，避免误判为空仓而重复买入
+        if e.status_code == 404:
+            return None, 0
+        raise
 
+@metrics.counted("broker.get_cash")
 def get_cash():
     return float(api.get_account().cash)
 
+@metrics.counted("broker.get_account_summary")
+def get_account_summary():
+    """获取账户概要：现金、购买力、总资产和上一交易日收盘资产"""
+    account = api.get_account()
+    return {
+        "cash": float(account.cash),
+        "buying_power": float(account.buying_power),
+        "equity": float(account.equity),
+        "last_equity": float(account.last_equity),
+    }
+
+@metrics.counted("broker.get_position_values")
+def get_position_values():
+    """获取所有持仓的市值"""
+    return {p.symbol: float(p.market_value) for p in api.list_positions()}
+
+@metrics.counted("broker.buy")
+@metrics.timed("order_submission")
 def buy(symbol, qty):
     api.submit_order(symbol=symbol, qty=qty, side="buy", type="market", time_in_force="gtc")
 
+@metrics.counted("broker.sell")
+@metrics.timed("order_submission")
 def sell(symbol, qty):
     api.submit_order(symbol=symbol, qty=qty, side="sell", type="market", time_in_force="gtc")
 
+@metrics.counted("broker.close_all")
 def close_all():
     positions = api.list_positions()
     for p in positions:
         side = "sell" if float(p.qty) > 0 else "buy"
         qty = abs(int(float(p.qty)))
-        sell(p.symbol, qty)
\ No newline at end of file
+        sell(p.symbol, qty)
+@metrics.counted("broker.submit_exit_orders")
+@metrics.timed("order_submission")
+def submit_exit_orders(symbol, qty, stop_price, limit_price, client_order_id=None):
+    """提交 OCO 卖出保护单（止盈限价单 + 止损单，一个成交后另一个自动撤销），返回订单ID"""
+    order = api.submit_order(symbol=symbol, qty=qty, side="sell", type="limit", time_in_force="gtc",
+                             order_class="oco", take_profit={"limit_price": round(limit_price, 2)},
+                             stop_loss={"stop_price": round(stop_price, 2)}, client_order_id=client_order_id)
+    return order.id
+
+@metrics.counted("broker.submit_trailing_stop")
+@metrics.timed("order_submission")
+def submit_trailing_stop(symbol, qty, trail_percent, client_order_id=None):
+    """提交跟踪止损卖单，trail_percent 为回落比例（0.03 表示 3%），返回订单ID"""
+    order = api.submit_order(symbol=symbol, qty=qty, side="sell", type="trailing_stop", time_in_force="gtc",
+                             trail_percent=round(trail_percent * 100, 2), client_order_id=client_order_id)
+    return order.id
+
+@metrics.counted("broker.submit_limit_buy")
+@metrics.timed("order_submission")
+def submit_limit_buy(symbol, qty, limit_price, client_order_id=None):
+    """提交限价买单，返回订单ID"""
+    order = api.submit_order(symbol=symbol, qty=qty, side="buy", type="limit", time_in_force="gtc",
+                             limit_price=round(limit_price, 2), client_order_id=client_order_id)
+    return order.id
+
+@metrics.counted("broker.cancel_order")
+def cancel_order(order_id, wait=2.0):
+    """撤销订单，并等待撤销完成（最多 wait 秒），之后被占用的股票才能重新挂卖单"""
+    try:
+        api.cancel_order(order_id)
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            if api.get_order(order_id).status in ("canceled", "filled", "expired", "rejected"):
+                return
+            time.sleep(0.2)
+    except Exception as e:
+        print(f"撤销订单 {order_id} 出错: {e}")
+
+@metrics.counted("broker.get_open_orders")
+def get_open_orders():
+    """获取所有未成交订单"""
+    return [{"id": o.id, "client_order_id": o.client_order_id, "symbol": o.symbol, "side": o.side,
+             "type": o.type, "qty": int(float(o.qty))} for o in api.list_orders(status="open")]
+
+@metrics.counted("broker.get_order")
+def get_order(order_id):
+    """查询订单状态和成交情况"""
+    order = api.get_order(order_id, nested=True)
+    # OCO 单的止损腿成交时，成交记录在子订单上
+    filled = [order] + [leg for leg in (order.legs or []) if leg.status == "filled"]
+    filled = [o for o in filled if o.filled_qty and float(o.filled_qty) > 0]
+    return {
+        "status": "filled" if filled and filled[-1].status == "filled" else order.status,
+        "filled_qty": int(float(filled[-1].filled_qty)) if filled else 0,
+        "filled_avg_price": float(filled[-1].filled_avg_price) if filled else None,
+    }
@@ -0,0 +1,226 @@
+"""
+外部请求录制/回放层
+
+录制模式下，券商查询、yfinance 行情和 HTTP 请求（恐慌贪婪指数、通知）的返回值
+按调用参数保存到 cassette 目录；回放模式下只从 cassette 读取，不访问网络，
+同一参数的多次调用按录制顺序依次返回，因此可以完整重放某一天的运行过程。
+
+    CASSETTE_MODE=record python main.py --once
+    CASSETTE_MODE=replay CASSETTE_DIR=cassettes/20240603 python main.py --once
+"""
+import os
+import sys
+import gzip
+import json
+import atexit
+import datetime
+import threading
+from collections import defaultdict
+import pandas as pd
+from config import *
+
+# 只读查询，需要录制返回值
+BROKER_QUERIES = ["get_price", "get_position", "get_cash", "get_account_summary", "get_position_values",
+                  "get_open_orders", "get_order"]
+# 下单操作，回放时不执行
+BROKER_ORDERS = ["buy", "sell", "close_all", "submit_exit_orders", "submit_trailing_stop", "submit_limit_buy",
+                 "cancel_order"]
+
+_active = None
+
+
+class CassetteMissError(Exception):
+    """回放时 cassette 中没有对应的记录"""
+
+
+class CassetteReplayError(Exception):
+    """回放录制时抛出的异常"""
+
+
+class CassetteResponse:
+    """回放用的 HTTP 响应，只实现本项目用到的属性"""
+
+    def __init__(self, status_code, text, url=None):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _encode(value):
+    if isinstance(value, pd.DataFrame):
+        columns = [list(c) if isinstance(c, tuple) else c for c in value.columns]
+        return {
+            "type": "dataframe",
+            "index": [ts.isoformat() for ts in value.index],
+            "columns": columns,
+            "values": value.astype(object).where(value.notna(), None).values.tolist(),
+        }
+    if hasattr(value, "status_code") and hasattr(value, "text"):
+        return {"type": "response", "status_code": value.status_code, "text": value.text, "url": str(value.url)}
+    if isinstance(value, tuple):
+        return {"type": "tuple", "data": list(value)}
+    return {"type": "value", "data": value}
+
+
+def _decode(entry):
+    kind = entry["type"]
+    if kind == "error":
+        raise CassetteReplayError(f"{entry['error']}: {entry['message']}")
+    if kind == "dataframe":
+        columns = entry["columns"]
+        if columns and isinstance(columns[0], list):
+            columns = pd.MultiIndex.from_tuples([tuple(c) for c in columns])
+        index = pd.DatetimeIndex(pd.to_datetime(entry["index"], utc=False), name="Date") if entry["index"] \
+            else pd.DatetimeIndex([], name="Date")
+        return pd.DataFrame(entry["values"], index=index, columns=columns, dtype=float)
+    if kind == "response":
+        return CassetteResponse(entry["status_code"], entry["text"], entry.get("url"))
+    if kind == "tuple":
+        return tuple(entry["data"])
+    return entry["data"]
+
+
+class Cassette:
+    """一个 cassette 目录，每个命名空间保存为一个压缩的 JSON 文件"""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.tracks = defaultdict(list)  # key -> 按调用顺序保存的返回值
+        self.cursors = defaultdict(int)
+        self.lock = threading.Lock()
+        if mode == "replay":
+            self.load()
+
+    def _file(self, namespace):
+        return os.path.join(self.path, f"{namespace}.json.gz")
+
+    def load(self):
+        if not os.path.isdir(self.path):
+            raise CassetteMissError(f"cassette 目录不存在: {self.path}")
+        for name in os.listdir(self.path):
+            if name.endswith(".json.gz"):
+                with gzip.open(os.path.join(self.path, name), "rt", encoding="utf-8") as f:
+                    self.tracks.update(json.load(f))
+
+    def save(self):
+        by_namespace = defaultdict(dict)
+        with self.lock:
+            for key, track in self.tracks.items():
+                by_namespace[key.split(":", 1)[0]][key] = track
+        os.makedirs(self.path, exist_ok=True)
+        for namespace, tracks in by_namespace.items():
+            with gzip.open(self._file(namespace), "wt", encoding="utf-8") as f:
+                json.dump(tracks, f, separators=(",", ":"), default=str)
+
+    def play(self, namespace, name, key_parts, call):
+        """录制模式下执行 call 并保存结果，回放模式下返回保存的结果"""
+        key = f"{namespace}:{name}:{json.dumps(key_parts, sort_keys=True, default=str)}"
+
+        if self.mode == "replay":
+            with self.lock:
+                track = self.tracks.get(key)
+                if not track:
+                    raise CassetteMissError(f"cassette 中没有记录: {key}")
+                index = min(self.cursors[key], len(track) - 1)
+                self.cursors[key] += 1
+            return _decode(track[index])
+
+        try:
+            result = call()
+        except Exception as e:
+            with self.lock:
+                self.tracks[key].append({"type": "error", "error": type(e).__name__, "message": str(e)})
+            raise
+        with self.lock:
+            self.tracks[key].append(_encode(result))
+        return result
+
+
+def _replace_everywhere(owner, name, wrapped):
+    """替换函数本身以及其他模块通过 from ... import 得到的引用"""
+    original = getattr(owner, name)
+    for module in list(sys.modules.values()):
+        if module is not None and getattr(module, "__dict__", {}).get(name) is original:
+            setattr(module, name, wrapped)
+    setattr(owner, name, wrapped)
+
+
+def _patch_broker(cassette):
+    import broker
+
+    for name in BROKER_QUERIES:
+        original = getattr(broker, name)
+
+        def wrapped(*args, _name=name, _original=original, **kwargs):
+            return cassette.play("broker", _name, [args, kwargs], lambda: _original(*args, **kwargs))
+
+        _replace_everywhere(broker, name, wrapped)
+
+    if cassette.mode == "replay":
+        for name in BROKER_ORDERS:
+            def skipped(*args, _name=name, **kwargs):
+                print(f"回放模式，跳过下单: {_name} {args}")
+
+            _replace_everywhere(broker, name, skipped)
+
+
+def _patch_yfinance(cassette):
+    import yfinance as yf
+
+    original_history = yf.Ticker.history
+    original_download = yf.download
+
+    def history(self, *args, **kwargs):
+        return cassette.play("yfinance", "history", [self.ticker, args, kwargs],
+                             lambda: original_history(self, *args, **kwargs))
+
+    def download(*args, **kwargs):
+        return cassette.play("yfinance", "download", [args, kwargs], lambda: original_download(*args, **kwargs))
+
+    yf.Ticker.history = history
+    yf.download = download
+
+
+def _patch_requests(cassette):
+    import requests
+
+    for name in ["get", "post"]:
+        original = getattr(requests, name)
+
+        def wrapped(url, *args, _name=name, _original=original, **kwargs):
+            key_parts = [url, kwargs.get("params"), kwargs.get("json")]
+            return cassette.play("http", _name, key_parts, lambda: _original(url, *args, **kwargs))
+
+        setattr(requests, name, wrapped)
+
+
+def install(mode=None, path=None):
+    """
+    按 CASSETTE_MODE / CASSETTE_DIR 环境变量启用录制或回放
+
+    mode 为 off（默认）时不做任何修改；未指定目录时使用 CASSETTE_ROOT 下以当天日期命名的目录。
+    """
+    global _active
+    mode = mode or os.getenv("CASSETTE_MODE", "off")
+    if mode not in ("record", "replay") or _active is not None:
+        return _active
+
+    path = path or os.getenv("CASSETTE_DIR") or os.path.join(CASSETTE_ROOT, datetime.date.today().strftime("%Y%m%d"))
+    cassette = Cassette(path, mode)
+    _patch_broker(cassette)
+    _patch_yfinance(cassette)
+    _patch_requests(cassette)
+    if mode == "record":
+        atexit.register(cassette.save)
+
+    print(f"cassette {'录制' if mode == 'record' else '回放'}模式: {path}")
+    _active = cassette
+    return cassette
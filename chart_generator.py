@@ -6,6 +6,9 @@ import yfinance as yf
 import os
 from datetime import datetime, timedelta
 from market_sentiment import FearGreedIndex
+from data_feed import fetch_bars
+from metrics import metrics
+from indicator_cache import moving_average, ma_crossover_signals
 from config import TARGETS
 
 TARGET_ETF = TARGETS[0] if TARGETS else "SOXL"
@@ -22,6 +25,7 @@ class ChartGenerator:
 
     def get_historical_data(self, symbol, period="6mo"):
         """获取历史价格数据"""
+        metrics.count("http.yfinance")
         ticker = yf.Ticker(symbol)
         data = ticker.history(period=period)
         return data
@@ -42,8 +46,8 @@ class ChartGenerator:
         ax1.legend(loc='upper left')
 
         # 添加20日和50日移动平均线
-        price_data['MA20'] = price_data['Close'].rolling(window=20).mean()
-        price_data['MA50'] = price_data['Close'].rolling(window=50).mean()
+        price_data['MA20'] = moving_average(symbol, price_data, 20)
+        price_data['MA50'] = moving_average(symbol, price_data, 50)
         ax1.plot(price_data.index, price_data['MA20'], 'r--', label='20-day MA')
         ax1.plot(price_data.index, price_data['MA50'], 'g--', label='50-day MA')
 
@@ -56,8 +60,8 @@ class ChartGenerator:
         # 实际应用中应当从API获取真实历史数据
         for i in range(len(price_data) - 20):
             date = price_data.index[i + 20]
-            price_change = (price_data['Close'][i + 20] - price_data['Close'][i]) / price_data['Close'][i]
-            volatility = price_data['Close'][i:i + 20].pct_change().std() * np.sqrt(20)
+            price_change = (price_data['Close'].iloc[i + 20] - price_data['Close'].iloc[i]) / price_data['Close'].iloc[i]
+            volatility = price_data['Close'].iloc[i:i + 20].pct_change().std() * np.sqrt(20)
 
             # 基于价格变化和波动率的简单模型
             # 实际恐慌贪婪指数考虑更多因素
@@ -111,12 +115,8 @@ class ChartGenerator:
         if symbols is None:
             symbols = TARGETS
 
-        # 获取价格数据
-        data = {}
-        for symbol in symbols:
-            df = self.get_historical_data(symbol, period)
-            if not df.empty:
-                data[symbol] = df
+        # 批量获取价格数据
+        data, _ = fetch_bars(symbols, period=period)
 
         if not data:
             return None
@@ -136,7 +136,7 @@ class ChartGenerator:
         ax1.legend(loc='upper left')
 
         # 获取恐慌贪婪指数
-        fg_signal, fg_value = self.fear_greed_index.get_fear_greed_index()
+        fg_value, _ = self.fear_greed_index.get_fear_greed_index()
 
         # 在下方图表显示当前恐慌贪婪指数
         # 这里使用简化模拟历史数据
@@ -337,20 +337,9 @@ class ChartGenerator:
         # 获取价格数据
         price_data = self.get_historical_data(symbol, period)
 
-        # 计算短期和长期移动平均线
-        price_data[f'MA{short_period}'] = price_data['Close'].rolling(window=short_period).mean()
-        price_data[f'MA{long_period}'] = price_data['Close'].rolling(window=long_period).mean()
-
-        # 计算金叉死叉信号
-        price_data['Signal'] = 0
-        # 金叉：短期均线从下方穿过长期均线
-        price_data.loc[(price_data[f'MA{short_period}'] > price_data[f'MA{long_period}']) &
-                       (price_data[f'MA{short_period}'].shift(1) <= price_data[f'MA{long_period}'].shift(1)),
-        'Signal'] = 1
-        # 死叉：短期均线从上方穿过长期均线
-        price_data.loc[(price_data[f'MA{short_period}'] < price_data[f'MA{long_period}']) &
-                       (price_data[f'MA{short_period}'].shift(1) >= price_data[f'MA{long_period}'].shift(1)),
-        'Signal'] = -1
+        # 计算短期和长期移动平均线及金叉死叉信号（与策略共用指标缓存）
+        signals = ma_crossover_signals(symbol, price_data, short_period, long_period)
+        price_data = price_data.join(signals)
 
         # 创建图表
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), gridspec_kw={'height_ratios': [3, 1]})
@@ -384,8 +373,8 @@ class ChartGenerator:
         # 添加恐慌贪婪指数历史模拟
         for i in range(len(price_data) - 20):
             date = price_data.index[i + 20]
-            price_change = (price_data['Close'][i + 20] - price_data['Close'][i]) / price_data['Close'][i]
-            volatility = price_data['Close'][i:i + 20].pct_change().std() * np.sqrt(20)
+            price_change = (price_data['Close'].iloc[i + 20] - price_data['Close'].iloc[i]) / price_data['Close'].iloc[i]
+            volatility = price_data['Close'].iloc[i:i + 20].pct_change().std() * np.sqrt(20)
 
             # 简化模型
             simulated_fg = 50 + (price_change * 200) - (volatility * 200)
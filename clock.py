@@ -0,0 +1,83 @@
+"""
+时钟
+
+所有与交易逻辑相关的"现在几点"和"等待"都通过这里获取：交易时段判断、每日重置、缓存过期、主循环的等待等。
+实盘使用 WallClock；模拟时安装 SimulatedClock，sleep 只把虚拟时间向前推进，
+同一套主循环可以在几秒内跑完历史上的一整周。
+
+只用于测量耗时的计时（例如周期耗时统计）和真实网络请求的超时不经过这里。
+"""
+import time as _time
+import datetime
+
+
+class WallClock:
+    """真实时钟"""
+
+    def now(self, tz=None):
+        return datetime.datetime.now(tz)
+
+    def time(self):
+        return _time.time()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+
+class SimulationFinished(BaseException):
+    """模拟时间到达终点（继承 BaseException，不会被主循环的 except Exception 吞掉）"""
+
+
+class SimulatedClock:
+    """
+    虚拟时钟
+
+    start / end 为带时区的 datetime；sleep 时立即推进虚拟时间，并调用 on_advance(now)
+    （例如按新的时间更新模拟券商的价格），超过 end 时抛出 SimulationFinished。
+    """
+
+    def __init__(self, start, end=None, on_advance=None):
+        self.current = start
+        self.end = end
+        self.on_advance = on_advance
+
+    def now(self, tz=None):
+        if tz is None:
+            # 与 datetime.now() 一致，返回本地时间（不带时区）
+            return self.current.astimezone().replace(tzinfo=None)
+        return self.current.astimezone(tz)
+
+    def time(self):
+        return self.current.timestamp()
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        self.current += datetime.timedelta(seconds=seconds)
+        if self.end is not None and self.current > self.end:
+            raise SimulationFinished()
+        if self.on_advance is not None:
+            self.on_advance(self.current)
+
+
+_clock = WallClock()
+
+
+def install(clock):
+    """替换全局时钟，返回原来的时钟"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def now(tz=None):
+    return _clock.now(tz)
+
+
+def time():
+    return _clock.time()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
@@ -29,4 +29,178 @@ USE_FEAR_GREED_INDEX = True  # 是否使用恐慌贪婪指数
 FEAR_BUY_THRESHOLD = 30      # 小于此值时考虑买入
 GREED_SELL_THRESHOLD = 70    # 大于此值时考虑卖出
 EXTREME_FEAR_BOOST = 1.5     # 极度恐慌时增加仓位比例
-EXTREME_GREED_REDUCE = 0.5   # 极度贪婪时减少仓位比例
\ No newline at end of file
+EXTREME_GREED_REDUCE = 0.5   # 极度贪婪时减少仓位比例
+
+# 单次运行模式配置（供 cron 调用 main.py --once）
+STATE_SNAPSHOT_FILE = "state_snapshot.json"  # 状态快照文件
+ONCE_TIME_BUDGET = 120       # 单次运行的最长耗时（秒），超时中断周期，保存状态后退出
+ONCE_EXIT_GRACE = 15         # 超时后等待主线程保存状态的时间（秒），仍未退出时不保存直接退出
+
+# 多进程分片运行配置（supervisor.py）
+UNIVERSE = TARGETS           # 轮动股票池，默认与交易标的一致
+SHARD_SIZE = 25              # 每个工作进程负责的股票数量
+MAX_WORKER_PROCESSES = 16    # 工作进程数量上限
+SHARD_CYCLE_TIMEOUT = 240    # 等待工作进程返回一个周期结果的最长时间（秒），超时或进程退出时重启该分片
+
+# 批量行情下载配置（data_feed.py）
+DATA_CHUNK_SIZE = 50         # 每次请求下载的股票数量
+DATA_MAX_WORKERS = 4         # 并发下载的批次数
+DATA_REQUESTS_PER_SECOND = 2  # 每秒最多发起的请求数
+DATA_CACHE_DIR = "data_cache"  # 行情缓存目录，支持断点续传
+DATA_CACHE_MAX_AGE = 3600    # 行情缓存有效期（秒）
+
+# 每周轮动配置（rotation.py）
+USE_ROTATION = True          # 是否启用每周轮动，关闭时固定交易 TARGETS
+ROTATION_WEEKDAY = 0         # 每周轮动日（0=周一）
+ROTATION_UNIVERSE = ["SOXL", "MSTU", "NVDA", "TQQQ", "UPRO", "TECL", "FNGU", "LABU",
+                     "SPY", "QQQ", "SMH", "XLK", "XLE", "XLF", "TLT", "GLD"]  # 候选股票池
+ROTATION_TOP_N = 3           # 每次选出的标的数量
+ROTATION_WEIGHTING = "inverse_vol"  # 资金权重分配方式：equal 或 inverse_vol
+ROTATION_HISTORY_PERIOD = "1y"  # 排名使用的历史数据长度
+ROTATION_MOMENTUM_PERIOD = 63   # 动量周期（交易日）
+ROTATION_VOL_PERIOD = 20        # 波动率周期（交易日）
+ROTATION_MA_PERIOD = 50         # 均线趋势周期（交易日）
+ROTATION_SCORE_WEIGHTS = {   # 综合得分中各因子的权重
+    "momentum": 0.4,
+    "risk_adjusted": 0.3,
+    "trend": 0.2,
+    "sentiment": 0.1,
+}
+ROTATION_SELL_DROPPED = False  # 是否卖出被轮出的持仓（首次轮动不卖出，已有持仓由原有的止损止盈管理）
+
+# 性能监控配置（metrics.py）
+METRICS_PORT = 9108          # /metrics 接口端口，0 表示不启动
+METRICS_WINDOW = 1000        # 计算分位数使用的最近样本数
+
+# 录制/回放配置（cassette.py），通过环境变量 CASSETTE_MODE=record/replay 启用
+CASSETTE_ROOT = "cassettes"  # cassette 根目录，默认按日期建子目录
+
+# 多周期K线配置（bar_engine.py）
+BAR_TIMEFRAMES = ["1m", "5m", "15m", "1h", "1d"]  # 维护的K线周期
+BAR_BUFFER_SIZES = {         # 每个周期保留的已完成K线数量
+    "1m": 390,
+    "5m": 234,
+    "15m": 130,
+    "1h": 120,
+    "1d": 260,
+}
+USE_TRADE_STREAM = False     # 是否订阅 Alpaca 实时成交推送（否则使用每次轮询的价格）
+BAR_STREAM_FEED = "iex"      # 实时成交数据源：iex 或 sip
+
+# 指标缓存配置（indicator_cache.py）
+INDICATOR_CACHE_SIZE = 512   # 最多缓存的指标结果数量，超过后淘汰最久未使用的
+
+# 市场状态数据配置（market_monitor.py）
+MARKET_REGIME_INPUTS = [     # 参与市场强弱评估的指数，kind 为 trend（看涨跌幅）或 volatility（看指数水平）
+    {"label": "SPY", "symbol": "SPY", "kind": "trend"},
+    {"label": "QQQ", "symbol": "QQQ", "kind": "trend"},
+    {"label": "VIX", "symbol": "^VIX", "kind": "volatility"},
+]
+MARKET_DATA_CACHE_EXPIRY = 300  # 缓存有效期（秒），过期后在后台刷新，刷新完成前继续使用旧数据
+MARKET_DATA_MAX_STALE = 1800    # 旧数据最长可用时间（秒），超过后同步刷新
+MARKET_DATA_TIMEOUT = 10        # 每次刷新等待各数据源的最长时间（秒），超时的数据源沿用旧值
+
+# 周期上下文配置（cycle_context.py）
+REGIME_HISTORY_FILE = "regime_history.csv"  # 每个周期的市场状态记录
+REGIME_HISTORY_SIZE = 2000   # 内存中保留的周期数
+
+# 蒙特卡洛风险模拟配置（monte_carlo.py）
+MC_PATHS = 100000            # 模拟路径数
+MC_HORIZON = 252             # 每条路径的交易日数
+MC_BLOCK_SIZE = 10           # 区块自助抽样的区块长度（交易日），保留短期自相关
+MC_CHUNK_SIZE = 10000        # 每个进程一次模拟的路径数
+MC_HISTORY_PERIOD = "2y"     # 抽样使用的历史数据长度
+
+# 实时看板配置（dashboard.py）
+DASHBOARD_PORT = 8050        # 看板端口，0 表示不启动
+DASHBOARD_MAX_POINTS = 500   # 资产曲线下采样后的最大点数
+DASHBOARD_EVENT_BUFFER = 1000  # 保留的最近推送事件数，断线重连后据此补发
+
+# 行情事件日志配置（journal.py）
+JOURNAL_ENABLED = True       # 是否记录行情、信号和下单意图
+JOURNAL_DIR = "journal"      # 日志目录，每个交易日一个文件
+JOURNAL_INITIAL_RECORDS = 65536  # 新文件预分配的记录数，写满后自动扩容一倍
+
+# 策略插件配置（plugins.py）
+STRATEGY_PLUGINS = [         # 同一进程内运行的策略，capital 为资金预算（占账户总值比例），risk 为当日亏损预算
+    {"name": "legacy"},      # 原有的分层建仓策略，处理 TARGETS 和仍有持仓的股票
+    # {"name": "rsi_reversion", "symbols": ["SPY", "QQQ"], "capital": 0.1, "risk": 0.01,
+    #  "params": {"period": 14, "oversold": 30, "exit_level": 55}},
+]
+
+# 券商端保护单配置（protective_orders.py）
+USE_PROTECTIVE_ORDERS = False  # 是否在券商处常驻止损/止盈保护单和加仓限价单（轮询检查仍作为兜底）
+PROTECTIVE_EXIT_MODE = "oco"   # oco：止盈限价单+止损单，止损价每周期随最高价上移；trailing：跟踪止损生效后改用券商原生跟踪止损单
+PROTECTIVE_LADDER = True       # 是否在每个加仓价位预先挂限价买单
+
+# 情绪聚合配置（sentiment_aggregator.py）
+SENTIMENT_DEADLINE = 3.0       # 每次刷新等待情绪数据源的最长时间（秒），未返回的数据源沿用上一次的读数
+SENTIMENT_HTTP_TIMEOUT = 5     # 单个情绪数据请求的超时（秒）
+SENTIMENT_REFRESH_INTERVAL = 600  # 同一数据源两次请求的最小间隔（秒）
+SENTIMENT_HALF_LIFE = 86400    # 读数权重随数据时间衰减的半衰期（秒）
+SENTIMENT_MAX_AGE = 4 * 86400  # 超过这个时间的读数不参与合成（覆盖长周末）
+SENTIMENT_SOURCE_WEIGHTS = {   # 各数据源的基础权重，权重为 0 表示不使用
+    "cnn_api": 1.0,            # CNN 恐慌贪婪指数接口
+    "cnn_scrape": 0.5,         # CNN 网页（与接口是同一个指数，作为备份）
+    "vix_term": 0.5,           # VIX / VIX3M 期限结构
+    "put_call": 0.5,           # CBOE 股票期权认沽/认购比
+}
+SENTIMENT_PUT_CALL_URL = "https://cdn.cboe.com/data/us/options/market_statistics/daily/{date}_daily_options"
+
+# 周期时间预算配置（deadline.py）
+CYCLE_BUDGET = 60              # 每个决策周期的时间预算（秒）
+CYCLE_EXIT_RESERVE = 20        # 剩余时间少于此值时不再处理开仓和加仓，只检查持仓的卖出
+STAGE_TIMEOUTS = {             # 各阶段的超时（秒），超时后使用备用值
+    "market_conditions": 15,   # 市场状况和情绪，超时沿用上个周期的市场状态
+    "equity": 10,              # 账户总值，超时沿用上次的值
+    "price": 5,                # 最新价格，超时沿用最近一次的价格和持仓，本周期只检查卖出
+    "position": 5,             # 持仓查询，同上
+    "indicators": 10,          # 均线信号和 ATR，超时沿用缓存的信号、跳过 ATR 止损
+}
+STAGE_WORKERS = 8              # 执行各阶段的线程数（超时的调用会继续占用线程直到返回）
+PRICE_MAX_STALE = 600          # 取价失败时最多沿用多久以前的价格（秒）
+BREAKER_FAILURES = 3           # 单只股票连续失败多少个周期后熔断
+BREAKER_COOLDOWN = 900         # 熔断时长（秒），期间不再为它开仓，有持仓时仍检查卖出
+BROKER_TIMEOUT = 10            # 券商接口单个请求的超时（秒）
+NOTIFY_TIMEOUT = 5             # 发送通知的超时（秒），发送失败只打印不影响交易
+
+# 成交记录与绩效归因配置（trade_store.py / trade_analytics.py）
+TRADE_STORE_ENABLED = True     # 是否记录带触发规则的成交（分片多进程模式下不记录）
+TRADE_STORE_DIR = "trades"     # 列式成交记录目录
+
+# 盘前准备配置（warmup.py）
+USE_WARMUP = True              # 开盘前预先下载日线、计算指标、刷新情绪数据、核对持仓并预算开仓股数
+WARMUP_LEAD = 1800             # 开盘前多少秒开始盘前准备
+WARMUP_PRICE_TOLERANCE = 0.01  # 开盘后价格与盘前价格相差不超过该比例时，按盘前预算的金额下单
+
+# 自适应轮询配置（poll_scheduler.py）
+USE_POLL_SCHEDULER = True      # 两个完整周期之间，按离触发价的距离和波动率单独检查部分股票
+POLL_MIN_INTERVAL = 30         # 同一只股票两次检查的最短间隔（秒）
+POLL_MAX_INTERVAL = 300        # 不短于此间隔的股票只在完整周期中检查（与完整周期的间隔一致）
+POLL_SAFETY = 0.1              # 检查间隔占预计到达触发价时间的比例
+POLL_API_BUDGET = 20           # 单独检查每分钟最多使用的券商请求数
+POLL_CALLS_PER_CHECK = 2       # 每次检查的券商请求数的初始估计（价格和持仓），之后按实际请求数的平均值
+POLL_DEFAULT_VOLATILITY = 0.03  # 日线不足以计算 ATR 时使用的日波动率
+
+# 影子配置评估（shadow.py）
+USE_SHADOW = True              # 每个周期用本周期的行情同时评估参数网格中的全部组合（只记模拟持仓，不下单）
+SHADOW_GRID = {                # 参数网格，取各参数取值的全部组合；未列出的参数使用当前值
+    "stop_loss": [-0.03, -0.05, -0.08],
+    "take_profit": [0.06, 0.10, 0.15],
+    "trailing_stop": [0.02, 0.03, 0.05],
+    "ma_short": [5, 9],
+    "ma_long": [20, 50],
+    "extreme_fear_boost": [1.0, 1.5, 2.0],
+}
+SHADOW_FILE = "shadow_book.npz"  # 影子账户保存位置，单次运行模式下接着上次的结果继续
+SHADOW_REPORT_TOP = 3          # 每个周期报告收益最高的几组参数
+
+# 分批执行配置（execution.py）
+USE_EXECUTION = True           # 金额较大的买单拆成子单分批买入，减小对价格的冲击
+EXECUTION_MIN_VALUE = 20000    # 买入金额不低于此值（美元）时分批执行，否则一次下市价单
+EXECUTION_ALGO = "vwap"        # vwap 按日内成交量分布分配各时间片的股数；twap 均匀分配
+EXECUTION_HORIZON = 1800       # 母单在多少秒内执行完（不晚于收盘）
+EXECUTION_SLICE_INTERVAL = 60  # 时间片长度（秒），每个时间片最多一个子单
+EXECUTION_LIMIT_OFFSET = 0.002  # 子单限价比下单时价格高出的比例
+EXECUTION_CHILD_TIMEOUT = 30   # 子单挂出多久未成交就撤销（秒），未成交的股数并入之后的时间片
+EXECUTION_MAX_CHASE = 0.02     # 价格比母单下单时上涨超过该比例时暂停下子单
@@ -0,0 +1,75 @@
+import os
+import csv
+import clock
+from collections import namedtuple, deque
+import pytz
+from metrics import metrics
+from config import *
+
+CONTEXT_FIELDS = ["time", "market_status", "fg_value", "fg_rating", "fg_signal", "fg_multiplier",
+                  "market_multiplier"]
+
+# 最近的周期上下文，供事后分析
+regime_history = deque(maxlen=REGIME_HISTORY_SIZE)
+
+
+class CycleContext(namedtuple("CycleContext", CONTEXT_FIELDS)):
+    """
+    一个决策周期内不变的市场状态
+
+    每个周期开始时计算一次，传给该周期内所有股票的决策，保证同一周期内所有股票看到相同的市场状态。
+    """
+    __slots__ = ()
+
+    @property
+    def size_multiplier(self):
+        """仓位调整总系数"""
+        return self.fg_multiplier * self.market_multiplier
+
+
+def build_cycle_context(market_monitor, now=None):
+    """查询一次市场状况和恐慌贪婪指数，生成本周期的上下文"""
+    now = now or clock.now(pytz.timezone('US/Eastern'))
+    market_status, data = market_monitor.check_market_conditions()
+
+    with metrics.stage("sentiment"):
+        fear_greed = data.get('fear_greed', {}) if USE_FEAR_GREED_INDEX else {}
+        fg_value = fear_greed.get('value')
+        fg_signal = market_monitor.fear_greed_index.get_signal_from_score(fg_value)
+    fg_multiplier, market_multiplier = market_monitor.position_multipliers(market_status, data)
+
+    return CycleContext(
+        time=now.isoformat(timespec="seconds"),
+        market_status=market_status,
+        fg_value=fg_value,
+        fg_rating=fear_greed.get('rating'),
+        fg_signal=fg_signal,
+        fg_multiplier=fg_multiplier,
+        market_multiplier=market_multiplier,
+    )
+
+
+def record_regime(context, path=REGIME_HISTORY_FILE):
+    """记录周期上下文：保存在内存中，并追加一行到 CSV 文件"""
+    regime_history.append(context)
+    if not path:
+        return
+    try:
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(CONTEXT_FIELDS)
+            writer.writerow(context)
+    except Exception as e:
+        print(f"记录市场状态出错: {e}")
+
+
+def load_regime_history(path=REGIME_HISTORY_FILE):
+    """读取市场状态记录为 DataFrame"""
+    import pandas as pd
+
+    history = pd.read_csv(path)
+    # 夏令时前后的时区偏移不同，先统一转为 UTC 再转回美东时间
+    history["time"] = pd.to_datetime(history["time"], utc=True).dt.tz_convert('US/Eastern')
+    return history
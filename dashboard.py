@@ -0,0 +1,242 @@
+"""
+实时看板
+
+交易进程在内存中维护持仓、资产曲线、信号和市场状态，通过本地 HTTP 提供：
+    /            看板页面（浏览器端绘图，不生成 PNG）
+    /api/state   当前完整状态，资产曲线已下采样
+    /events      server-sent events 增量推送
+页面加载不会调用券商接口。
+"""
+import json
+import datetime
+import clock
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from config import *
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if hasattr(value, "item"):  # numpy 标量
+        return value.item()
+    if hasattr(value, "_asdict"):  # namedtuple，例如 CycleContext
+        return value._asdict()
+    return str(value)
+
+
+def _to_json(payload):
+    return json.dumps(payload, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def downsample(points, max_points=DASHBOARD_MAX_POINTS):
+    """
+    Largest-Triangle-Three-Buckets 下采样
+
+    points 为 [(时间戳秒, 数值), ...]，保留首尾点，每个分桶选出与相邻点构成三角形面积最大的点，
+    曲线的峰谷形状基本不变。
+    """
+    if len(points) <= max_points or max_points < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (max_points - 2)
+    previous = points[0]
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+        next_bucket = points[end:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        best, best_area = points[start], -1.0
+        for point in points[start:end]:
+            area = abs((previous[0] - avg_x) * (point[1] - previous[1]) - (previous[0] - point[0]) * (avg_y - previous[1]))
+            if area > best_area:
+                best, best_area = point, area
+        sampled.append(best)
+        previous = best
+    sampled.append(points[-1])
+    return sampled
+
+
+class DashboardState:
+    """看板数据，所有更新都会生成一条带序号的事件供 SSE 推送"""
+
+    def __init__(self, event_buffer=DASHBOARD_EVENT_BUFFER):
+        self.condition = threading.Condition()
+        self.equity = []      # [(时间戳秒, 资产总值)]
+        self.symbols = {}     # 股票 -> 价格、持仓、信号
+        self.regime = None
+        self.trades = deque(maxlen=200)
+        self.events = deque(maxlen=event_buffer)
+        self.last_event_id = 0
+
+    def _publish(self, kind, payload):
+        # 调用方已持有 condition
+        self.last_event_id += 1
+        self.events.append((self.last_event_id, kind, _to_json(payload)))
+        self.condition.notify_all()
+
+    def record_equity(self, equity, when=None):
+        when = when or clock.now()
+        point = (when.timestamp(), float(equity))
+        with self.condition:
+            self.equity.append(point)
+            self._publish("equity", point)
+
+    def update_symbol(self, symbol, **fields):
+        with self.condition:
+            entry = self.symbols.setdefault(symbol, {"symbol": symbol})
+            entry.update(fields)
+            entry["updated"] = clock.now().isoformat(timespec="seconds")
+            self._publish("symbol", entry)
+
+    def set_regime(self, context):
+        with self.condition:
+            self.regime = context._asdict() if hasattr(context, "_asdict") else dict(context)
+            self._publish("regime", self.regime)
+
+    def add_trade(self, trade):
+        with self.condition:
+            self.trades.append(trade)
+            self._publish("trade", trade)
+
+    def snapshot(self, max_points=DASHBOARD_MAX_POINTS):
+        with self.condition:
+            return {
+                "equity": downsample(self.equity, max_points),
+                "equity_points": len(self.equity),
+                "symbols": sorted(self.symbols.values(), key=lambda entry: entry["symbol"]),
+                "regime": self.regime,
+                "trades": list(self.trades),
+                "last_event_id": self.last_event_id,
+            }
+
+    def wait_events(self, after_id, timeout=15):
+        """返回序号大于 after_id 的事件，没有新事件时最多等待 timeout 秒"""
+        with self.condition:
+            if self.last_event_id <= after_id:
+                self.condition.wait(timeout)
+            return [event for event in self.events if event[0] > after_id]
+
+
+# 交易进程内共用的看板数据
+dashboard = DashboardState()
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="zh"><head><meta charset="utf-8"><title>quant-live-trader</title>
+<style>
+body{font-family:sans-serif;margin:20px;background:#fafafa}
+table{border-collapse:collapse;margin:10px 0}td,th{border:1px solid #ccc;padding:4px 10px;text-align:right}
+canvas{background:#fff;border:1px solid #ccc}#regime{font-size:18px}
+</style></head><body>
+<div id="regime">市场状态: -</div>
+<canvas id="equity" width="900" height="300"></canvas>
+<h3>持仓与信号</h3><table id="symbols"></table>
+<h3>最近交易</h3><table id="trades"></table>
+<script>
+let equity=[], symbols={}, trades=[];
+const fmt=v=>v==null?"-":(typeof v==="number"?(Math.abs(v)<1000?v.toFixed(2):v.toFixed(0)):v);
+function drawEquity(){
+  const c=document.getElementById("equity"),g=c.getContext("2d");g.clearRect(0,0,c.width,c.height);
+  if(equity.length<2)return;
+  const xs=equity.map(p=>p[0]),ys=equity.map(p=>p[1]);
+  const x0=Math.min(...xs),x1=Math.max(...xs),y0=Math.min(...ys),y1=Math.max(...ys);
+  const sx=x=>10+(x-x0)/((x1-x0)||1)*(c.width-20),sy=y=>c.height-10-(y-y0)/((y1-y0)||1)*(c.height-20);
+  g.beginPath();equity.forEach((p,i)=>i?g.lineTo(sx(p[0]),sy(p[1])):g.moveTo(sx(p[0]),sy(p[1])));
+  g.strokeStyle="#1f77b4";g.stroke();g.fillText(fmt(y1),12,12);g.fillText(fmt(y0),12,c.height-12);
+}
+function row(tag,values){
+  const tr=document.createElement("tr");
+  values.forEach(v=>{const cell=document.createElement(tag);cell.textContent=v;tr.appendChild(cell);});
+  return tr;
+}
+function renderTable(id,rows,cols){
+  // 股票代码、触发规则等字符串一律按文本写入，不拼接 HTML
+  document.getElementById(id).replaceChildren(row("th",cols),...rows.map(r=>row("td",cols.map(c=>fmt(r[c])))));
+}
+function renderRegime(r){if(r)document.getElementById("regime").textContent=
+  `市场状态: ${r.market_status}  恐慌贪婪: ${fmt(r.fg_value)} (${r.fg_rating||"-"})  仓位系数: ${fmt(r.fg_multiplier*r.market_multiplier)}  ${r.time}`;}
+function render(){drawEquity();
+  renderTable("symbols",Object.values(symbols),["symbol","price","qty","entry","layers","ma_signal","fg_signal","updated"]);
+  renderTable("trades",trades.slice(-20).reverse(),["action","symbol","qty","price","reason"]);}
+fetch("/api/state").then(r=>r.json()).then(s=>{
+  equity=s.equity;s.symbols.forEach(e=>symbols[e.symbol]=e);trades=s.trades;renderRegime(s.regime);render();
+  const es=new EventSource("/events?after="+s.last_event_id);
+  es.addEventListener("equity",e=>{equity.push(JSON.parse(e.data));if(equity.length>2000)equity.splice(1,1);render();});
+  es.addEventListener("symbol",e=>{const d=JSON.parse(e.data);symbols[d.symbol]=d;render();});
+  es.addEventListener("trade",e=>{trades.push(JSON.parse(e.data));render();});
+  es.addEventListener("regime",e=>renderRegime(JSON.parse(e.data)));
+});
+</script></body></html>
+"""
+
+
+def _int_param(query, name, default):
+    """读取整数查询参数，缺失或格式不对时返回默认值"""
+    try:
+        return int(query.get(name, [default])[0])
+    except (TypeError, ValueError):
+        return default
+
+
+class _DashboardHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/":
+            self._send(PAGE, "text/html; charset=utf-8")
+        elif url.path == "/api/state":
+            max_points = _int_param(query, "points", DASHBOARD_MAX_POINTS)
+            if max_points < 3:
+                max_points = DASHBOARD_MAX_POINTS
+            self._send(_to_json(dashboard.snapshot(max_points)), "application/json")
+        elif url.path == "/events":
+            after = self.headers.get("Last-Event-ID")
+            after = _int_param({"after": [after]} if after else query, "after", 0)
+            self._stream_events(after)
+        else:
+            self.send_error(404)
+
+    def _send(self, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_events(self, last_id):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                events = dashboard.wait_events(last_id)
+                if not events:
+                    self.wfile.write(b": keepalive\n\n")  # 保持连接
+                for event_id, kind, data in events:
+                    self.wfile.write(f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n".encode("utf-8"))
+                    last_id = event_id
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_dashboard_server(port=DASHBOARD_PORT, host="127.0.0.1"):
+    """在后台线程启动看板"""
+    server = ThreadingHTTPServer((host, port), _DashboardHandler)
+    server.daemon_threads = True  # SSE 连接不阻止进程退出
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"实时看板已启动: http://{host}:{port}/")
+    return server
@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import yfinance as yf
+from metrics import metrics
+from config import *
+
+
+class RateLimiter:
+    """简单的请求限速器，保证相邻两次请求的间隔不小于 1/rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiter = RateLimiter(DATA_REQUESTS_PER_SECOND)
+
+
+def _cache_path(cache_dir, symbol, period, interval):
+    return os.path.join(cache_dir, f"{interval}_{period}", f"{symbol.replace('^', '_')}.pkl")
+
+
+def _load_cached(cache_dir, symbol, period, interval, max_age):
+    path = _cache_path(cache_dir, symbol, period, interval)
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > max_age:
+        return None
+    try:
+        return pd.read_pickle(path)
+    except Exception as e:
+        print(f"读取{symbol}行情缓存失败: {e}")
+        return None
+
+
+def _save_cached(cache_dir, symbol, period, interval, df):
+    path = _cache_path(cache_dir, symbol, period, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        df.to_pickle(path)
+    except Exception as e:
+        print(f"保存{symbol}行情缓存失败: {e}")
+
+
+def _split_download(data, symbols):
+    """把 yf.download 的多股票结果拆成 {symbol: DataFrame}"""
+    frames = {}
+    if data is None or data.empty:
+        return frames
+
+    if isinstance(data.columns, pd.MultiIndex):
+        tickers = data.columns.get_level_values(0)
+        for symbol in symbols:
+            if symbol in tickers:
+                df = data[symbol].dropna(how='all')
+                if not df.empty:
+                    frames[symbol] = df
+    elif len(symbols) == 1:
+        df = data.dropna(how='all')
+        if not df.empty:
+            frames[symbols[0]] = df
+    return frames
+
+
+def _download_chunk(symbols, period, interval):
+    """一次请求下载一组股票，失败时逐只重试，单只股票失败不影响其他股票"""
+    _rate_limiter.wait()
+    metrics.count("http.yfinance")
+    try:
+        data = yf.download(tickers=symbols, period=period, interval=interval, group_by='ticker',
+                           auto_adjust=False, threads=False, progress=False)
+        frames = _split_download(data, symbols)
+    except Exception as e:
+        print(f"批量下载 {len(symbols)} 只股票失败，改为逐只下载: {e}")
+        frames = {}
+
+    for symbol in symbols:
+        if symbol in frames:
+            continue
+        _rate_limiter.wait()
+        metrics.count("http.yfinance")
+        try:
+            df = yf.Ticker(symbol).history(period=period, interval=interval, auto_adjust=False)
+            if not df.empty:
+                frames[symbol] = df
+        except Exception as e:
+            print(f"下载{symbol}数据失败: {e}")
+    return frames
+
+
+def fetch_bars(symbols, period="6mo", interval="1d", chunk_size=DATA_CHUNK_SIZE,
+               max_workers=DATA_MAX_WORKERS, cache_dir=DATA_CACHE_DIR, max_age=DATA_CACHE_MAX_AGE):
+    """
+    分批并发下载多只股票的K线
+
+    已经下载且未过期的股票直接读取缓存，因此中断后再次调用只会补齐剩下的部分。
+    返回 (bars, failed)，bars 为 {symbol: OHLCV DataFrame}，failed 为下载失败的股票列表。
+    """
+    symbols = list(dict.fromkeys(symbols))
+    bars = {}
+    pending = []
+    for symbol in symbols:
+        cached = _load_cached(cache_dir, symbol, period, interval, max_age) if cache_dir else None
+        if cached is not None:
+            bars[symbol] = cached
+        else:
+            pending.append(symbol)
+
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(_download_chunk, chunk, period, interval) for chunk in chunks]
+        for future in as_completed(futures):
+            for symbol, df in future.result().items():
+                bars[symbol] = df
+                # 每完成一批立即落盘，便于断点续传
+                if cache_dir:
+                    _save_cached(cache_dir, symbol, period, interval, df)
+
+    failed = [symbol for symbol in symbols if symbol not in bars]
+    if failed:
+        print(f"{len(failed)} 只股票下载失败: {', '.join(failed[:20])}")
+    return bars, failed
+
+
+def to_price_matrix(bars, field="Close"):
+    """把 {symbol: DataFrame} 对齐成 (时间 × 股票) 的价格矩阵"""
+    columns = {symbol: df[field] for symbol, df in bars.items() if field in df}
+    if not columns:
+        return pd.DataFrame()
+    matrix = pd.concat(columns, axis=1).sort_index()
+    return matrix[[symbol for symbol in bars if symbol in matrix.columns]]
+
+
+def fetch_price_matrix(symbols, period="6mo", interval="1d", field="Close", **kwargs):
+    """下载并返回 (价格矩阵, 失败股票列表)"""
+    bars, failed = fetch_bars(symbols, period=period, interval=interval, **kwargs)
+    return to_price_matrix(bars, field), failed
@@ -0,0 +1,105 @@
+"""
+周期时间预算
+
+每个决策周期有 CYCLE_BUDGET 秒的时间预算，周期内的各个阶段（市场状况、账户总值、取价、持仓、指标）
+在线程中执行并有各自的超时（STAGE_TIMEOUTS），超时或出错时使用该阶段的备用值：
+- 市场状况：沿用上个周期的市场状态（即缓存的情绪数据），没有时按中性处理
+- 账户总值：沿用上次的值
+- 价格和持仓：沿用最近一次的价格和持仓，该股票本周期只检查卖出
+- 指标：沿用缓存的均线信号，跳过 ATR 止损
+
+剩余时间少于 CYCLE_EXIT_RESERVE 秒后不再处理开仓和加仓，只处理有持仓的股票，为卖出检查预留时间。
+连续失败的股票由 CircuitBreaker 熔断一段时间，不再为它花费周期时间（有持仓时仍检查卖出）。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+import clock
+from metrics import metrics
+from config import *
+
+_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
+
+class StageTimeout(TimeoutError):
+    """某个阶段超过了它的超时时间"""
+
+
+def run_stage(name, func, *args, fallback=None):
+    """
+    在线程中执行一个阶段，最多等待 STAGE_TIMEOUTS[name] 秒
+
+    超时或出错时调用 fallback() 作为结果，没有 fallback 时抛出异常。超时的调用不会被中断，返回后结果被丢弃。
+    """
+    timeout = STAGE_TIMEOUTS.get(name)
+    future = _executor.submit(func, *args)
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        error = e
+    if not future.done():
+        metrics.count(f"stage_timeout.{name}")
+        error = StageTimeout(f"{name} 超过 {timeout} 秒未返回")
+    if fallback is None:
+        raise error
+    print(f"{name} 阶段失败（{error}），使用备用值")
+    return fallback()
+
+
+class CycleBudget:
+    """一个决策周期的时间预算"""
+
+    def __init__(self, budget=CYCLE_BUDGET, exit_reserve=CYCLE_EXIT_RESERVE):
+        self.budget = budget
+        self.exit_reserve = exit_reserve
+        self.started = time.perf_counter()
+
+    def remaining(self):
+        return self.budget - (time.perf_counter() - self.started)
+
+    def entries_allowed(self):
+        """剩余时间是否足够处理开仓和加仓"""
+        return self.remaining() > self.exit_reserve
+
+
+class CircuitBreaker:
+    """
+    单只股票的熔断器
+
+    连续 failures 个周期失败后熔断 cooldown 秒；熔断结束后先试一次，再失败立即重新熔断，成功一次则恢复。
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.counts = {}      # symbol -> 连续失败次数
+        self.open_until = {}  # symbol -> 熔断结束的时间戳
+        self.failed = set()   # 本周期失败过（包括使用了备用行情）的股票
+
+    def begin_cycle(self):
+        self.failed = set()
+
+    def allow(self, symbol):
+        """是否不在熔断中"""
+        return clock.time() >= self.open_until.get(symbol, 0)
+
+    def healthy(self, symbol):
+        """不在熔断中，且本周期没有失败过"""
+        return symbol not in self.failed and self.allow(symbol)
+
+    def success(self, symbol):
+        if symbol in self.failed:
+            return
+        self.counts.pop(symbol, None)
+        self.open_until.pop(symbol, None)
+
+    def failure(self, symbol):
+        """记录一次失败，返回是否因此熔断"""
+        if symbol in self.failed:
+            return False
+        self.failed.add(symbol)
+        self.counts[symbol] = self.counts.get(symbol, 0) + 1
+        if self.counts[symbol] < self.failures:
+            return False
+        metrics.count("circuit_breaker_open")
+        self.open_until[symbol] = clock.time() + self.cooldown
+        return True
@@ -0,0 +1,210 @@
+"""
+分批执行
+
+金额较大的买单一次下市价单会推高价格，成交量较小的杠杆 ETF（如 MSTU）尤其明显。
+买入金额不低于 EXECUTION_MIN_VALUE 时，把母单拆成若干子单在 EXECUTION_HORIZON 秒内分批买入：
+- 每隔 EXECUTION_SLICE_INTERVAL 秒一个时间片，VWAP 按日内成交量分布分配各时间片的股数，TWAP 均匀分配；
+  成交量分布取K线引擎中已完成的 15 分钟K线（没有成交量数据时退回 TWAP）
+- 子单为限价单，限价为下单时价格上浮 EXECUTION_LIMIT_OFFSET；挂出 EXECUTION_CHILD_TIMEOUT 秒未成交就撤销，
+  未成交的股数并入之后的时间片（按累计目标计算，落后时下一个子单补上，提前成交时跳过）
+- 价格比母单下单时上涨超过 EXECUTION_MAX_CHASE 时暂停下子单，等价格回落，不追高
+- 到期（不晚于收盘）未成交的部分放弃，不再下单
+
+母单由主循环在两个周期之间推进（见 main.poll_until），决策周期不等待母单完成；
+子单的成交由 strategy.work_orders 记入风险管理器和成交记录。执行中的股票不再开仓和加仓，
+触发卖出时先撤销母单。
+"""
+import math
+import uuid
+import datetime
+import numpy as np
+import pytz
+import clock
+from broker import get_price, submit_limit_buy, cancel_order, get_order
+from protective_orders import ORDER_PREFIX
+from metrics import metrics
+from config import *
+
+EASTERN = pytz.timezone('US/Eastern')
+SESSION_MINUTES = 390
+PROFILE_BUCKET = 15  # 成交量分布的分桶（分钟），与 15 分钟K线一致
+DONE_STATUSES = ("filled", "canceled", "expired", "rejected")
+
+
+def session_bounds(now):
+    """当天常规交易时段的开盘和收盘时刻"""
+    opening = EASTERN.localize(datetime.datetime.combine(now.date(), datetime.time(9, 30)))
+    return opening, opening + datetime.timedelta(minutes=SESSION_MINUTES)
+
+
+def volume_profile(bars):
+    """按开盘后的分钟数分桶的成交量占比，bars 为K线引擎中的日内K线；没有成交量数据时返回 None"""
+    volumes = np.zeros(SESSION_MINUTES // PROFILE_BUCKET)
+    for bar in bars:
+        start = bar["start"].astimezone(EASTERN)
+        minute = (start.hour - 9) * 60 + start.minute - 30
+        if 0 <= minute < SESSION_MINUTES:
+            volumes[minute // PROFILE_BUCKET] += bar["volume"]
+    total = volumes.sum()
+    return volumes / total if total > 0 else None
+
+
+def slice_targets(times, profile=None):
+    """各时间片结束时应达到的累计成交比例；profile 为 None 时均匀分配（TWAP）"""
+    if profile is None:
+        weights = np.ones(len(times))
+    else:
+        weights = np.empty(len(times))
+        for i, when in enumerate(times):
+            opening, _ = session_bounds(when)
+            minute = int((when - opening).total_seconds() // 60)
+            weights[i] = profile[min(max(minute, 0), SESSION_MINUTES - 1) // PROFILE_BUCKET]
+        if weights.sum() <= 0:
+            weights = np.ones(len(times))
+    return np.cumsum(weights) / weights.sum()
+
+
+class ExecutionScheduler:
+    """拆分和推进分批执行的母单，每只股票同时只有一个母单"""
+
+    def __init__(self, algo=EXECUTION_ALGO, horizon=EXECUTION_HORIZON, interval=EXECUTION_SLICE_INTERVAL,
+                 min_value=EXECUTION_MIN_VALUE):
+        self.algo = algo
+        self.horizon = horizon
+        self.interval = interval
+        self.min_value = min_value
+        self.parents = {}  # symbol -> 母单
+
+    def wants(self, symbol, qty, price):
+        """这笔买单是否需要分批执行"""
+        return qty * price >= self.min_value and symbol not in self.parents
+
+    def active(self, symbol):
+        return symbol in self.parents
+
+    def submit(self, symbol, qty, price, reason, bars=None):
+        """
+        登记一个母单并安排各时间片，bars 为计算成交量分布的日内K线
+
+        执行时间不超过收盘前一个时间片，离收盘太近时时间片相应减少。
+        """
+        now = clock.now(EASTERN)
+        _, closing = session_bounds(now)
+        horizon = min(self.horizon, (closing - now).total_seconds() - self.interval)
+        slices = max(1, int(horizon // self.interval))
+        times = [now + datetime.timedelta(seconds=i * self.interval) for i in range(slices)]
+        profile = volume_profile(bars or []) if self.algo == "vwap" else None
+        parent = {
+            "symbol": symbol,
+            "qty": qty,
+            "price": price,
+            "reason": reason,
+            "algo": "vwap" if profile is not None else "twap",
+            "times": [when.timestamp() for when in times],
+            "targets": slice_targets(times, profile),
+            "end": times[-1].timestamp() + self.interval,
+            "filled": 0,
+            "cost": 0.0,
+            "child": None,
+            "next": times[0].timestamp(),  # 下一次推进的时间，第一个子单在下一次推进时立即发出
+        }
+        self.parents[symbol] = parent
+        metrics.count("execution.parents")
+        print(f"{symbol} 分批买入 {qty} 股（{parent['algo'].upper()}，{slices} 个时间片）")
+        return parent
+
+    def _slice(self, parent, now):
+        """当前所在的时间片序号"""
+        return max(0, np.searchsorted(parent["times"], now, side="right") - 1)
+
+    def next_wakeup(self):
+        """下一次需要推进母单的时间戳：下一个时间片开始，或挂着的子单到期撤销；没有母单时返回 None"""
+        wakeups = []
+        for parent in self.parents.values():
+            wakeup = parent["next"]
+            if parent["child"] is not None:
+                wakeup = min(wakeup, parent["child"]["time"] + EXECUTION_CHILD_TIMEOUT)
+            wakeups.append(wakeup)
+        return min(wakeups) if wakeups else None
+
+    def _check_child(self, parent, cancel=False):
+        """查询子单成交，返回新成交的 (股数, 价格)；子单结束或被撤销后清除"""
+        child = parent["child"]
+        if cancel:
+            cancel_order(child["id"])
+        status = get_order(child["id"])
+        fill = None
+        delta = status["filled_qty"] - child["filled"]
+        if delta > 0:
+            price = status["filled_avg_price"]
+            # filled_avg_price 为子单全部已成交部分的均价，扣除之前记过的部分得到本次成交的价格
+            price = (price * status["filled_qty"] - child["cost"]) / delta
+            child["filled"] += delta
+            child["cost"] += price * delta
+            parent["filled"] += delta
+            parent["cost"] += price * delta
+            fill = (delta, price)
+        if cancel or status["status"] in DONE_STATUSES:
+            parent["child"] = None
+        return fill
+
+    def step(self):
+        """
+        推进所有母单，返回 (新成交列表, 已结束的母单列表)
+
+        新成交每一项为 (symbol, 股数, 价格, 触发规则)。
+        """
+        now = clock.time()
+        fills, finished = [], []
+        for symbol, parent in list(self.parents.items()):
+            try:
+                fill = self._advance(parent, now)
+            except Exception as e:
+                print(f"{symbol} 分批执行出错: {e}")
+                continue
+            if fill:
+                fills.append((symbol, fill[0], fill[1], parent["reason"]))
+            if parent["filled"] >= parent["qty"] or (now >= parent["end"] and parent["child"] is None):
+                finished.append(self.parents.pop(symbol))
+            else:
+                parent["next"] = next((when for when in parent["times"] if when > now), parent["end"])
+        return fills, finished
+
+    def _advance(self, parent, now):
+        child = parent["child"]
+        fill = None
+        if child is not None:
+            expired = now >= child["time"] + EXECUTION_CHILD_TIMEOUT or now >= parent["end"]
+            fill = self._check_child(parent)
+            if parent["child"] is not None:
+                if not expired:
+                    return fill
+                late = self._check_child(parent, cancel=True)
+                if late:
+                    fill = (fill[0] + late[0], (fill[0] * fill[1] + late[0] * late[1]) / (fill[0] + late[0])) \
+                        if fill else late
+
+        if now >= parent["end"] or parent["filled"] >= parent["qty"]:
+            return fill
+        target = math.ceil(parent["targets"][self._slice(parent, now)] * parent["qty"])
+        need = min(target, parent["qty"]) - parent["filled"]
+        if need <= 0:
+            return fill
+
+        price = get_price(parent["symbol"])
+        if price > parent["price"] * (1 + EXECUTION_MAX_CHASE):
+            print(f"{parent['symbol']} 价格 {price:.2f} 比下单时上涨超过 {EXECUTION_MAX_CHASE:.0%}，暂停分批买入")
+            return fill
+        order_id = submit_limit_buy(parent["symbol"], need, price * (1 + EXECUTION_LIMIT_OFFSET),
+                                    client_order_id=f"{ORDER_PREFIX}-exec-{parent['symbol']}-{uuid.uuid4().hex[:12]}")
+        parent["child"] = {"id": order_id, "qty": need, "time": now, "filled": 0, "cost": 0.0}
+        metrics.count("execution.children")
+        return fill
+
+    def cancel(self, symbol):
+        """撤销一只股票的母单（触发卖出时），返回撤销前新成交的 (股数, 价格, 触发规则)，没有时返回 None"""
+        parent = self.parents.pop(symbol, None)
+        if parent is None or parent["child"] is None:
+            return None
+        fill = self._check_child(parent, cancel=True)
+        return (fill[0], fill[1], parent["reason"]) if fill else None
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+from indicators import atr
+from config import *
+
+
+class IndicatorCache:
+    """
+    衍生指标缓存
+
+    键为 (股票, 指标名, 参数, 最后一根K线)。同一根K线内重复读取只需一次字典查找；
+    同一指标出现新K线，或正在形成的K线价格变化时，旧的结果立即失效。超过容量时按最近最少使用淘汰。
+    """
+
+    def __init__(self, max_entries=INDICATOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.latest = {}  # (股票, 指标名, 参数) -> 最新的完整键
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, symbol, name, params, last_bar, compute):
+        series_key = (symbol, name, params)
+        key = series_key + (last_bar,)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = compute()
+
+        with self.lock:
+            # 有新K线时，删除同一指标旧K线的结果
+            previous = self.latest.get(series_key)
+            if previous is not None and previous != key:
+                self.entries.pop(previous, None)
+            self.latest[series_key] = key
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)
+                if self.latest.get(old_key[:3]) == old_key:
+                    del self.latest[old_key[:3]]
+        return value
+
+    def invalidate(self, symbol):
+        """删除某只股票的全部缓存（例如收到新K线时）"""
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == symbol]:
+                del self.entries[key]
+            for series_key in [k for k in self.latest if k[0] == symbol]:
+                del self.latest[series_key]
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# 策略和图表共用的缓存实例
+indicator_cache = IndicatorCache()
+
+
+def _bar_range(data):
+    """
+    数据区间作为键的一部分：起始时间区分不同长度的历史，最后一根K线的时间和内容区分新K线
+
+    当天正在形成的日线时间不变但收盘价一直在变，只用时间作键会一直返回第一次计算的结果，
+    所以最后一根K线的内容（哈希值）也计入键。
+    """
+    if len(data) == 0:
+        return None, None
+    # 按字节取哈希，缺失值（NaN）也能得到相同的键
+    last_row = hash(data.iloc[-1].to_numpy(dtype=float).tobytes())
+    return data.index[0].isoformat(), (data.index[-1].isoformat(), last_row)
+
+
+def moving_average(symbol, data, window):
+    """收盘价简单移动平均"""
+    start, last_bar = _bar_range(data)
+    return indicator_cache.get_or_compute(
+        symbol, "sma", (window, start), last_bar,
+        lambda: data['Close'].rolling(window=window).mean())
+
+
+def ma_crossover_signals(symbol, data, short_period=9, long_period=20):
+    """
+    均线交叉序列
+
+    返回包含 MA{short}、MA{long} 和 Signal 列的 DataFrame，Signal 为 1（金叉）、-1（死叉）或 0。
+    """
+    def compute():
+        short_ma = moving_average(symbol, data, short_period)
+        long_ma = moving_average(symbol, data, long_period)
+        prev_short = short_ma.shift(1)
+        prev_long = long_ma.shift(1)
+        signal = pd.Series(0, index=data.index)
+        signal[(short_ma > long_ma) & (prev_short <= prev_long)] = 1
+        signal[(short_ma < long_ma) & (prev_short >= prev_long)] = -1
+        return pd.DataFrame({f'MA{short_period}': short_ma, f'MA{long_period}': long_ma, 'Signal': signal})
+
+    start, last_bar = _bar_range(data)
+    return indicator_cache.get_or_compute(symbol, "ma_crossover", (short_period, long_period, start), last_bar, compute)
+
+
+def volatility(symbol, data, window=20):
+    """收盘价日收益率的滚动标准差"""
+    start, last_bar = _bar_range(data)
+    return indicator_cache.get_or_compute(
+        symbol, "volatility", (window, start), last_bar,
+        lambda: data['Close'].pct_change().rolling(window=window).std())
+
+
+def average_true_range(symbol, data, period=14):
+    """平均真实波幅（Wilder 平滑）"""
+    def compute():
+        values = atr(data['High'].to_numpy(dtype=float), data['Low'].to_numpy(dtype=float),
+                     data['Close'].to_numpy(dtype=float), period)
+        return pd.Series(values, index=data.index)
+
+    start, last_bar = _bar_range(data)
+    return indicator_cache.get_or_compute(symbol, "atr", (period, start), last_bar, compute)
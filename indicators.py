@@ -0,0 +1,226 @@
+"""
+批量技术指标
+
+所有指标都在 (股票 × 时间) 的二维 float 数组上一次算完整个股票池，也接受一维数组（单只股票）。
+时间轴为最后一维，从旧到新；指标尚未形成的位置为 NaN，历史较短的股票可以在前面用 NaN 补齐。
+
+每个函数都支持 out 参数传入预先分配好的输出数组，循环调用时可以复用同一块内存；
+实时更新时用 roll_append 把最新一列写入固定大小的缓冲区，用 ema_update 原地推进 EMA 状态。
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _as_2d(values):
+    """转换为二维 float 数组，返回 (数组, 输入是否为一维)"""
+    x = np.asarray(values, dtype=float)
+    if x.ndim == 1:
+        return x.reshape(1, -1), True
+    return x, False
+
+
+def _output(out, shape, squeeze, dtype=float):
+    """返回 (二维视图, 返回给调用方的数组)；out 为 None 时新分配"""
+    if out is None:
+        out = np.empty(shape[1] if squeeze else shape, dtype=dtype)
+    elif out.shape != (shape[1:] if squeeze else shape):
+        raise ValueError(f"输出数组形状应为 {shape[1:] if squeeze else shape}，实际为 {out.shape}")
+    return out.reshape(shape), out
+
+
+def _window_sums(x, window):
+    """用累加和计算每个窗口的合计和有效值个数，结果从第 window 个位置开始"""
+    valid = ~np.isnan(x)
+    total = np.zeros((x.shape[0], x.shape[1] + 1))
+    count = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(np.where(valid, x, 0.0), axis=1, out=total[:, 1:])
+    np.cumsum(valid, axis=1, out=count[:, 1:])
+    return total[:, window:] - total[:, :-window], count[:, window:] - count[:, :-window]
+
+
+def _rolling_std(x, window):
+    """滚动总体标准差，窗口内有 NaN 时结果为 NaN"""
+    return sliding_window_view(x, window, axis=1).std(axis=2)
+
+
+def sma(values, window, out=None):
+    """简单移动平均"""
+    x, squeeze = _as_2d(values)
+    out2d, result = _output(out, x.shape, squeeze)
+    out2d[:] = np.nan
+    if window <= x.shape[1]:
+        total, count = _window_sums(x, window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out2d[:, window - 1:] = np.where(count == window, total / window, np.nan)
+    return result
+
+
+def ema_update(state, latest, span=None, alpha=None):
+    """
+    原地把 EMA 状态推进一步
+
+    state: 每只股票当前的 EMA（尚无数据时为 NaN），会被直接修改
+    latest: 每只股票最新的值，NaN 表示本期没有数据，状态保持不变
+    """
+    alpha = alpha if alpha is not None else 2.0 / (span + 1)
+    latest = np.asarray(latest, dtype=float)
+    has_value = ~np.isnan(latest)
+    fresh = has_value & np.isnan(state)
+    update = has_value & ~fresh
+    state[fresh] = latest[fresh]
+    state[update] += alpha * (latest[update] - state[update])
+    return state
+
+
+def _ewm(x, alpha, min_periods, out2d, sma_seed=False):
+    """
+    逐列递推的指数加权平均，前 min_periods 个有效值之前为 NaN
+
+    sma_seed 为 True 时用前 min_periods 个有效值的简单平均作为初值（Wilder 平滑的标准做法），
+    否则以第一个有效值为初值。
+    """
+    state = np.full(x.shape[0], np.nan)
+    if sma_seed and min_periods > 1:
+        total = np.zeros(x.shape[0])
+        seen = np.zeros(x.shape[0], dtype=int)
+        for t in range(x.shape[1]):
+            column = x[:, t]
+            warming = ~np.isnan(column) & (seen < min_periods)
+            total[warming] += column[warming]
+            seen[warming] += 1
+            # 初值形成之前不参与递推
+            ema_update(state, np.where(warming, np.nan, column), alpha=alpha)
+            ready = warming & (seen == min_periods)
+            state[ready] = total[ready] / min_periods
+            out2d[:, t] = state
+        return out2d
+
+    for t in range(x.shape[1]):
+        out2d[:, t] = ema_update(state, x[:, t], alpha=alpha)
+    if min_periods > 1:
+        seen = np.cumsum(~np.isnan(x), axis=1)
+        out2d[seen < min_periods] = np.nan
+    return out2d
+
+
+def ema(values, span, out=None):
+    """指数移动平均（与 pandas ewm(span=span, adjust=False) 一致）"""
+    x, squeeze = _as_2d(values)
+    out2d, result = _output(out, x.shape, squeeze)
+    _ewm(x, 2.0 / (span + 1), 1, out2d)
+    return result
+
+
+def rsi(values, period=14, out=None):
+    """相对强弱指数（Wilder 平滑），取值 0~100"""
+    x, squeeze = _as_2d(values)
+    out2d, result = _output(out, x.shape, squeeze)
+    change = np.full(x.shape, np.nan)
+    change[:, 1:] = np.diff(x, axis=1)
+
+    avg_gain = _ewm(np.clip(change, 0, None), 1.0 / period, period, np.empty(x.shape), sma_seed=True)
+    avg_loss = _ewm(np.clip(-change, 0, None), 1.0 / period, period, np.empty(x.shape), sma_seed=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out2d[:] = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    out2d[np.isnan(avg_gain)] = np.nan
+    return result
+
+
+def macd(values, fast=12, slow=26, signal=9, out=None):
+    """
+    MACD
+
+    返回 (macd线, 信号线, 柱状图)；out 可以传入三个输出数组组成的元组
+    """
+    x, squeeze = _as_2d(values)
+    outs = out or (None, None, None)
+    macd_2d, macd_result = _output(outs[0], x.shape, squeeze)
+    signal_2d, signal_result = _output(outs[1], x.shape, squeeze)
+    hist_2d, hist_result = _output(outs[2], x.shape, squeeze)
+
+    _ewm(x, 2.0 / (fast + 1), 1, macd_2d)
+    macd_2d -= _ewm(x, 2.0 / (slow + 1), 1, np.empty(x.shape))
+    _ewm(macd_2d, 2.0 / (signal + 1), 1, signal_2d)
+    np.subtract(macd_2d, signal_2d, out=hist_2d)
+    return macd_result, signal_result, hist_result
+
+
+def bollinger(values, window=20, num_std=2.0, out=None):
+    """
+    布林带（总体标准差）
+
+    返回 (中轨, 上轨, 下轨)；out 可以传入三个输出数组组成的元组
+    """
+    x, squeeze = _as_2d(values)
+    outs = out or (None, None, None)
+    middle_2d, middle_result = _output(outs[0], x.shape, squeeze)
+    upper_2d, upper_result = _output(outs[1], x.shape, squeeze)
+    lower_2d, lower_result = _output(outs[2], x.shape, squeeze)
+
+    sma(x, window, out=middle_2d)
+    width = np.full(x.shape, np.nan)
+    if window <= x.shape[1]:
+        width[:, window - 1:] = num_std * _rolling_std(x, window)
+    np.add(middle_2d, width, out=upper_2d)
+    np.subtract(middle_2d, width, out=lower_2d)
+    return middle_result, upper_result, lower_result
+
+
+def atr(high, low, close, period=14, out=None):
+    """平均真实波幅（Wilder 平滑）"""
+    h, squeeze = _as_2d(high)
+    l, _ = _as_2d(low)
+    c, _ = _as_2d(close)
+    out2d, result = _output(out, c.shape, squeeze)
+
+    prev_close = np.full(c.shape, np.nan)
+    prev_close[:, 1:] = c[:, :-1]
+    # fmax 忽略 NaN，第一根K线的真实波幅即为最高价减最低价
+    true_range = np.fmax(h - l, np.fmax(np.abs(h - prev_close), np.abs(l - prev_close)))
+    _ewm(true_range, 1.0 / period, period, out2d, sma_seed=True)
+    return result
+
+
+def rolling_zscore(values, window=20, out=None):
+    """滚动 z-score：当前值相对窗口均值偏离了几个标准差"""
+    x, squeeze = _as_2d(values)
+    out2d, result = _output(out, x.shape, squeeze)
+    out2d[:] = np.nan
+    if window <= x.shape[1]:
+        windows = sliding_window_view(x, window, axis=1)
+        std = windows.std(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out2d[:, window - 1:] = np.where(std > 0, (x[:, window - 1:] - windows.mean(axis=2)) / std, np.nan)
+    return result
+
+
+def rolling_max_drawdown(values, window=20, out=None):
+    """滚动最大回撤：窗口内从最高点到之后最低点的最大跌幅（正数，0.1 表示 10%）"""
+    x, squeeze = _as_2d(values)
+    out2d, result = _output(out, x.shape, squeeze)
+    out2d[:] = np.nan
+    if window <= x.shape[1]:
+        windows = sliding_window_view(x, window, axis=1)
+        peaks = np.maximum.accumulate(windows, axis=2)
+        out2d[:, window - 1:] = (1.0 - windows / peaks).max(axis=2)
+    return result
+
+
+def crossover(fast, slow, out=None):
+    """快线上穿慢线为 1，下穿为 -1，其余为 0"""
+    f, squeeze = _as_2d(fast)
+    s, _ = _as_2d(slow)
+    out2d, result = _output(out, f.shape, squeeze, dtype=np.int8)
+    out2d[:] = 0
+    above, prev_above = f[:, 1:] > s[:, 1:], f[:, :-1] <= s[:, :-1]
+    below, prev_below = f[:, 1:] < s[:, 1:], f[:, :-1] >= s[:, :-1]
+    out2d[:, 1:][above & prev_above] = 1
+    out2d[:, 1:][below & prev_below] = -1
+    return result
+
+
+def roll_append(buffer, column):
+    """固定大小的 (股票 × 时间) 缓冲区整体左移一列，并在最后一列写入最新值"""
+    buffer[..., :-1] = buffer[..., 1:]
+    buffer[..., -1] = column
+    return buffer
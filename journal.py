@@ -0,0 +1,320 @@
+"""
+行情事件日志
+
+每条报价、K线、情绪读数、信号和下单意图写成一条 64 字节的定长记录，追加到按交易日轮换的
+内存映射文件（journal/YYYYMMDD.bin）中。写入只是一次 struct.pack_into，不产生系统调用。
+
+回放时读取某一天的日志，按周期把报价和信号送回 run_strategy（券商替换为 PaperBroker），
+比较回放产生的订单与当时记录的下单意图：
+
+    python journal.py 20240603
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+import datetime
+import clock
+import threading
+import numpy as np
+import pytz
+from config import *
+
+EASTERN = pytz.timezone('US/Eastern')
+
+MAGIC = b"QLTJRNL1"
+HEADER = struct.Struct("<8sQ48x")           # 文件标识、记录数，补齐到 64 字节
+RECORD = struct.Struct("<dB3x12sddddq")     # 时间、类型、股票、4个数值、1个整数，共 64 字节
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("kind", "u1"), ("pad", "V3"), ("symbol", "S12"),
+                         ("a", "<f8"), ("b", "<f8"), ("c", "<f8"), ("d", "<f8"), ("n", "<i8")])
+
+# 记录类型及各字段含义
+CYCLE = 1      # 周期开始：a=账户总值
+REGIME = 2     # 市场状态：a=恐慌贪婪指数 b=情绪仓位系数 c=市场仓位系数 d=情绪信号编号 n=市场状况编号
+QUOTE = 3      # 报价：a=价格
+POSITION = 4   # 持仓：a=成本价 n=股数
+SIGNAL = 5     # 均线交叉信号：n=信号
+ATR = 6        # ATR：a=数值
+BAR = 7        # K线收盘：a~d=开高低收 n=周期分钟数
+ORDER = 8      # 下单意图：a=价格 n=股数（买入为正，卖出为负）
+TARGET = 9     # 本周期交易标的：a=资金权重
+POLL = 10      # 两个周期之间的单独检查开始（poll_scheduler.py）：a=账户总值
+WATCH = 11     # 本次单独检查的股票
+
+MARKET_STATUS_CODES = {"弱势": -1, "中性": 0, "强势": 1}
+FG_SIGNALS = ["NEUTRAL", "STRONG_BUY", "BUY", "SELL", "STRONG_SELL"]
+
+
+def _nan(value):
+    return float("nan") if value is None else float(value)
+
+
+def _trading_day(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, EASTERN).date()
+
+
+class Journal:
+    """追加写入的内存映射日志，按美东交易日轮换文件"""
+
+    def __init__(self, directory=JOURNAL_DIR, initial_records=JOURNAL_INITIAL_RECORDS, enabled=JOURNAL_ENABLED):
+        self.directory = directory
+        self.initial_records = initial_records
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.file = None
+        self.mm = None
+        self.count = 0
+        self.capacity = 0
+        self.day_end = 0.0  # 当前文件对应交易日结束的时间戳
+
+    def path_for(self, day):
+        return os.path.join(self.directory, f"{day.strftime('%Y%m%d')}.bin")
+
+    def _open(self, timestamp):
+        self.close()
+        day = _trading_day(timestamp)
+        self.day_end = EASTERN.localize(datetime.datetime.combine(day + datetime.timedelta(days=1),
+                                                                  datetime.time())).timestamp()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(day)
+
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            size = HEADER.size + self.initial_records * RECORD.size
+            self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        magic, count = HEADER.unpack_from(self.mm, 0)
+        self.count = count if magic == MAGIC else 0
+        self.capacity = (size - HEADER.size) // RECORD.size
+        HEADER.pack_into(self.mm, 0, MAGIC, self.count)
+
+    def _grow(self):
+        size = HEADER.size + self.capacity * 2 * RECORD.size
+        self.mm.flush()
+        self.mm.close()
+        self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.capacity *= 2
+
+    def write(self, kind, symbol="", a=0.0, b=0.0, c=0.0, d=0.0, n=0, timestamp=None):
+        if not self.enabled:
+            return
+        timestamp = timestamp or clock.time()
+        try:
+            with self.lock:
+                if self.mm is None or timestamp >= self.day_end:
+                    self._open(timestamp)
+                if self.count >= self.capacity:
+                    self._grow()
+                RECORD.pack_into(self.mm, HEADER.size + self.count * RECORD.size, timestamp, kind,
+                                 symbol.encode("ascii", "replace")[:12], a, b, c, d, int(n))
+                self.count += 1
+                HEADER.pack_into(self.mm, 0, MAGIC, self.count)
+        except Exception as e:
+            # 日志出错不能影响交易
+            print(f"写入事件日志出错: {e}")
+
+    def cycle(self, equity, targets, target_weights):
+        self.write(CYCLE, a=equity)
+        for symbol in targets:
+            self.write(TARGET, symbol, a=target_weights.get(symbol, 1.0 / len(targets)))
+
+    def poll(self, equity, symbols):
+        self.write(POLL, a=_nan(equity))
+        for symbol in symbols:
+            self.write(WATCH, symbol)
+
+    def regime(self, context):
+        self.write(REGIME, a=_nan(context.fg_value), b=context.fg_multiplier, c=context.market_multiplier,
+                   d=FG_SIGNALS.index(context.fg_signal), n=MARKET_STATUS_CODES.get(context.market_status, 0))
+
+    def quote(self, symbol, price, entry, qty):
+        self.write(QUOTE, symbol, a=price)
+        self.write(POSITION, symbol, a=_nan(entry), n=qty)
+
+    def signal(self, symbol, ma_signal):
+        self.write(SIGNAL, symbol, n=ma_signal)
+
+    def atr(self, symbol, value):
+        self.write(ATR, symbol, a=value)
+
+    def bar(self, symbol, timeframe, bar):
+        from bar_engine import TIMEFRAME_MINUTES
+
+        self.write(BAR, symbol, a=bar["open"], b=bar["high"], c=bar["low"], d=bar["close"],
+                   n=TIMEFRAME_MINUTES[timeframe], timestamp=bar["start"].timestamp())
+
+    def order(self, symbol, price, qty):
+        self.write(ORDER, symbol, a=price, n=qty)
+
+    def flush(self):
+        with self.lock:
+            if self.mm is not None:
+                self.mm.flush()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.file.close()
+            self.mm = None
+            self.file = None
+
+
+# 交易进程内共用的日志
+journal = Journal()
+
+
+def read_journal(path):
+    """读取日志文件为 numpy 结构化数组（只读取已写入的记录）"""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        magic, count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"不是事件日志文件: {path}")
+        return np.frombuffer(f.read(count * RECORD.size), dtype=RECORD_DTYPE)
+
+
+def split_cycles(records):
+    """按 CYCLE 和 POLL 记录把日志切分为各个周期和周期之间的单独检查"""
+    starts = np.flatnonzero(np.isin(records["kind"], [CYCLE, POLL]))
+    bounds = list(starts) + [len(records)]
+    return [records[bounds[i]:bounds[i + 1]] for i in range(len(starts))]
+
+
+def _cycle_context(record, when):
+    from cycle_context import CycleContext
+    from market_sentiment import FearGreedIndex
+
+    fg_value = None if np.isnan(record["a"]) else float(record["a"])
+    status = {code: name for name, code in MARKET_STATUS_CODES.items()}[int(record["n"])]
+    return CycleContext(
+        time=when.isoformat(timespec="seconds"),
+        market_status=status,
+        fg_value=fg_value,
+        fg_rating=FearGreedIndex().get_rating_from_score(fg_value) if fg_value is not None else None,
+        fg_signal=FG_SIGNALS[int(record["d"])],
+        fg_multiplier=float(record["b"]),
+        market_multiplier=float(record["c"]),
+    )
+
+
+def replay(path):
+    """
+    把一天的日志按周期送回 run_strategy，周期之间的单独检查送回 poll_symbols
+
+    每个周期使用当时记录的报价、均线信号、ATR 和市场状态，券商替换为 PaperBroker，
+    初始现金和持仓由第一个周期的账户总值和持仓记录还原。
+    返回 (回放产生的订单, 当时记录的下单意图)，订单格式均为 (股票, 股数)，卖出为负数。
+    """
+    import strategy
+    import risk_manager as risk_manager_module
+    import protective_orders as protective_orders_module
+    from paper_broker import PaperBroker
+
+    cycles = split_cycles(read_journal(path))
+    if not cycles:
+        return [], []
+
+    def by_kind(records, kind):
+        return records[records["kind"] == kind]
+
+    # 用第一个周期还原账户
+    first = cycles[0]
+    quotes = {s.decode(): float(a) for s, a in zip(by_kind(first, QUOTE)["symbol"], by_kind(first, QUOTE)["a"])}
+    positions = {s.decode(): (float(a), int(n)) for s, a, n in
+                 zip(by_kind(first, POSITION)["symbol"], by_kind(first, POSITION)["a"], by_kind(first, POSITION)["n"])
+                 if n > 0}
+    cash = float(first[0]["a"]) - sum(quotes[s] * qty for s, (_, qty) in positions.items())
+
+    broker = PaperBroker(quotes, cash=cash)
+    broker.positions = {s: [entry, qty] for s, (entry, qty) in positions.items()}
+
+    saved = {name: getattr(strategy, name) for name in
+             ["get_ma_signal", "calculate_atr", "notify", "TARGETS", "TARGET_WEIGHTS", "protective_orders",
+              "executor"]}
+    saved_market_hours = strategy.risk_manager.check_market_hours
+    saved_enabled = journal.enabled, strategy.trade_store.enabled
+    saved_states = {s: dict(state) for s, state in strategy.states.items()}
+    saved_position_data = strategy.risk_manager.position_data
+    saved_ticks = dict(strategy.last_ticks)
+
+    signals, atrs = {}, {}
+    strategy.get_ma_signal = lambda symbol: signals.get(symbol, 0)
+    strategy.calculate_atr = lambda symbol, period=14: atrs.get(symbol, broker.get_price(symbol) * 0.02)
+    strategy.notify = lambda content: None
+    strategy.risk_manager.check_market_hours = lambda: True
+    journal.enabled = strategy.trade_store.enabled = False
+    broker.install(strategy, risk_manager_module, protective_orders_module)
+    # 券商端保护单由模拟券商按记录的价格撮合，成交不计入比较的下单意图
+    if strategy.protective_orders is not None:
+        strategy.protective_orders = protective_orders_module.ProtectiveOrders()
+    # 分批执行的买单记录的是母单的下单意图，回放时一次下单
+    strategy.executor = None
+
+    strategy.states.clear()
+    strategy.last_ticks.clear()
+    strategy.risk_manager.position_data = {}
+    for symbol, (entry, qty) in positions.items():
+        strategy.states[symbol] = dict(strategy.new_symbol_state(), layers=1, entry_price=entry)
+        strategy.risk_manager.position_data[symbol] = {'entry_price': entry, 'qty': qty, 'highest_price': entry,
+                                                       'cost_basis': entry * qty}
+
+    recorded = []
+    try:
+        for records in cycles:
+            when = datetime.datetime.fromtimestamp(float(records[0]["time"]), EASTERN)
+            cycle_quotes = by_kind(records, QUOTE)
+            symbols = [s.decode() for s in cycle_quotes["symbol"]]
+            broker.set_prices(dict(zip(symbols, cycle_quotes["a"].astype(float))))
+            signals.update({s.decode(): int(n) for s, n in zip(by_kind(records, SIGNAL)["symbol"],
+                                                                by_kind(records, SIGNAL)["n"])})
+            atrs.update({s.decode(): float(a) for s, a in zip(by_kind(records, ATR)["symbol"],
+                                                               by_kind(records, ATR)["a"])})
+            recorded.extend((s.decode(), int(n)) for s, n in zip(by_kind(records, ORDER)["symbol"],
+                                                                   by_kind(records, ORDER)["n"]))
+
+            regime = by_kind(records, REGIME)
+            context = _cycle_context(regime[0], when) if len(regime) else None
+            if records[0]["kind"] == POLL:
+                strategy.poll_symbols([s.decode() for s in by_kind(records, WATCH)["symbol"]], context)
+                continue
+            targets = by_kind(records, TARGET)
+            strategy.TARGETS = [s.decode() for s in targets["symbol"]]
+            strategy.TARGET_WEIGHTS = dict(zip(strategy.TARGETS, targets["a"].astype(float)))
+            strategy.run_strategy(context)
+    finally:
+        broker.uninstall()
+        for name, value in saved.items():
+            setattr(strategy, name, value)
+        strategy.risk_manager.check_market_hours = saved_market_hours
+        strategy.states.clear()
+        strategy.states.update(saved_states)
+        strategy.risk_manager.position_data = saved_position_data
+        strategy.last_ticks.clear()
+        strategy.last_ticks.update(saved_ticks)
+        journal.enabled, strategy.trade_store.enabled = saved_enabled
+
+    replayed = [(symbol, qty if action == "buy" else -qty) for action, symbol, qty, _ in broker.orders]
+    return replayed, recorded
+
+
+def main():
+    day = sys.argv[1] if len(sys.argv) > 1 else datetime.datetime.now(EASTERN).strftime("%Y%m%d")
+    path = os.path.join(JOURNAL_DIR, f"{day}.bin")
+    started = time.time()
+    replayed, recorded = replay(path)
+    print(f"回放 {path} 完成，耗时 {time.time() - started:.2f} 秒")
+    print(f"回放订单 {len(replayed)} 笔，记录的下单意图 {len(recorded)} 笔")
+    if replayed != recorded:
+        print("回放结果与记录不一致:")
+        print(f"  回放: {replayed}")
+        print(f"  记录: {recorded}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,281 @@
+import sys
+import math
 import time
-import datetime
+import clock
+import signal
+import threading
+import argparse
 import pytz
+import strategy
 from strategy import run_strategy
 from risk_manager import RiskManager
 from market_monitor import MarketMonitor
+from cycle_context import record_regime
+from deadline import CycleBudget
+from warmup import warmup_due, run_warmup, seconds_until_next_check
+from poll_scheduler import PollScheduler, broker_requests
+import shadow
 from notifier import notify
 from chart_generator import ChartGenerator
+from rotation import rotation_due, run_rotation
+from metrics import metrics, start_metrics_server
+from dashboard import dashboard, start_dashboard_server
+from bar_engine import start_trade_stream
+from state_store import load_snapshot, save_snapshot, capture_state, restore_state, RunLock
 from dotenv import load_dotenv
 from config import *
 import traceback
 import os
+import cassette
 
 load_dotenv()
+cassette.install()
 
 # 存储交易记录和资产历史
 transactions = []
 balance_history = []
 
 
-def update_transaction_history(action, symbol, qty, price, date=None):
+def update_transaction_history(action, symbol, qty, price, date=None, reason=None):
     if date is None:
-        date = datetime.datetime.now()
+        date = clock.now()
 
     transaction = {
         'date': date,
         'action': action,
         'symbol': symbol,
         'qty': qty,
-        'price': price
+        'price': price,
+        'reason': reason
     }
 
     transactions.append(transaction)
+    dashboard.add_trade(transaction)
 
 
 def update_balance_history(balance):
-    now = datetime.datetime.now()
+    now = clock.now()
     balance_history.append((now, balance))
+    dashboard.record_equity(balance, now)
+
+
+def rotate_targets(context):
+    """执行每周轮动：对候选池排名并切换交易标的"""
+    targets, target_weights = run_rotation(context.fg_value)
+    if not targets:
+        print("轮动排名失败，沿用当前标的")
+        return []
+
+    results = strategy.apply_rotation(targets, target_weights)
+    strategy.global_state["last_rotation"] = clock.now(pytz.timezone('US/Eastern')).date().isoformat()
+    weights_text = ', '.join(f"{symbol} {weight:.0%}" for symbol, weight in target_weights.items())
+    notify(f"每周轮动完成，新标的: {weights_text}")
+    return results
+
+
+def record_results(results):
+    """把策略返回的交易信息记入交易历史"""
+    for result in results or []:
+        # 分批执行的买单在子单成交时记录
+        if isinstance(result, dict) and 'action' in result and not result.get('scheduled'):
+            update_transaction_history(
+                result['action'],
+                result['symbol'],
+                result['qty'],
+                result['price'],
+                reason=result.get('reason')
+            )
+
+
+def poll_until(scheduler, risk_manager, deadline):
+    """
+    在下一个完整周期开始前（deadline 时间戳），按调度单独检查离触发价近的股票，并推进分批执行的买单
+
+    每次检查后按最新行情重新安排这些股票；scheduler 为 None 时只推进分批执行。收盘后立即返回。
+    """
+    if scheduler is not None:
+        scheduler.schedule(dict(strategy.last_ticks))
+    while True:
+        wakeups = [deadline]
+        if scheduler is not None:
+            wakeups.append(scheduler.next_wakeup())
+        if strategy.executor is not None:
+            wakeups.append(strategy.executor.next_wakeup())
+        wait = min(wakeup for wakeup in wakeups if wakeup is not None) - clock.time()
+        if wait > 0:
+            # 取整到秒：虚拟时钟按微秒推进，不足一微秒的等待不会让时间前进
+            clock.sleep(math.ceil(wait))
+        if clock.time() >= deadline or not risk_manager.check_market_hours():
+            return
+
+        try:
+            record_results(strategy.work_orders())
+        except Exception as e:
+            print(f"分批执行出错: {e}")
+
+        symbols = scheduler.due() if scheduler is not None else []
+        if not symbols:
+            continue
+        requests_before = broker_requests()
+        try:
+            record_results(strategy.poll_symbols(symbols))
+        except Exception as e:
+            print(f"单独检查 {', '.join(symbols)} 出错: {e}")
+        scheduler.record(len(symbols), broker_requests() - requests_before)
+        scheduler.schedule({symbol: strategy.last_ticks[symbol] for symbol in symbols
+                            if symbol in strategy.last_ticks})
+
+
+def run_cycle(risk_manager, market_monitor):
+    """执行一个完整的决策周期"""
+    metrics.start_cycle()
+    budget = CycleBudget()
+
+    # 获取市场状况，本周期内所有股票共用（超时沿用上个周期的市场状态）
+    context = strategy.market_context(market_monitor)
+    record_regime(context)
+    dashboard.set_regime(context)
+    print(f"市场状况: {context.market_status}")
+
+    # 获取恐慌贪婪指数情况
+    if context.fg_value is not None:
+        fg_value = context.fg_value
+        fg_rating = context.fg_rating
+        print(f"恐慌贪婪指数: {fg_value} ({fg_rating})")
+
+        # 如果恐慌或贪婪指数特别极端，发送通知
+        if fg_value <= 20 or fg_value >= 80:
+            notify(f"极端市场情绪: 恐慌贪婪指数为 {fg_value} ({fg_rating})")
+
+    # 先处理分批执行的子单成交，本周期按最新的持仓决策
+    results = strategy.work_orders()
+
+    # 每周轮动
+    if USE_ROTATION and rotation_due(strategy.global_state.get("last_rotation")):
+        try:
+            results.extend(rotate_targets(context))
+        except Exception as e:
+            print(f"每周轮动出错: {e}")
+
+    # 运行交易策略
+    results.extend(run_strategy(context, budget) or [])
+
+    # 如果策略返回了交易信息，更新历史记录
+    record_results(results)
+
+    # 更新资产历史
+    current_equity = None
+    try:
+        current_equity = risk_manager.get_total_equity()
+        update_balance_history(current_equity)
+    except Exception as e:
+        print(f"更新资产历史出错: {e}")
+
+    # 用本周期的行情评估影子配置，与实盘收益对比
+    if USE_SHADOW and current_equity is not None:
+        with metrics.stage("shadow"):
+            try:
+                comparison = shadow.run_cycle(context, current_equity)
+                if comparison:
+                    print(comparison)
+            except Exception as e:
+                print(f"影子配置评估出错: {e}")
+
+    print(metrics.end_cycle())
+    return results
+
+
+def run_once():
+    """
+    单次运行模式（供 cron 调用）
+
+    加载上次的状态快照，执行一个决策周期（开盘前的盘前准备时段内执行盘前准备），保存快照后退出。
+    不生成启动图表，超过 ONCE_TIME_BUDGET 时中断周期，保存状态后退出。
+    状态只在主线程中保存：看门狗线程只中断主线程，主线程超过 ONCE_EXIT_GRACE 秒
+    仍未退出时，看门狗不保存直接退出，保留上一次的快照，避免在周期修改状态的同时读取状态。
+    """
+    lock = RunLock(stale_after=ONCE_TIME_BUDGET * 2)
+    if not lock.acquire():
+        print("已有交易进程在运行，本次跳过")
+        return 0
+
+    # 与策略模块共用风险管理器和市场监控器，避免重复请求
+    risk_manager = strategy.risk_manager
+    market_monitor = strategy.market_monitor
+    last_chart_date = restore_state(strategy, load_snapshot(STATE_SNAPSHOT_FILE), transactions, balance_history)
+
+    persist_lock = threading.Lock()
+
+    def persist():
+        with persist_lock:
+            snapshot = capture_state(strategy, transactions, balance_history, last_chart_date)
+            save_snapshot(snapshot, STATE_SNAPSHOT_FILE)
+
+    def on_timeout():
+        print(f"单次运行超过时间预算 {ONCE_TIME_BUDGET} 秒，中断周期")
+        # 向主线程发送 SIGINT，阻塞中的 sleep 和网络请求也会被打断，主线程抛出 KeyboardInterrupt
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+        time.sleep(ONCE_EXIT_GRACE)
+        # 主线程没能及时退出；等正在进行的保存完成后退出，不写入周期中途的状态
+        with persist_lock:
+            print(f"主线程 {ONCE_EXIT_GRACE} 秒内没有退出，不保存状态直接退出")
+            lock.release()
+            os._exit(2)
+
+    watchdog = threading.Timer(ONCE_TIME_BUDGET, on_timeout)
+    watchdog.daemon = True
+    watchdog.start()
+
+    # 进程在周期结束后退出，无法在周期之间推进子单，买单一次下单
+    strategy.executor = None
+
+    try:
+        if risk_manager.check_market_hours():
+            run_cycle(risk_manager, market_monitor)
+        elif warmup_due():
+            run_warmup(risk_manager, market_monitor)
+        else:
+            now = clock.now(pytz.timezone('US/Eastern'))
+            print(f"市场休市中，当前时间: {now.strftime('%Y-%m-%d %H:%M:%S')}")
+        persist()
+        return 0
+    except KeyboardInterrupt:
+        print("单次运行超时，保存状态后退出")
+        persist()
+        return 2
+    except Exception as e:
+        print(f"系统错误: {str(e)}\n{traceback.format_exc()}")
+        notify(f"交易系统出错: {str(e)}")
+        persist()
+        return 1
+    finally:
+        watchdog.cancel()
+        lock.release()
 
 
 def main():
     risk_manager = RiskManager()
     market_monitor = MarketMonitor()
     chart_generator = ChartGenerator()
+    poll_scheduler = PollScheduler()
+
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT)
+        except OSError as e:
+            print(f"监控指标接口启动失败: {e}")
+
+    if DASHBOARD_PORT:
+        try:
+            start_dashboard_server(DASHBOARD_PORT)
+        except OSError as e:
+            print(f"实时看板启动失败: {e}")
+
+    if USE_TRADE_STREAM:
+        start_trade_stream(strategy.bar_engine, strategy.TARGETS)
 
     # 记录启动信息
-    notify(f"交易系统已启动，交易标的: {', '.join(TARGETS)}")
+    notify(f"交易系统已启动，交易标的: {', '.join(strategy.TARGETS)}")
 
     # 获取并记录初始恐慌贪婪指数
     if USE_FEAR_GREED_INDEX:
@@ -63,7 +294,7 @@ def main():
     # 生成初始价格图表
     try:
         # 为每只股票生成单独的价格图表
-        for symbol in TARGETS:
+        for symbol in strategy.TARGETS:
             price_chart = chart_generator.plot_price_with_fear_greed(symbol)
             if price_chart:
                 notify(f"已生成{symbol}价格和恐慌贪婪指数图表: {price_chart}")
@@ -74,23 +305,29 @@ def main():
                 notify(f"已生成{symbol}金叉死叉图表: {ma_chart}")
 
         # 生成多股票比较图表
-        multi_chart = chart_generator.plot_multiple_stocks(TARGETS)
+        multi_chart = chart_generator.plot_multiple_stocks(strategy.TARGETS)
         if multi_chart:
             notify(f"已生成多股票比较图表: {multi_chart}")
     except Exception as e:
         print(f"生成价格图表出错: {e}")
 
     # 每日图表生成时间记录
-    last_chart_date = datetime.datetime.now().date()
+    last_chart_date = clock.now().date()
 
     while True:
         try:
             # 检查市场是否开放
             if not risk_manager.check_market_hours():
                 # 市场休市，每小时检查一次
-                now = datetime.datetime.now(pytz.timezone('US/Eastern'))
+                now = clock.now(pytz.timezone('US/Eastern'))
                 print(f"市场休市中，当前时间: {now.strftime('%Y-%m-%d %H:%M:%S')}")
 
+                # 收盘后关闭当天的K线，触发日线收盘事件
+                strategy.bar_engine.flush(now)
+
+                # 结束收盘前未执行完的分批买单，记录最后的成交
+                record_results(strategy.work_orders())
+
                 # 生成日图表（如果是新的一天）
                 today = now.date()
                 if today > last_chart_date and len(balance_history) > 0:
@@ -98,7 +335,7 @@ def main():
                         portfolio_chart = chart_generator.plot_portfolio_performance(transactions, balance_history)
 
                         # 为每只股票生成价格图表
-                        for symbol in TARGETS:
+                        for symbol in strategy.TARGETS:
                             price_chart = chart_generator.plot_price_with_fear_greed(symbol)
                             if price_chart:
                                 notify(f"已生成{symbol}每日价格图表: {price_chart}")
@@ -109,7 +346,7 @@ def main():
                                 notify(f"已生成{symbol}每日金叉死叉图表: {ma_chart}")
 
                         # 生成多股票比较图表
-                        multi_chart = chart_generator.plot_multiple_stocks(TARGETS)
+                        multi_chart = chart_generator.plot_multiple_stocks(strategy.TARGETS)
 
                         if portfolio_chart:
                             notify(f"已生成每日投资组合表现图表: {portfolio_chart}")
@@ -120,54 +357,39 @@ def main():
                     except Exception as e:
                         print(f"生成每日图表出错: {e}")
 
-                time.sleep(3600)
+                # 开盘前提前完成下载、指标计算和持仓核对
+                if warmup_due():
+                    try:
+                        run_warmup(risk_manager, market_monitor)
+                    except Exception as e:
+                        print(f"盘前准备出错: {e}")
+
+                # 每小时检查一次，盘前准备和开盘时准时醒来
+                clock.sleep(seconds_until_next_check(3600))
                 continue
 
-            # 获取市场状况
-            market_status, market_data = market_monitor.check_market_conditions()
-            print(f"市场状况: {market_status}")
-
-            # 获取恐慌贪婪指数情况
-            if USE_FEAR_GREED_INDEX and 'fear_greed' in market_data:
-                fg_value = market_data['fear_greed']['value']
-                fg_rating = market_data['fear_greed']['rating']
-                print(f"恐慌贪婪指数: {fg_value} ({fg_rating})")
-
-                # 如果恐慌或贪婪指数特别极端，发送通知
-                if fg_value <= 20 or fg_value >= 80:
-                    notify(f"极端市场情绪: 恐慌贪婪指数为 {fg_value} ({fg_rating})")
-
-            # 运行交易策略
-            results = run_strategy()
-
-            # 如果策略返回了交易信息，更新历史记录
-            if results:
-                for result in results:
-                    if isinstance(result, dict) and 'action' in result:
-                        update_transaction_history(
-                            result['action'],
-                            result['symbol'],
-                            result['qty'],
-                            result['price']
-                        )
-
-            # 更新资产历史
-            try:
-                current_equity = risk_manager.get_total_equity()
-                update_balance_history(current_equity)
-            except Exception as e:
-                print(f"更新资产历史出错: {e}")
+            next_cycle = clock.time() + 300
+            run_cycle(risk_manager, market_monitor)
 
             # 控制检查频率，防止API请求过于频繁
-            # 正常交易时段每5分钟检查一次
-            time.sleep(300)
+            # 正常交易时段每5分钟执行一个完整周期，其间按离触发价的距离单独检查部分股票、推进分批执行的买单
+            if USE_POLL_SCHEDULER or strategy.executor is not None:
+                poll_until(poll_scheduler if USE_POLL_SCHEDULER else None, risk_manager, next_cycle)
+            else:
+                clock.sleep(300)
 
         except Exception as e:
             error_msg = f"系统错误: {str(e)}\n{traceback.format_exc()}"
             print(error_msg)
             notify(f"交易系统出错: {str(e)}")
-            time.sleep(300)  # 发生错误后暂停5分钟
+            clock.sleep(300)  # 发生错误后暂停5分钟
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alpaca 美股量化交易机器人")
+    parser.add_argument("--once", action="store_true", help="只执行一个决策周期后退出（供 cron 使用）")
+    args = parser.parse_args()
+
+    if args.once:
+        sys.exit(run_once())
     main()
\ No newline at end of file
@@ -1,57 +1,140 @@
-import datetime
+import clock
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import pytz
 import yfinance as yf
 import numpy as np
 from config import *
 from market_sentiment import FearGreedIndex
+from sentiment_aggregator import SentimentAggregator
+from metrics import metrics
 
 
 class MarketMonitor:
-    def __init__(self):
-        self.market_indexes = ["SPY", "QQQ", "VIX"]
+    def __init__(self, regime_inputs=None):
+        self.regime_inputs = list(regime_inputs or MARKET_REGIME_INPUTS)
+        self.market_indexes = [item["label"] for item in self.regime_inputs]
         self.cached_data = {}
-        self.cache_time = None
-        self.cache_expiry = 300  # 缓存5分钟
+        self.cache_time = None  # 最近一次至少有一个数据源成功的时间
+        self.source_times = {}  # 数据源 -> 最近一次成功获取的时间
+        self.cache_expiry = MARKET_DATA_CACHE_EXPIRY
         self.fear_greed_index = FearGreedIndex()
-
-    def _get_market_data(self):
-        """获取市场指数数据"""
-        now = datetime.datetime.now()
-
-        # 如果缓存有效，使用缓存
-        if self.cache_time and (now - self.cache_time).total_seconds() < self.cache_expiry:
-            return self.cached_data
-
-        data = {}
-        for idx in self.market_indexes:
+        self.sentiment = SentimentAggregator()
+        # 超时的请求会继续占用线程，预留一倍的线程避免下次刷新排队
+        self.executor = ThreadPoolExecutor(max_workers=2 * (len(self.regime_inputs) + 1),
+                                           thread_name_prefix="market-data")
+        self.refresh_lock = threading.Lock()
+        self.refreshing = False
+
+    def _fetch_index(self, symbol):
+        """获取单个指数的最新价格和日涨跌幅"""
+        metrics.count("http.yfinance")
+        ticker = yf.Ticker(symbol)
+        # 取5天数据，避免周一或节假日后只有一根K线
+        hist = ticker.history(period="5d", timeout=MARKET_DATA_TIMEOUT)
+        if len(hist) < 2:
+            return None
+        current = hist['Close'].iloc[-1]
+        prev = hist['Close'].iloc[-2]
+        return {
+            'price': current,
+            'change': (current - prev) / prev
+        }
+
+    def _fetch_fear_greed(self):
+        """多个情绪数据源的合成分数，最多占用 SENTIMENT_DEADLINE 秒"""
+        with metrics.stage("sentiment"):
+            sentiment = self.sentiment.collect()
+        if sentiment is not None and sentiment['missing']:
+            print(f"情绪数据源无可用读数: {', '.join(sentiment['missing'])}")
+        return sentiment
+
+    @metrics.timed("market_data_refresh")
+    def refresh(self):
+        """
+        并发获取所有市场数据并更新缓存
+
+        所有数据源同时请求，最多等待 MARKET_DATA_TIMEOUT 秒；出错或超时的数据源沿用上一次的值，
+        但超过 MARKET_DATA_MAX_STALE 秒没有更新的值会被丢弃。所有数据源都失败时不更新缓存时间，
+        下次调用仍会重新请求。
+        """
+        futures = {self.executor.submit(self._fetch_index, item["symbol"]): item["label"]
+                   for item in self.regime_inputs}
+        if USE_FEAR_GREED_INDEX:
+            futures[self.executor.submit(self._fetch_fear_greed)] = 'fear_greed'
+
+        done, pending = wait(futures, timeout=MARKET_DATA_TIMEOUT)
+        now = clock.now()
+        data = dict(self.cached_data)
+        succeeded = False
+        for future in done:
+            label = futures[future]
             try:
-                ticker = yf.Ticker(idx)
-                hist = ticker.history(period="2d")
-                if not hist.empty:
-                    current = hist['Close'].iloc[-1]
-                    prev = hist['Close'].iloc[-2]
-                    change = (current - prev) / prev
-                    data[idx] = {
-                        'price': current,
-                        'change': change
-                    }
+                value = future.result()
             except Exception as e:
-                print(f"获取{idx}数据出错: {e}")
-
-        # 获取恐慌贪婪指数
-        if USE_FEAR_GREED_INDEX:
-            fear_greed_value, fear_greed_rating = self.fear_greed_index.get_fear_greed_index()
-            if fear_greed_value is not None:
-                data['fear_greed'] = {
-                    'value': fear_greed_value,
-                    'rating': fear_greed_rating
-                }
+                print(f"获取{label}数据出错: {e}")
+                continue
+            if value is not None:
+                data[label] = value
+                self.source_times[label] = now
+                succeeded = True
+        for future in pending:
+            print(f"获取{futures[future]}数据超时，沿用旧数据")
+
+        for label in self._stale_sources(now, data):
+            print(f"{label}数据超过 {MARKET_DATA_MAX_STALE} 秒没有更新，不再使用")
+            data.pop(label, None)
+            self.source_times.pop(label, None)
 
         # 更新缓存
         self.cached_data = data
-        self.cache_time = now
+        if succeeded:
+            self.cache_time = now
         return data
 
+    def _stale_sources(self, now, data=None):
+        """缓存中超过 MARKET_DATA_MAX_STALE 秒没有更新的数据源"""
+        data = self.cached_data if data is None else data
+        stale = []
+        for label in data:
+            updated = self.source_times.get(label, self.cache_time)
+            if updated is None or (now - updated).total_seconds() >= MARKET_DATA_MAX_STALE:
+                stale.append(label)
+        return stale
+
+    def _refresh_in_background(self):
+        """在后台线程中刷新，同一时间只有一个刷新任务"""
+        with self.refresh_lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"后台刷新市场数据出错: {e}")
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, name="market-data-refresh", daemon=True).start()
+
+    def _get_market_data(self):
+        """
+        获取市场指数数据
+
+        缓存过期后在后台刷新，刷新完成前继续返回旧数据，交易流程不等待网络。
+        只有没有任何数据，或缓存中有数据源超过 MARKET_DATA_MAX_STALE 秒没有更新时才同步刷新。
+        """
+        now = clock.now()
+        age = (now - self.cache_time).total_seconds() if self.cache_time else None
+
+        if age is None or age >= MARKET_DATA_MAX_STALE or self._stale_sources(now):
+            return self.refresh()
+        if age >= self.cache_expiry:
+            self._refresh_in_background()
+        return self.cached_data
+
     def check_market_conditions(self):
         """检查市场状况，返回市场评估结果"""
         data = self._get_market_data()
@@ -59,29 +142,22 @@ class MarketMonitor:
         # 市场评估变量
         market_strength = 0
 
-        # 评估SPY (S&P 500 ETF)
-        if 'SPY' in data:
-            spy_change = data['SPY']['change']
-            if spy_change > 0.01:  # 上涨超过1%
-                market_strength += 1
-            elif spy_change < -0.01:  # 下跌超过1%
-                market_strength -= 1
-
-        # 评估QQQ (纳斯达克100 ETF)
-        if 'QQQ' in data:
-            qqq_change = data['QQQ']['change']
-            if qqq_change > 0.01:
-                market_strength += 1
-            elif qqq_change < -0.01:
-                market_strength -= 1
-
-        # 评估VIX (波动率指数)
-        if 'VIX' in data:
-            vix = data['VIX']['price']
-            if vix > 30:  # 高波动性
-                market_strength -= 1
-            elif vix < 15:  # 低波动性
-                market_strength += 1
+        # 评估指数：趋势类看日涨跌幅，波动率类看指数水平
+        for item in self.regime_inputs:
+            if item["label"] not in data:
+                continue
+            if item["kind"] == "volatility":
+                level = data[item["label"]]['price']
+                if level > 30:  # 高波动性
+                    market_strength -= 1
+                elif level < 15:  # 低波动性
+                    market_strength += 1
+            else:
+                change = data[item["label"]]['change']
+                if change > 0.01:  # 上涨超过1%
+                    market_strength += 1
+                elif change < -0.01:  # 下跌超过1%
+                    market_strength -= 1
 
         # 评估恐慌贪婪指数
         if 'fear_greed' in data:
@@ -103,35 +179,43 @@ class MarketMonitor:
         else:
             return "中性", data
 
-    def adjust_position_size(self, base_size):
-        """根据市场状况调整仓位大小"""
-        market_status, data = self.check_market_conditions()
-        multiplier = 1.0
+    def position_multipliers(self, market_status, data):
+        """根据恐慌贪婪指数和市场状况计算仓位系数，返回 (情绪系数, 市场系数)"""
+        fg_multiplier = 1.0
+        market_multiplier = 1.0
 
         # 根据恐慌贪婪指数调整仓位
         if USE_FEAR_GREED_INDEX and 'fear_greed' in data:
             fg_value = data['fear_greed']['value']
 
             if fg_value <= 20:  # 极度恐慌
-                multiplier *= EXTREME_FEAR_BOOST  # 极度恐慌时增加仓位
+                fg_multiplier = EXTREME_FEAR_BOOST  # 极度恐慌时增加仓位
             elif fg_value <= FEAR_BUY_THRESHOLD:  # 恐慌
-                multiplier *= 1.2  # 恐慌时小幅增加仓位
+                fg_multiplier = 1.2  # 恐慌时小幅增加仓位
             elif fg_value >= 80:  # 极度贪婪
-                multiplier *= EXTREME_GREED_REDUCE  # 极度贪婪时减少仓位
+                fg_multiplier = EXTREME_GREED_REDUCE  # 极度贪婪时减少仓位
             elif fg_value >= GREED_SELL_THRESHOLD:  # 贪婪
-                multiplier *= 0.8  # 贪婪时小幅减少仓位
+                fg_multiplier = 0.8  # 贪婪时小幅减少仓位
 
         # 根据市场状况进一步调整
         if market_status == "强势":
-            multiplier *= 1.2  # 市场强势时增加20%仓位
+            market_multiplier = 1.2  # 市场强势时增加20%仓位
         elif market_status == "弱势":
-            multiplier *= 0.8  # 市场弱势时减少20%仓位
+            market_multiplier = 0.8  # 市场弱势时减少20%仓位
+
+        return fg_multiplier, market_multiplier
 
-        return base_size * multiplier
+    def adjust_position_size(self, base_size):
+        """根据市场状况调整仓位大小"""
+        market_status, data = self.check_market_conditions()
+        fg_multiplier, market_multiplier = self.position_multipliers(market_status, data)
+        return base_size * fg_multiplier * market_multiplier
 
     def get_fear_greed_signal(self):
         """获取恐慌贪婪指数信号"""
         if not USE_FEAR_GREED_INDEX:
             return "NEUTRAL", None
 
-        return self.fear_greed_index.get_buy_sell_signal()
\ No newline at end of file
+        sentiment = self._get_market_data().get('fear_greed')
+        value = sentiment['value'] if sentiment else None
+        return self.fear_greed_index.get_signal_from_score(value), value
\ No newline at end of file
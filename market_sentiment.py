@@ -4,7 +4,49 @@ import datetime
 import pytz
 import json
 import os
-import time
+import clock
+from metrics import metrics
+from config import *
+
+CNN_API_URL = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
+CNN_PAGE_URL = "https://www.cnn.com/markets/fear-and-greed"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+
+def fetch_cnn_api(timeout=SENTIMENT_HTTP_TIMEOUT):
+    """CNN 数据接口，返回 (分数, 数据时间戳)，没有数据时返回 None"""
+    metrics.count("http.fear_greed_api")
+    response = requests.get(CNN_API_URL, headers=HEADERS, timeout=timeout)
+    if response.status_code != 200:
+        return None
+    data = response.json().get('fear_and_greed', {})
+    if 'score' not in data:
+        return None
+    as_of = clock.time()
+    if data.get('timestamp'):
+        try:
+            as_of = datetime.datetime.fromisoformat(str(data['timestamp']).replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+    return data['score'], as_of
+
+
+def scrape_cnn_page(timeout=SENTIMENT_HTTP_TIMEOUT):
+    """从CNN网页爬取指数，返回 (分数, 抓取时间)，页面上没有找到时返回 None"""
+    metrics.count("http.fear_greed_scrape")
+    response = requests.get(CNN_PAGE_URL, headers=HEADERS, timeout=timeout)
+    if response.status_code != 200:
+        return None
+    soup = BeautifulSoup(response.text, 'html.parser')
+    meter_element = soup.select_one('.market-fng-gauge__meter-value')
+    if meter_element is None:
+        return None
+    try:
+        return int(meter_element.text.strip()), clock.time()
+    except ValueError:
+        return None
 
 
 class FearGreedIndex:
@@ -26,7 +68,7 @@ class FearGreedIndex:
                     self.current_rating = data.get('rating')
 
                     # 检查缓存是否过期
-                    if time.time() - self.last_update <= self.cache_timeout:
+                    if clock.time() - self.last_update <= self.cache_timeout:
                         return True
             except Exception as e:
                 print(f"读取缓存文件失败: {e}")
@@ -36,7 +78,7 @@ class FearGreedIndex:
         """保存恐慌贪婪指数数据到缓存文件"""
         try:
             data = {
-                'timestamp': time.time(),
+                'timestamp': clock.time(),
                 'value': self.current_value,
                 'rating': self.current_rating
             }
@@ -52,23 +94,16 @@ class FearGreedIndex:
             return self.current_value, self.current_rating
 
         try:
-            url = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 200:
-                data = response.json()
-                if 'fear_and_greed' in data and 'score' in data['fear_and_greed']:
-                    score = data['fear_and_greed']['score']
-                    rating = self.get_rating_from_score(score)
+            reading = fetch_cnn_api()
+            if reading is not None:
+                score = reading[0]
+                rating = self.get_rating_from_score(score)
 
-                    self.current_value = score
-                    self.current_rating = rating
-                    self.save_cache()
+                self.current_value = score
+                self.current_rating = rating
+                self.save_cache()
 
-                    return score, rating
+                return score, rating
 
             # 备用方法
             return self._scrape_fear_greed_index()
@@ -83,29 +118,16 @@ class FearGreedIndex:
     def _scrape_fear_greed_index(self):
         """备用方法：从CNN网站爬取恐慌贪婪指数"""
         try:
-            url = "https://www.cnn.com/markets/fear-and-greed"
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                # 尝试不同的选择器查找指数值
-                meter_element = soup.select_one('.market-fng-gauge__meter-value')
-                if meter_element:
-                    value_text = meter_element.text.strip()
-                    try:
-                        value = int(value_text)
-                        rating = self.get_rating_from_score(value)
-
-                        self.current_value = value
-                        self.current_rating = rating
-                        self.save_cache()
-
-                        return value, rating
-                    except ValueError:
-                        pass
+            reading = scrape_cnn_page()
+            if reading is not None:
+                value = reading[0]
+                rating = self.get_rating_from_score(value)
+
+                self.current_value = value
+                self.current_rating = rating
+                self.save_cache()
+
+                return value, rating
 
             # 如果当前缓存有值，返回缓存的值
             if self.current_value is not None and self.current_rating is not None:
@@ -135,17 +157,20 @@ class FearGreedIndex:
     def get_buy_sell_signal(self):
         """根据恐慌贪婪指数生成买卖信号"""
         value, rating = self.get_fear_greed_index()
+        return self.get_signal_from_score(value), value
 
+    def get_signal_from_score(self, value):
+        """根据分数确定买卖信号"""
         if value is None:
-            return "NEUTRAL", None
+            return "NEUTRAL"
 
         if value <= 25:
-            return "STRONG_BUY", value  # 极度恐慌 - 强烈买入信号
+            return "STRONG_BUY"  # 极度恐慌 - 强烈买入信号
         elif value <= 40:
-            return "BUY", value  # 恐慌 - 买入信号
+            return "BUY"  # 恐慌 - 买入信号
         elif value <= 60:
-            return "NEUTRAL", value  # 中性 - 持有信号
+            return "NEUTRAL"  # 中性 - 持有信号
         elif value <= 80:
-            return "SELL", value  # 贪婪 - 卖出信号
+            return "SELL"  # 贪婪 - 卖出信号
         else:
-            return "STRONG_SELL", value  # 极度贪婪 - 强烈卖出信号
\ No newline at end of file
+            return "STRONG_SELL"  # 极度贪婪 - 强烈卖出信号
\ No newline at end of file
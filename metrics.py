@@ -0,0 +1,147 @@
+import time
+import threading
+import functools
+from collections import defaultdict, deque, Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from config import *
+
+
+class Metrics:
+    """交易周期各阶段耗时和调用次数统计"""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))  # 最近的耗时样本，用于计算分位数
+        self.totals = defaultdict(lambda: [0, 0.0])  # 累计 [次数, 总耗时]
+        self.counters = Counter()
+        self.cycle_stages = defaultdict(float)
+        self.cycle_counters = Counter()
+        self.cycle_start = None
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+            total = self.totals[name]
+            total[0] += 1
+            total[1] += seconds
+            self.cycle_stages[name] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+            self.cycle_counters[name] += n
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个代码块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name):
+        """统计函数耗时的装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def counted(self, name):
+        """统计函数调用次数的装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                self.count(name)
+                return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def percentiles(self, name):
+        """返回最近样本的 (p50, p95, p99)"""
+        with self.lock:
+            values = list(self.samples.get(name, ()))
+        if not values:
+            return None
+        return tuple(np.percentile(values, [50, 95, 99]))
+
+    def start_cycle(self):
+        with self.lock:
+            self.cycle_stages.clear()
+            self.cycle_counters.clear()
+        self.cycle_start = time.perf_counter()
+
+    def end_cycle(self):
+        """结束一个周期，记录总耗时并返回本周期的汇总行"""
+        if self.cycle_start is None:
+            return ""
+        self.observe("cycle", time.perf_counter() - self.cycle_start)
+        self.cycle_start = None
+
+        with self.lock:
+            stages = dict(self.cycle_stages)
+            counters = dict(self.cycle_counters)
+
+        parts = [f"周期耗时 {stages.pop('cycle', 0):.2f}s"]
+        parts += [f"{name} {seconds * 1000:.0f}ms" for name, seconds in sorted(stages.items(), key=lambda x: -x[1])]
+        broker_calls = sum(n for name, n in counters.items() if name.startswith("broker."))
+        http_calls = sum(n for name, n in counters.items() if name.startswith("http."))
+        parts.append(f"券商调用 {broker_calls} 次")
+        parts.append(f"HTTP调用 {http_calls} 次")
+        if counters.get("errors"):
+            parts.append(f"错误 {counters['errors']} 次")
+        return " | ".join(parts)
+
+    def render_prometheus(self):
+        """导出 Prometheus 文本格式"""
+        lines = ["# TYPE trader_stage_seconds summary"]
+        with self.lock:
+            names = sorted(self.totals)
+            totals = {name: list(self.totals[name]) for name in names}
+            counters = dict(self.counters)
+        for name in names:
+            quantiles = self.percentiles(name)
+            if quantiles:
+                for q, value in zip(("0.5", "0.95", "0.99"), quantiles):
+                    lines.append(f'trader_stage_seconds{{stage="{name}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'trader_stage_seconds_count{{stage="{name}"}} {totals[name][0]}')
+            lines.append(f'trader_stage_seconds_sum{{stage="{name}"}} {totals[name][1]:.6f}')
+
+        lines.append("# TYPE trader_calls_total counter")
+        for name in sorted(counters):
+            lines.append(f'trader_calls_total{{name="{name}"}} {counters[name]}')
+        return "\n".join(lines) + "\n"
+
+
+# 全局统计实例，各模块共用
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """在后台线程启动 /metrics 接口"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"监控指标接口已启动: http://{host}:{port}/metrics")
+    return server
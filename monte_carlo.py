@@ -0,0 +1,238 @@
+"""
+蒙特卡洛风险模拟
+
+对交易标的的历史日收益率做区块自助抽样（同一天所有股票一起抽取，保留股票之间的相关性），
+在数万条路径上同时套用 config.py 中的止损、止盈、跟踪止损、加仓和仓位上限规则，
+统计最大回撤、水下时间和触发单日亏损限制的概率，用来评估风控参数是否合理。
+
+模拟以日线收盘价为步长，止损止盈在收盘时检查（隔夜跳空的损失会完整计入）；
+均线和恐慌贪婪指数信号无法从收益率中还原，用 entry_rate 表示空仓时出现买入信号的概率。
+
+    python monte_carlo.py --paths 100000
+    python monte_carlo.py --fixtures --set stop_loss=-0.08 --set layer_size=0.05
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import *
+
+
+def default_rules():
+    """从 config.py 读取策略规则，可以覆盖其中的任意一项做参数对比"""
+    return {
+        "stop_loss": STOP_LOSS,
+        "take_profit": TAKE_PROFIT,
+        "trailing_stop": TRAILING_STOP,
+        "max_layers": MAX_LAYERS,
+        "layer_drop": LAYER_DROP,
+        "layer_size": LAYER_SIZE,
+        "max_position_size": MAX_POSITION_SIZE,
+        "daily_loss_limit": DAILY_LOSS_LIMIT,
+        "max_drawdown": MAX_DRAWDOWN,
+        "add_risk_floor": -0.03,  # 持仓亏损超过 3% 时不加仓（与 strategy.py 一致）
+        "entry_rate": 1.0,
+    }
+
+
+def load_returns(symbols, period=MC_HISTORY_PERIOD, fixtures=False):
+    """获取日收益率矩阵 (时间 × 股票)，去掉任一股票缺失数据的日期"""
+    if fixtures:
+        prices = pd.DataFrame({
+            symbol: pd.read_csv(os.path.join("fixtures", "bars", f"{symbol.replace('^', '_')}.csv"),
+                                index_col="Date", parse_dates=True)["Close"]
+            for symbol in symbols})
+    else:
+        from data_feed import fetch_price_matrix
+
+        prices, failed = fetch_price_matrix(symbols, period=period)
+        if failed:
+            raise ValueError(f"获取行情失败: {failed}")
+    return prices[symbols].pct_change().dropna().to_numpy(dtype=float)
+
+
+def bootstrap_paths(returns, n_paths, horizon, block_size, rng):
+    """区块自助抽样，返回 (交易日 × 路径 × 股票) 的收益率，按交易日连续存放便于逐日计算"""
+    n_time = returns.shape[0]
+    block_size = min(block_size, n_time)
+    n_blocks = -(-horizon // block_size)
+    starts = rng.integers(0, n_time - block_size + 1, size=(n_paths, n_blocks))
+    index = (starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)[:, :horizon]
+    return returns[index.T]
+
+
+def simulate_chunk(returns, n_paths, horizon, block_size, weights, rules, seed):
+    """
+    模拟一批路径，所有路径和股票在每个交易日同时计算
+
+    账户初始净值为 1，持仓按金额计算（允许零碎股）。
+    返回每条路径的 最大回撤、最长水下天数、触发单日亏损限制的天数、期末收益。
+    """
+    rng = np.random.default_rng(seed)
+    growth = 1 + bootstrap_paths(returns, n_paths, horizon, block_size, rng)
+    n_symbols = returns.shape[1]
+    weights = np.asarray(weights, dtype=float)
+    ones = np.ones(n_symbols)  # 按股票求和用矩阵乘法，比 sum(axis=1) 快
+
+    price = np.ones((n_paths, n_symbols))
+    qty = np.zeros((n_paths, n_symbols))
+    avg_entry = np.ones((n_paths, n_symbols))
+    anchor = np.ones((n_paths, n_symbols))      # 首次买入价，加仓和跟踪止损以此为基准
+    highest = np.zeros((n_paths, n_symbols))
+    layers = np.zeros((n_paths, n_symbols))
+    cash = np.ones(n_paths)
+
+    prev_equity = np.ones(n_paths)
+    peak = np.ones(n_paths)
+    max_drawdown = np.zeros(n_paths)
+    underwater = np.zeros(n_paths)
+    max_underwater = np.zeros(n_paths)
+    limit_days = np.zeros(n_paths)
+
+    for t in range(horizon):
+        price *= growth[t]
+        held = qty > 0
+
+        # 止损 / 止盈 / 跟踪止损，收盘时检查
+        change = price / avg_entry - 1
+        exit_mask = held & ((change <= rules["stop_loss"]) | (change >= rules["take_profit"]))
+        above = held & (price > anchor)
+        np.maximum(highest, np.where(above, price, 0.0), out=highest)
+        exit_mask |= above & ((highest - price) / np.where(highest > 0, highest, 1.0) >= rules["trailing_stop"])
+
+        cash += (qty * price * exit_mask) @ ones
+        qty[exit_mask] = 0.0
+        layers[exit_mask] = 0
+        highest[exit_mask] = 0.0
+
+        equity = cash + (qty * price) @ ones
+
+        # 单日亏损限制：触发当天不再开新仓
+        limit_hit = (prev_equity - equity) / prev_equity >= rules["daily_loss_limit"]
+        limit_days += limit_hit
+
+        np.maximum(peak, equity, out=peak)
+        drawdown = 1 - equity / peak
+        np.maximum(max_drawdown, drawdown, out=max_drawdown)
+        underwater = np.where(drawdown > 0, underwater + 1, 0)
+        np.maximum(max_underwater, underwater, out=max_underwater)
+
+        # 开仓和加仓
+        held = qty > 0
+        can_trade = ~limit_hit[:, None]
+        new_entry = ~held & can_trade
+        if rules["entry_rate"] < 1.0:
+            new_entry &= rng.random((n_paths, n_symbols)) < rules["entry_rate"]
+        position_risk = np.where(held, (price - avg_entry) / price, 0.0)
+        add_layer = (held & can_trade & (layers < rules["max_layers"])
+                     & (price / anchor - 1 <= -rules["layer_drop"] * layers)
+                     & (position_risk >= rules["add_risk_floor"]))
+        buy_mask = new_entry | add_layer
+
+        budget = cash[:, None] * rules["layer_size"] * weights
+        room = rules["max_position_size"] * equity[:, None] - qty * price
+        budget = np.where(buy_mask, np.clip(np.minimum(budget, room), 0.0, None), 0.0)
+        shares = budget / price
+        total = qty + shares
+        avg_entry = np.where(shares > 0, (avg_entry * qty + budget) / np.where(total > 0, total, 1.0), avg_entry)
+        anchor = np.where(new_entry & (shares > 0), price, anchor)
+        layers += shares > 0
+        qty = total
+        cash -= budget @ ones
+
+        prev_equity = equity
+
+    final_equity = cash + (qty * price).sum(axis=1)
+    return max_drawdown, max_underwater, limit_days, final_equity - 1
+
+
+def run_simulation(returns, n_paths=MC_PATHS, horizon=MC_HORIZON, block_size=MC_BLOCK_SIZE, weights=None,
+                   rules=None, workers=None, chunk_size=MC_CHUNK_SIZE, seed=None):
+    """
+    多进程运行模拟，每个进程负责一批路径，使用独立的随机数种子
+
+    返回 {"max_drawdown", "time_under_water", "limit_days", "final_return"}，每项为每条路径的数组
+    """
+    returns = np.asarray(returns, dtype=float)
+    weights = weights if weights is not None else np.full(returns.shape[1], 1.0 / returns.shape[1])
+    rules = dict(default_rules(), **(rules or {}))
+
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(returns, size, horizon, block_size, weights, rules, child) for size, child in zip(sizes, seeds)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(args) == 1:
+        parts = [simulate_chunk(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as executor:
+            parts = list(executor.map(simulate_chunk, *zip(*args)))
+
+    names = ["max_drawdown", "time_under_water", "limit_days", "final_return"]
+    return {name: np.concatenate([part[i] for part in parts]) for i, name in enumerate(names)}
+
+
+def summarize(result, rules=None):
+    """汇总分布：分位数和超过风控限制的概率"""
+    rules = dict(default_rules(), **(rules or {}))
+    percentiles = [5, 50, 95, 99]
+    return {
+        "paths": len(result["max_drawdown"]),
+        "max_drawdown": dict(zip(percentiles, np.percentile(result["max_drawdown"], percentiles))),
+        "time_under_water": dict(zip(percentiles, np.percentile(result["time_under_water"], percentiles))),
+        "final_return": dict(zip(percentiles, np.percentile(result["final_return"], percentiles))),
+        "max_drawdown_limit": rules["max_drawdown"],
+        "prob_exceed_max_drawdown": float(np.mean(result["max_drawdown"] > rules["max_drawdown"])),
+        "prob_hit_daily_loss_limit": float(np.mean(result["limit_days"] > 0)),
+        "mean_limit_days": float(np.mean(result["limit_days"])),
+    }
+
+
+def format_summary(summary, horizon=MC_HORIZON):
+    def row(name, values, percent=True):
+        cells = "  ".join(f"P{p}={v:.2%}" if percent else f"P{p}={v:.0f}" for p, v in values.items())
+        return f"{name:<12}{cells}"
+
+    return "\n".join([
+        f"模拟路径: {summary['paths']}，每条 {horizon} 个交易日",
+        row("最大回撤", summary["max_drawdown"]),
+        row("水下天数", summary["time_under_water"], percent=False),
+        row("期末收益", summary["final_return"]),
+        f"回撤超过 {summary['max_drawdown_limit']:.0%} 的概率: {summary['prob_exceed_max_drawdown']:.2%}",
+        f"至少一天触发单日亏损限制的概率: {summary['prob_hit_daily_loss_limit']:.2%}"
+        f"（平均每条路径 {summary['mean_limit_days']:.1f} 天）",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="蒙特卡洛风险模拟")
+    parser.add_argument("--symbols", nargs="+", default=TARGETS, help="交易标的")
+    parser.add_argument("--period", default=MC_HISTORY_PERIOD, help="历史数据长度")
+    parser.add_argument("--paths", type=int, default=MC_PATHS, help="模拟路径数")
+    parser.add_argument("--horizon", type=int, default=MC_HORIZON, help="每条路径的交易日数")
+    parser.add_argument("--block", type=int, default=MC_BLOCK_SIZE, help="区块长度")
+    parser.add_argument("--workers", type=int, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--seed", type=int, help="随机数种子")
+    parser.add_argument("--fixtures", action="store_true", help="使用 fixtures/ 中的离线行情")
+    parser.add_argument("--set", action="append", default=[], metavar="规则=值", help="覆盖规则参数")
+    args = parser.parse_args()
+
+    rules = {}
+    for item in args.set:
+        name, value = item.split("=", 1)
+        rules[name] = float(value)
+
+    returns = load_returns(args.symbols, args.period, fixtures=args.fixtures)
+    weights = [TARGET_WEIGHTS.get(symbol, 1.0 / len(args.symbols)) for symbol in args.symbols]
+
+    started = time.time()
+    result = run_simulation(returns, args.paths, args.horizon, args.block, weights, rules, args.workers,
+                            seed=args.seed)
+    print(format_summary(summarize(result, rules), args.horizon))
+    print(f"耗时 {time.time() - started:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
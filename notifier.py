@@ -1,11 +1,19 @@
 import os
 import requests
+from metrics import metrics
+from config import *
 
 webhook = os.getenv("WECHAT_WEBHOOK")
 
+@metrics.timed("notification")
 def notify(content):
     data = {
         "msgtype": "text",
         "text": {"content": content}
     }
-    requests.post(webhook, json=data)
+    metrics.count("http.notify")
+    try:
+        requests.post(webhook, json=data, timeout=NOTIFY_TIMEOUT)
+    except Exception as e:
+        # 通知失败不能影响交易流程（例如卖出前的通知）
+        print(f"发送通知失败: {e}")
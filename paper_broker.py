@@ -0,0 +1,143 @@
+from metrics import metrics
+
+BROKER_FUNCTIONS = ["get_price", "get_position", "get_cash", "get_account_summary", "get_position_values",
+                    "buy", "sell", "close_all", "submit_exit_orders", "submit_trailing_stop", "submit_limit_buy",
+                    "cancel_order", "get_open_orders", "get_order"]
+
+
+class PaperBroker:
+    """内存中的模拟券商，接口与 broker.py 一致，用于基准测试、回放和模拟"""
+
+    def __init__(self, prices=None, cash=100000.0):
+        self.prices = dict(prices or {})
+        self.cash = cash
+        self.positions = {}  # symbol -> [平均成本, 股数]
+        self.orders = []
+        self.resting = {}    # order_id -> 挂单，价格更新时按新价格撮合
+        self.fills = []      # 挂单的成交记录
+        self.order_status = {}
+        self._patched = []
+
+    def set_prices(self, prices):
+        self.prices.update(prices)
+        self._match_resting()
+
+    def get_price(self, symbol):
+        return float(self.prices[symbol])
+
+    def get_position(self, symbol):
+        if symbol not in self.positions:
+            return None, 0
+        avg_price, qty = self.positions[symbol]
+        return avg_price, qty
+
+    def get_cash(self):
+        return self.cash
+
+    def get_account_summary(self):
+        equity = self.cash + sum(v for v in self.get_position_values().values())
+        return {
+            "cash": self.cash,
+            "buying_power": self.cash,
+            "equity": equity,
+            "last_equity": equity,
+        }
+
+    def get_position_values(self):
+        return {symbol: self.prices[symbol] * qty for symbol, (_, qty) in self.positions.items()}
+
+    def buy(self, symbol, qty):
+        price = self.get_price(symbol)
+        avg_price, held = self.positions.get(symbol, (0.0, 0))
+        new_qty = held + qty
+        self.positions[symbol] = [(avg_price * held + price * qty) / new_qty, new_qty]
+        self.cash -= price * qty
+        self.orders.append(("buy", symbol, qty, price))
+
+    def sell(self, symbol, qty):
+        price = self.get_price(symbol)
+        avg_price, held = self.positions.get(symbol, (0.0, 0))
+        qty = min(qty, held)
+        if qty <= 0:
+            return
+        if held - qty > 0:
+            self.positions[symbol] = [avg_price, held - qty]
+        else:
+            del self.positions[symbol]
+        self.cash += price * qty
+        self.orders.append(("sell", symbol, qty, price))
+
+    def close_all(self):
+        for symbol, (_, qty) in list(self.positions.items()):
+            self.sell(symbol, qty)
+
+    def _rest(self, order):
+        order_id = f"paper-{len(self.order_status) + 1}"
+        self.resting[order_id] = dict(order, id=order_id)
+        self.order_status[order_id] = {"status": "new", "filled_qty": 0, "filled_avg_price": None}
+        return order_id
+
+    def submit_exit_orders(self, symbol, qty, stop_price, limit_price, client_order_id=None):
+        return self._rest({"symbol": symbol, "side": "sell", "type": "oco", "qty": qty, "stop": stop_price,
+                           "limit": limit_price, "client_order_id": client_order_id})
+
+    def submit_trailing_stop(self, symbol, qty, trail_percent, client_order_id=None):
+        return self._rest({"symbol": symbol, "side": "sell", "type": "trailing_stop", "qty": qty,
+                           "trail": trail_percent, "high": self.get_price(symbol), "client_order_id": client_order_id})
+
+    def submit_limit_buy(self, symbol, qty, limit_price, client_order_id=None):
+        return self._rest({"symbol": symbol, "side": "buy", "type": "limit", "qty": qty, "limit": limit_price,
+                           "client_order_id": client_order_id})
+
+    def cancel_order(self, order_id):
+        if self.resting.pop(order_id, None) is not None:
+            self.order_status[order_id]["status"] = "canceled"
+
+    def get_open_orders(self):
+        return [{"id": o["id"], "client_order_id": o["client_order_id"], "symbol": o["symbol"], "side": o["side"],
+                 "type": o["type"], "qty": o["qty"]} for o in self.resting.values()]
+
+    def get_order(self, order_id):
+        return dict(self.order_status[order_id])
+
+    def _match_resting(self):
+        """按最新价格撮合挂单，成交价取最新价格（模拟跳空时按开盘价成交）"""
+        for order_id, order in list(self.resting.items()):
+            price = self.prices.get(order["symbol"])
+            if price is None:
+                continue
+            if order["type"] == "limit":
+                triggered = price <= order["limit"]
+            elif order["type"] == "oco":
+                triggered = price >= order["limit"] or price <= order["stop"]
+            else:
+                order["high"] = max(order["high"], price)
+                triggered = price <= order["high"] * (1 - order["trail"])
+            if not triggered:
+                continue
+
+            del self.resting[order_id]
+            held = self.positions.get(order["symbol"], (0.0, 0))[1]
+            qty = order["qty"] if order["side"] == "buy" else min(order["qty"], held)
+            if qty > 0:
+                getattr(self, order["side"])(order["symbol"], qty)
+                # 挂单成交单独记录，orders 中只保留主动下的市价单
+                self.fills.append(self.orders.pop())
+            self.order_status[order_id] = {"status": "filled" if qty > 0 else "canceled", "filled_qty": qty,
+                                           "filled_avg_price": price if qty > 0 else None}
+
+    def install(self, *modules):
+        """替换各模块中从 broker 导入的函数，返回 self 以便链式调用"""
+        for module in modules:
+            for name in BROKER_FUNCTIONS:
+                if hasattr(module, name):
+                    self._patched.append((module, name, getattr(module, name)))
+                    # 与 broker.py 一样按接口计数，自适应轮询据此统计实际的券商请求数
+                    setattr(module, name, metrics.counted(f"broker.{name}")(getattr(self, name)))
+        return self
+
+    def uninstall(self):
+        """恢复被替换的函数"""
+        while self._patched:
+            module, name, original = self._patched.pop()
+            setattr(module, name, original)
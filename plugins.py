@@ -0,0 +1,301 @@
+"""
+策略插件
+
+同一进程内可以同时运行多个策略，共用一套行情、K线引擎、指标缓存和周期上下文：
+每个周期每只股票只取一次价格和持仓，再依次分发给所有关注这只股票的策略（on_tick）；
+K线收盘事件也只从K线引擎订阅一次，再分发给需要该周期的策略（on_bar）。
+
+原有的分层建仓策略包装为 legacy 插件，仍按原来的方式直接下单，受 risk_manager 的账户级限制约束。
+其他策略只返回下单股数，由插件宿主按各自的资金预算和风险预算检查后统一下单，并分别记账。
+"""
+import datetime
+from collections import namedtuple
+import pytz
+from metrics import metrics
+from indicators import rsi
+from indicator_cache import indicator_cache
+from config import *
+
+EASTERN = pytz.timezone('US/Eastern')
+
+# 一次行情：价格和账户中的持仓（均价、股数），同一周期内所有策略看到的是同一份
+Tick = namedtuple("Tick", ["symbol", "time", "price", "entry", "qty"])
+
+
+def _strategy():
+    """延迟导入 strategy，避免循环导入；下单和通知都走 strategy 模块，回放和测试替换的函数同样生效"""
+    import strategy
+    return strategy
+
+
+class PluginBook:
+    """单个策略在共用账户内的持仓和当日已实现盈亏"""
+
+    def __init__(self):
+        self.positions = {}  # symbol -> [均价, 股数]
+        self.realized = 0.0
+        self.day = None
+
+    def qty(self, symbol):
+        return self.positions.get(symbol, [0.0, 0])[1]
+
+    def exposure(self):
+        """按成本计算的持仓市值"""
+        return sum(avg * qty for avg, qty in self.positions.values())
+
+    def realized_today(self, day):
+        if self.day != day:
+            self.day = day
+            self.realized = 0.0
+        return self.realized
+
+    def to_dict(self):
+        """保存到状态快照的内容"""
+        return {"positions": self.positions, "realized": self.realized,
+                "day": self.day.isoformat() if self.day else None}
+
+    def restore(self, data):
+        """从状态快照恢复"""
+        self.positions = {symbol: list(position) for symbol, position in data.get("positions", {}).items()}
+        self.realized = data.get("realized", 0.0)
+        day = data.get("day")
+        self.day = datetime.date.fromisoformat(day) if day else None
+
+    def record(self, symbol, price, qty, day):
+        """记录一笔成交，qty 为正表示买入、为负表示卖出，返回卖出的已实现盈亏"""
+        self.realized_today(day)
+        avg, held = self.positions.get(symbol, [0.0, 0])
+        pnl = 0.0
+        if qty > 0:
+            avg = (avg * held + price * qty) / (held + qty)
+        else:
+            pnl = (price - avg) * -qty
+            self.realized += pnl
+        held += qty
+        if held > 0:
+            self.positions[symbol] = [avg, held]
+        else:
+            self.positions.pop(symbol, None)
+        return pnl
+
+
+class StrategyPlugin:
+    """
+    策略插件基类
+
+    symbols: 策略关注的股票
+    capital_budget: 可占用的资金（按成本计）占账户总值的比例
+    risk_budget: 当日已实现亏损超过账户总值的这一比例后不再买入，卖出不受限制
+    """
+    name = "plugin"
+    timeframes = ()          # 需要接收收盘事件的K线周期
+    executes_orders = False  # True 表示策略自己下单，不经过宿主的预算检查
+
+    def __init__(self, symbols=None, capital_budget=1.0, risk_budget=DAILY_LOSS_LIMIT, **params):
+        self.symbols = list(symbols or [])
+        self.capital_budget = capital_budget
+        self.risk_budget = risk_budget
+        self.params = params
+        self.book = PluginBook()
+        self.capital_limit = 0.0  # 本周期可占用的资金，由宿主在周期开始时设置
+        self.host = None
+
+    def wants(self, symbol):
+        return symbol in self.symbols
+
+    def buying_power(self):
+        """本周期还能投入的资金"""
+        return max(0.0, self.capital_limit - self.book.exposure())
+
+    def on_bar(self, symbol, timeframe, bar):
+        """K线收盘"""
+
+    def on_tick(self, tick, context):
+        """收到最新行情，返回要下单的股数：正数买入、负数卖出、0 不操作"""
+        return 0
+
+
+class LegacyStrategy(StrategyPlugin):
+    """原有的分层建仓策略（strategy.process_symbol），处理 run_strategy 传入的标的和持仓"""
+    name = "legacy"
+    executes_orders = True
+
+    def on_tick(self, tick, context):
+        return _strategy().process_symbol(tick.symbol, context, tick)
+
+
+class RsiReversionStrategy(StrategyPlugin):
+    """
+    日线 RSI 均值回归
+
+    RSI 低于 oversold 时用剩余预算的 order_fraction 买入，回到 exit_level 以上时全部卖出。
+    """
+    name = "rsi_reversion"
+    timeframes = ("1d",)
+
+    def on_tick(self, tick, context):
+        period = self.params.get("period", 14)
+        value = self.host.daily_indicator(tick.symbol, "rsi", (period,), lambda closes: rsi(closes, period)[-1])
+        if value is None or value != value:
+            return 0
+
+        held = self.book.qty(tick.symbol)
+        if held > 0 and value >= self.params.get("exit_level", 55):
+            return -held
+        if held == 0 and value <= self.params.get("oversold", 30):
+            return int(self.buying_power() * self.params.get("order_fraction", 0.5) // tick.price)
+        return 0
+
+
+PLUGIN_TYPES = {cls.name: cls for cls in [LegacyStrategy, RsiReversionStrategy]}
+
+
+class PluginHost:
+    """管理同一进程内的所有策略插件，把共用的行情和K线事件分发给它们"""
+
+    def __init__(self, plugins=()):
+        self.plugins = []
+        self.bar_engine = None
+        for plugin in plugins:
+            self.register(plugin)
+
+    def register(self, plugin):
+        plugin.host = self
+        self.plugins.append(plugin)
+        return plugin
+
+    @property
+    def legacy(self):
+        return next((p for p in self.plugins if isinstance(p, LegacyStrategy)), None)
+
+    def attach(self, bar_engine):
+        """订阅K线引擎所有周期的收盘事件，每个周期只订阅一次"""
+        self.bar_engine = bar_engine
+        for timeframe in bar_engine.timeframes:
+            bar_engine.subscribe(timeframe, self.on_bar)
+
+    def books(self):
+        """各策略的账本，保存到状态快照（单次运行模式下每次运行都是新进程）"""
+        return {plugin.name: plugin.book.to_dict() for plugin in self.plugins
+                if not isinstance(plugin, LegacyStrategy)}
+
+    def restore_books(self, books):
+        for plugin in self.plugins:
+            if plugin.name in books and not isinstance(plugin, LegacyStrategy):
+                plugin.book.restore(books[plugin.name])
+
+    def symbols(self, legacy_symbols, include_plugins=True):
+        """本周期要处理的股票：原有策略的股票加上其他策略关注的股票，去重并保持顺序"""
+        symbols = list(legacy_symbols) if self.legacy is not None else []
+        if include_plugins:
+            for plugin in self.plugins:
+                if not isinstance(plugin, LegacyStrategy):
+                    symbols.extend(plugin.symbols)
+        return list(dict.fromkeys(symbols))
+
+    def begin_cycle(self, equity=None):
+        """按账户总值设置每个策略本周期的资金上限"""
+        if equity is None and any(not p.executes_orders for p in self.plugins):
+            equity = _strategy().risk_manager.get_total_equity()
+        self.equity = equity or 0.0
+        for plugin in self.plugins:
+            plugin.capital_limit = self.equity * plugin.capital_budget
+
+    def daily_indicator(self, symbol, name, params, compute):
+        """
+        基于已完成日线的指标，和原有策略共用日线数据和指标缓存
+
+        已完成的日线取自下载的日线历史（每个交易日下载一次），与均线信号和 ATR 一致。
+        """
+        try:
+            history = _strategy().completed_daily_history(symbol)
+        except Exception as e:
+            print(f"获取{symbol}日线数据出错: {e}")
+            return None
+        if not len(history):
+            return None
+        closes = history["Close"].to_numpy(dtype=float)
+        return indicator_cache.get_or_compute(symbol, name, params, history.index[-1].isoformat(),
+                                              lambda: compute(closes))
+
+    def on_bar(self, symbol, timeframe, bar):
+        for plugin in self.plugins:
+            if timeframe in plugin.timeframes and plugin.wants(symbol):
+                try:
+                    plugin.on_bar(symbol, timeframe, bar)
+                except Exception as e:
+                    metrics.count("errors")
+                    print(f"策略 {plugin.name} 处理{symbol} {timeframe}K线出错: {e}")
+
+    def on_tick(self, tick, context, legacy=True):
+        """把一次行情分发给所有关注这只股票的策略，单个策略出错不影响其他策略"""
+        results = []
+        for plugin in self.plugins:
+            if not (legacy if isinstance(plugin, LegacyStrategy) else plugin.wants(tick.symbol)):
+                continue
+            try:
+                if plugin.executes_orders:
+                    result = plugin.on_tick(tick, context)
+                else:
+                    qty = int(plugin.on_tick(tick, context) or 0)
+                    result = self._execute(plugin, tick, qty) if qty else None
+                if result:
+                    results.append(result)
+            except Exception as e:
+                metrics.count("errors")
+                _strategy().notify(f"策略 {plugin.name} 处理 {tick.symbol} 时出错: {str(e)}")
+        return results
+
+    def _execute(self, plugin, tick, qty):
+        """按策略的资金预算和风险预算检查后下单，并记入该策略的账本"""
+        strategy = _strategy()
+        symbol, price = tick.symbol, tick.price
+        day = tick.time.date()
+
+        if qty < 0:
+            qty = -min(-qty, plugin.book.qty(symbol))
+            if qty == 0:
+                return None
+            entry = plugin.book.positions[symbol][0]
+            strategy.submit_sell(symbol, -qty, price, entry, plugin.name, plugin.name)
+            strategy.risk_manager.update_position(symbol, 0, qty)
+            pnl = plugin.book.record(symbol, price, qty, day)
+            if pnl < 0:
+                strategy.risk_manager.check_daily_loss_limit(pnl)
+            strategy.notify(f"策略 {plugin.name} 卖出 {symbol} {-qty} 股，价格 {price:.2f}")
+            return {"action": "sell", "symbol": symbol, "qty": -qty, "price": price, "strategy": plugin.name,
+                    "reason": plugin.name}
+
+        if not strategy.entries_allowed(symbol):
+            return None  # 时间预算不足或行情不可用，本周期只处理卖出
+        if plugin.book.realized_today(day) <= -plugin.risk_budget * self.equity:
+            print(f"策略 {plugin.name} 已达到当日风险预算，暂停买入 {symbol}")
+            return None
+        qty = min(qty, int(plugin.buying_power() // price))
+        qty = strategy.risk_manager.check_position_size(symbol, price, qty) if qty > 0 else 0
+        if qty > 0 and strategy.order_gate is not None:
+            qty = strategy.order_gate.request_buy(symbol, price, qty)
+        if qty <= 0:
+            return None
+
+        strategy.journal.order(symbol, price, qty)
+        strategy.buy(symbol, qty)
+        strategy.trade_store.buy(symbol, qty, price, plugin.name, plugin.name)
+        strategy.risk_manager.update_position(symbol, price, qty)
+        plugin.book.record(symbol, price, qty, day)
+        strategy.notify(f"策略 {plugin.name} 买入 {symbol} {qty} 股，价格 {price:.2f}")
+        return {"action": "buy", "symbol": symbol, "qty": qty, "price": price, "strategy": plugin.name,
+                "reason": plugin.name}
+
+
+def build_plugin_host(specs=None):
+    """按配置创建插件宿主，specs 中每一项为 {"name", "symbols", "capital", "risk", "params"}"""
+    host = PluginHost()
+    for spec in (STRATEGY_PLUGINS if specs is None else specs):
+        plugin_type = PLUGIN_TYPES.get(spec["name"])
+        if plugin_type is None:
+            print(f"未知的策略插件: {spec['name']}")
+            continue
+        host.register(plugin_type(symbols=spec.get("symbols"), capital_budget=spec.get("capital", 1.0),
+                                  risk_budget=spec.get("risk", DAILY_LOSS_LIMIT), **spec.get("params", {})))
+    return host
@@ -0,0 +1,184 @@
+"""
+自适应轮询调度
+
+完整的决策周期仍然每5分钟执行一次；两个周期之间，按每只股票离最近触发价的距离和它的波动率决定多久后再检查它：
+- 触发价：止损、止盈、跟踪止损、ATR 止损、下一个加仓价位，以及使今天收盘出现均线金叉/死叉的价格
+  （券商端保护单已覆盖的止损、止盈和加仓价位不计入）
+- 预计到达触发价的时间按随机游走估计：(距离 / 日波动率)² 个交易日，日波动率为日线 ATR / 价格
+- 检查间隔为预计时间的 POLL_SAFETY 倍，限制在 [POLL_MIN_INTERVAL, POLL_MAX_INTERVAL] 之间；
+  不短于 POLL_MAX_INTERVAL 的股票等下一个完整周期检查
+
+所有股票的检查频率之和受 POLL_API_BUDGET（每分钟券商请求数）限制：超出时按比例拉长所有间隔，
+并且每分钟实际发出的请求不超过预算，离触发价近的股票仍然检查得更频繁。请求数按券商接口的实际调用计数
+（取价、持仓，以及检查中的下单、查询现金、撤销保护单），不按固定的每次检查请求数估算。
+"""
+import math
+from collections import deque
+import numpy as np
+import clock
+import strategy
+from metrics import metrics
+from config import *
+
+SESSION_SECONDS = 6.5 * 3600  # 一个交易日的秒数
+
+
+def ma_cross_price(closes, short_period=9, long_period=20):
+    """以价格 p 作为今天收盘价时，短期均线与长期均线相等的 p（均线交叉价）；日线不足时返回 None"""
+    if len(closes) < long_period:
+        return None
+    short_sum = float(np.sum(closes[len(closes) - short_period + 1:]))
+    long_sum = float(np.sum(closes[len(closes) - long_period + 1:]))
+    # (short_sum + p) / short_period == (long_sum + p) / long_period
+    price = (short_period * long_sum - long_period * short_sum) / (long_period - short_period)
+    return price if price > 0 else None
+
+
+def trigger_levels(symbol, tick):
+    """当前会触发交易的价位 {规则: 价格}"""
+    levels = {}
+    price, entry, qty = tick.price, tick.entry, tick.qty
+    state = strategy.states.get(symbol) or strategy.new_symbol_state()
+    position = strategy.risk_manager.position_data.get(symbol, {})
+    if qty > 0 and entry:
+        if strategy.protective_orders is None:
+            levels["stop_loss"] = entry * (1 + STOP_LOSS)
+            levels["take_profit"] = entry * (1 + TAKE_PROFIT)
+            # 价格高于建仓价时才检查跟踪止损，止损价不高于建仓价时跌到建仓价就不再触发
+            trailing = max(price, position.get('highest_price') or price) * (1 - TRAILING_STOP)
+            if state["entry_price"] is not None and trailing > state["entry_price"]:
+                levels["trailing_stop"] = trailing
+        if USE_ATR_STOP:
+            atr = cached_atr(symbol)
+            if atr is not None:
+                levels["atr_stop"] = entry - atr * ATR_MULTIPLIER
+        if state["entry_price"] is not None and 0 < state["layers"] < MAX_LAYERS and not strategy.ladder_enabled():
+            levels["layer_add"] = state["entry_price"] * (1 - LAYER_DROP * state["layers"])
+
+    cross = ma_cross_price(strategy.bar_engine.closes(symbol, "1d"))
+    if cross is not None:
+        levels["ma_cross"] = cross
+    return levels
+
+
+def cached_atr(symbol, period=14):
+    """已完成日线的 ATR，日线不足时返回 None（不向券商取价）"""
+    if len(strategy.bar_engine.get_bars(symbol, "1d")) <= period:
+        return None
+    return strategy.calculate_atr(symbol, period)
+
+
+def daily_volatility(symbol, price):
+    """日波动率：日线 ATR / 价格，日线不足时为 POLL_DEFAULT_VOLATILITY"""
+    atr = cached_atr(symbol)
+    if atr is None or not np.isfinite(atr) or atr <= 0:
+        return POLL_DEFAULT_VOLATILITY
+    return atr / price
+
+
+def broker_requests():
+    """进程启动以来的券商请求总数（broker.py 和模拟券商的每个接口调用都计入 broker.* 计数）"""
+    with metrics.lock:
+        return sum(n for name, n in metrics.counters.items() if name.startswith("broker."))
+
+
+class PollScheduler:
+    """按离触发价的距离和波动率安排每只股票的下一次检查"""
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL, safety=POLL_SAFETY,
+                 budget=POLL_API_BUDGET, calls_per_check=POLL_CALLS_PER_CHECK):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.safety = safety
+        self.budget = budget
+        self.prior_calls = calls_per_check
+        self.next_due = {}   # symbol -> 下一次检查的时间戳（整秒）
+        self.plan = {}       # symbol -> {"trigger", "distance", "volatility", "interval"}
+        self.used = deque()  # 最近一分钟内的检查 (时间, 实际券商请求数)
+        self.checks = 0      # 累计检查的股票数
+        self.calls = 0       # 这些检查实际发出的券商请求数
+
+    @property
+    def calls_per_check(self):
+        """每只股票一次检查的平均券商请求数（包括下单、查询现金和撤销保护单），还没有检查过时使用配置的估计"""
+        return self.calls / self.checks if self.checks else self.prior_calls
+
+    def interval(self, distance, volatility):
+        """离触发价 distance（比例）、日波动率 volatility 时的检查间隔"""
+        expected = (distance / max(volatility, 1e-6)) ** 2 * SESSION_SECONDS
+        return min(self.max_interval, max(self.min_interval, self.safety * expected))
+
+    def assess(self, symbol, tick):
+        """计算一只股票离最近触发价的距离和检查间隔"""
+        levels = trigger_levels(symbol, tick)
+        volatility = daily_volatility(symbol, tick.price)
+        if not levels:
+            return {"trigger": None, "distance": None, "volatility": volatility, "interval": self.max_interval}
+        trigger, level = min(levels.items(), key=lambda item: abs(item[1] - tick.price))
+        distance = abs(level - tick.price) / tick.price
+        return {"trigger": trigger, "distance": distance, "volatility": volatility,
+                "interval": self.interval(distance, volatility)}
+
+    def schedule(self, ticks):
+        """
+        按最新行情重新安排检查，ticks 为 {symbol: Tick}
+
+        需要在周期之间检查的股票，每分钟请求数之和超过预算时按比例拉长间隔。
+        到期时间取整到秒，虚拟时钟下等待时间不会小到无法推进时钟。
+        """
+        now = clock.time()
+        for symbol, tick in ticks.items():
+            try:
+                self.plan[symbol] = self.assess(symbol, tick)
+            except Exception as e:
+                print(f"计算 {symbol} 检查间隔出错: {e}")
+                self.plan[symbol] = {"trigger": None, "distance": None, "volatility": None,
+                                     "interval": self.max_interval}
+
+        active = set(ticks) | set(self.next_due)
+        polled = {symbol: item for symbol, item in self.plan.items()
+                  if symbol in active and item["interval"] < self.max_interval}
+        demand = sum(self.calls_per_check * 60 / item["interval"] for item in polled.values())
+        scale = max(1.0, demand / self.budget) if self.budget > 0 else float("inf")
+        for symbol in ticks:
+            interval = self.plan[symbol]["interval"]
+            if symbol in polled:
+                interval *= scale
+            if interval < self.max_interval:
+                self.next_due[symbol] = math.ceil(now + interval)
+            else:
+                self.next_due.pop(symbol, None)
+
+    def _remaining(self, now):
+        """本分钟剩余的券商请求数"""
+        while self.used and now - self.used[0][0] >= 60:
+            self.used.popleft()
+        return self.budget - sum(calls for _, calls in self.used)
+
+    def due(self):
+        """到期的股票，按到期时间先后排列，按平均请求数估计不超过本分钟剩余的预算"""
+        now = clock.time()
+        quota = max(0, int(self._remaining(now) // max(self.calls_per_check, 1e-6)))
+        symbols = sorted((when, symbol) for symbol, when in self.next_due.items() if when <= now)
+        symbols = [symbol for _, symbol in symbols[:quota]]
+        for symbol in symbols:
+            del self.next_due[symbol]
+        if symbols:
+            metrics.count("polls", len(symbols))
+        return symbols
+
+    def record(self, checks, calls):
+        """记录一次检查的股票数和实际发出的券商请求数"""
+        self.used.append((clock.time(), calls))
+        self.checks += checks
+        self.calls += calls
+
+    def next_wakeup(self):
+        """下一只股票到期的时间戳；预算用完时推迟到最早的请求满一分钟，没有待检查的股票时返回 None"""
+        if not self.next_due:
+            return None
+        when = min(self.next_due.values())
+        now = clock.time()
+        if when <= now and self._remaining(now) < self.calls_per_check and self.used:
+            return self.used[0][0] + 60
+        return when
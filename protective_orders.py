@@ -0,0 +1,167 @@
+"""
+券商端保护单
+
+持仓期间在券商处常驻一组订单，止损、止盈、跟踪止损和加仓不再依赖每个周期的轮询：
+- 卖出保护单：OCO（止盈限价单 + 止损单），止损价取固定止损、ATR 止损和跟踪止损中最高的一个，
+  每个周期按最新的最高价上移；PROTECTIVE_EXIT_MODE 为 trailing 时，跟踪止损生效后改用券商原生的跟踪止损单，
+  由券商实时跟踪最高价（此时止盈仍由轮询执行，因为同一批股票只能挂一个卖单）
+- 加仓限价单：在每个尚未触发的 LAYER_DROP 价位挂限价买单
+
+每个周期开始时只查询一次未成交订单，据此判断哪些订单已经成交；持仓变化后撤销并按新的数量重新挂单。
+"""
+import uuid
+from broker import submit_exit_orders, submit_trailing_stop, submit_limit_buy, cancel_order, get_open_orders, \
+    get_order
+from config import *
+
+ORDER_PREFIX = "qlt"  # 本程序挂出的订单 client_order_id 前缀，重启后据此清理上次遗留的订单
+
+
+def _client_order_id(symbol, kind):
+    return f"{ORDER_PREFIX}-{kind}-{symbol}-{uuid.uuid4().hex[:12]}"
+
+
+def exit_prices(entry, highest, atr=None):
+    """
+    卖出保护单的 (止损价, 止盈价)
+
+    与轮询逻辑一致：固定止损和 ATR 止损取较高者；最高价回落 TRAILING_STOP 后仍高于成本时，跟踪止损价更高则使用跟踪止损价。
+    """
+    stop = entry * (1 + STOP_LOSS)
+    if USE_ATR_STOP and atr:
+        stop = max(stop, entry - atr * ATR_MULTIPLIER)
+    trailing = highest * (1 - TRAILING_STOP)
+    if trailing > entry:
+        stop = max(stop, trailing)
+    return round(stop, 2), round(entry * (1 + TAKE_PROFIT), 2)
+
+
+class ProtectiveOrders:
+    """跟踪每只股票在券商处的保护单和加仓限价单，并与持仓保持同步"""
+
+    def __init__(self, mode=PROTECTIVE_EXIT_MODE):
+        self.mode = mode
+        self.orders = {}         # symbol -> {"exit": 订单信息或 None, "ladder": {层数: 订单信息}}
+        self.open_orders = None  # 本周期开始时券商处的未成交订单，symbol -> [订单]
+        self.adopted = set()     # 已清理过上次运行遗留订单的股票
+
+    def _book(self, symbol):
+        return self.orders.setdefault(symbol, {"exit": None, "ladder": {}})
+
+    def begin_cycle(self):
+        """每个周期开始时查询一次未成交订单"""
+        try:
+            open_orders = get_open_orders()
+        except Exception as e:
+            print(f"查询未成交订单出错: {e}")
+            self.open_orders = None
+            return
+        self.open_orders = {}
+        for order in open_orders:
+            self.open_orders.setdefault(order["symbol"], []).append(order)
+
+    def _adopt(self, symbol):
+        """第一次处理某只股票时，撤销上次运行遗留的订单（只处理自己负责的股票，分片运行时互不干扰）"""
+        self.adopted.add(symbol)
+        for order in self.open_orders.get(symbol, []):
+            if (order.get("client_order_id") or "").startswith(ORDER_PREFIX + "-"):
+                cancel_order(order["id"])
+
+    def fills(self, symbol):
+        """
+        返回上个周期以来成交的订单
+
+        每一项为 (类型, 层数, 股数, 成交价)，类型为 exit 或 ladder；已成交或已失效的订单不再跟踪。
+        """
+        if self.open_orders is None:
+            return []
+        if symbol not in self.adopted:
+            self._adopt(symbol)
+        book = self.orders.get(symbol)
+        if not book:
+            return []
+
+        open_ids = {order["id"] for order in self.open_orders.get(symbol, [])}
+        events = []
+        tracked = [("exit", None, book["exit"])] + [("ladder", layer, order) for layer, order in book["ladder"].items()]
+        for kind, layer, order in tracked:
+            if order is None or order["id"] in open_ids:
+                continue
+            status = get_order(order["id"])
+            if status["filled_qty"] > 0:
+                events.append((kind, layer, status["filled_qty"], status["filled_avg_price"]))
+            if kind == "exit":
+                book["exit"] = None
+            else:
+                del book["ladder"][layer]
+        return events
+
+    def sync_exit(self, symbol, qty, stop_price, limit_price, trailing_active=False):
+        """保证券商处有一个覆盖全部持仓的卖出保护单，数量或价格变化时撤销重挂"""
+        if symbol not in self.adopted:
+            return  # 还没清理过遗留订单（例如查询未成交订单失败），下个周期再挂
+        book = self._book(symbol)
+        if qty <= 0:
+            self._cancel_exit(book)
+            return
+
+        use_trailing = self.mode == "trailing" and trailing_active
+        # 券商原生跟踪止损单自己跟踪最高价，只有数量变化时才需要重挂
+        wanted = (qty, "trailing", TRAILING_STOP) if use_trailing else (qty, "oco", stop_price, limit_price)
+        current = book["exit"]
+        if current is not None and current["spec"] == wanted:
+            return
+
+        self._cancel_exit(book)
+        try:
+            if use_trailing:
+                order_id = submit_trailing_stop(symbol, qty, TRAILING_STOP, _client_order_id(symbol, "trail"))
+            else:
+                order_id = submit_exit_orders(symbol, qty, stop_price, limit_price, _client_order_id(symbol, "exit"))
+        except Exception as e:
+            # 刚成交的买单可能还未计入可用持仓，下个周期会重试
+            print(f"{symbol} 挂卖出保护单出错: {e}")
+            return
+        if order_id is not None:
+            book["exit"] = {"id": order_id, "spec": wanted}
+
+    def sync_ladder(self, symbol, levels):
+        """
+        保证每个加仓价位都有一笔限价买单
+
+        levels 为 {层数: (限价, 股数)}，不在 levels 中或限价变化的订单会被撤销；
+        股数只在挂单时使用，之后现金变化不会导致重挂。
+        """
+        if symbol not in self.adopted:
+            return
+        book = self._book(symbol)
+        for layer in list(book["ladder"]):
+            order = book["ladder"][layer]
+            if layer not in levels or levels[layer][0] != order["spec"][0]:
+                cancel_order(order["id"])
+                del book["ladder"][layer]
+
+        for layer, (limit_price, qty) in levels.items():
+            if layer in book["ladder"] or qty <= 0:
+                continue
+            try:
+                order_id = submit_limit_buy(symbol, qty, limit_price, _client_order_id(symbol, f"layer{layer}"))
+            except Exception as e:
+                print(f"{symbol} 挂第 {layer + 1} 层加仓单出错: {e}")
+                continue
+            if order_id is not None:
+                book["ladder"][layer] = {"id": order_id, "spec": (limit_price, qty)}
+
+    def _cancel_exit(self, book):
+        if book["exit"] is not None:
+            cancel_order(book["exit"]["id"])
+            book["exit"] = None
+
+    def cancel_all(self, symbol):
+        """撤销某只股票的全部保护单和加仓单（例如轮询逻辑要主动卖出时，先释放被保护单占用的股票）"""
+        book = self.orders.pop(symbol, None)
+        if book is None:
+            return
+        self._cancel_exit(book)
+        for order in book["ladder"].values():
+            cancel_order(order["id"])
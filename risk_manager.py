@@ -1,7 +1,8 @@
-import time
+import clock
 import datetime
 import pytz
 from broker import get_cash, get_price, get_position
+from metrics import metrics
 from config import *
 
 
@@ -40,6 +41,7 @@ class RiskManager:
                     position['cost_basis'] = 0
                     position['entry_price'] = 0
 
+    @metrics.timed("risk_check")
     def check_position_size(self, symbol, price, qty):
         """检查持仓大小是否超过限制"""
         total_equity = self.get_total_equity()
@@ -64,10 +66,11 @@ class RiskManager:
 
         return qty
 
+    @metrics.timed("risk_check")
     def check_daily_loss_limit(self, realized_loss=0):
         """检查当日亏损是否超过限制"""
         # 检查是否需要重置每日计数
-        now = datetime.datetime.now(pytz.timezone('US/Eastern'))
+        now = clock.now(pytz.timezone('US/Eastern'))
         if self.daily_reset_time is None or now.date() > self.daily_reset_time.date():
             self.daily_loss = 0
             self.daily_reset_time = now
@@ -90,6 +93,7 @@ class RiskManager:
                 position_value += current_price * pos['qty']
         return cash + position_value
 
+    @metrics.timed("risk_check")
     def calculate_position_risk(self, symbol):
         """计算特定持仓的风险值"""
         if symbol not in self.position_data or self.position_data[symbol]['qty'] <= 0:
@@ -106,7 +110,7 @@ class RiskManager:
 
     def check_market_hours(self):
         """检查当前是否在交易时段"""
-        now = datetime.datetime.now(pytz.timezone('US/Eastern'))
+        now = clock.now(pytz.timezone('US/Eastern'))
         is_weekend = now.weekday() >= 5  # 5=周六, 6=周日
 
         if is_weekend:
@@ -0,0 +1,125 @@
+import datetime
+import clock
+import numpy as np
+import pandas as pd
+import pytz
+from indicators import sma
+from config import *
+
+
+def _zscore(values):
+    """横截面标准化，忽略缺失值"""
+    mean = np.nanmean(values)
+    std = np.nanstd(values)
+    if not np.isfinite(std) or std == 0:
+        return np.where(np.isnan(values), np.nan, 0.0)
+    return (values - mean) / std
+
+
+def compute_factors(prices, fear_greed=None, momentum_period=ROTATION_MOMENTUM_PERIOD,
+                    vol_period=ROTATION_VOL_PERIOD, ma_period=ROTATION_MA_PERIOD):
+    """
+    在 (时间 × 股票) 价格矩阵上向量化计算各个因子
+
+    返回 {因子名: 每只股票的因子值数组}
+    - momentum: 动量，最近 momentum_period 日的涨幅
+    - risk_adjusted: 波动率调整后收益，最近 vol_period 日的年化收益/年化波动
+    - trend: 均线趋势，最新价相对 ma_period 日均线的偏离
+    - sentiment: 情绪，恐慌时偏好高 beta，贪婪时偏好低 beta
+    """
+    p = prices.ffill().to_numpy(dtype=float)
+    n_time = p.shape[0]
+    last = p[-1]
+
+    momentum = np.full(p.shape[1], np.nan)
+    if n_time > momentum_period:
+        momentum = last / p[-1 - momentum_period] - 1
+
+    returns = p[1:] / p[:-1] - 1
+    window = returns[-vol_period:]
+    mean_ret = np.nanmean(window, axis=0)
+    vol = np.nanstd(window, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_adjusted = np.where(vol > 0, mean_ret / vol * np.sqrt(252), np.nan)
+
+    trend = last / sma(p[-ma_period:].T, ma_period)[:, -1] - 1
+
+    # beta 相对等权组合计算
+    market = np.nanmean(window, axis=1, keepdims=True)
+    market_var = np.nanvar(market)
+    if market_var > 0:
+        beta = np.nanmean((window - np.nanmean(window, axis=0)) * (market - market.mean()), axis=0) / market_var
+    else:
+        beta = np.ones(p.shape[1])
+    fg = 50 if fear_greed is None else fear_greed
+    sentiment = beta * (50 - fg) / 50
+
+    # 历史不足的股票不参与排名
+    valid_count = np.sum(~np.isnan(prices.to_numpy(dtype=float)), axis=0)
+    insufficient = valid_count < max(momentum_period, vol_period, ma_period) + 1
+    factors = {
+        "momentum": momentum,
+        "risk_adjusted": risk_adjusted,
+        "trend": trend,
+        "sentiment": sentiment,
+    }
+    for values in factors.values():
+        values[insufficient] = np.nan
+    return factors
+
+
+def compute_scores(prices, fear_greed=None, weights=None, **kwargs):
+    """按配置的因子权重合成综合得分，返回按得分从高到低排序的 Series"""
+    weights = weights or ROTATION_SCORE_WEIGHTS
+    factors = compute_factors(prices, fear_greed, **kwargs)
+
+    score = np.zeros(prices.shape[1])
+    for name, weight in weights.items():
+        if weight:
+            score = score + weight * _zscore(factors[name])
+    return pd.Series(score, index=prices.columns).dropna().sort_values(ascending=False)
+
+
+def select_targets(prices, fear_greed=None, top_n=ROTATION_TOP_N, weighting=ROTATION_WEIGHTING, weights=None):
+    """
+    选出得分最高的 top_n 只股票及其资金权重
+
+    weighting 为 "equal" 时等权，为 "inverse_vol" 时按波动率倒数分配。
+    返回 (targets, target_weights)
+    """
+    scores = compute_scores(prices, fear_greed, weights)
+    targets = list(scores.index[:top_n])
+    if not targets:
+        return [], {}
+
+    if weighting == "inverse_vol":
+        returns = prices[targets].ffill().pct_change().iloc[-ROTATION_VOL_PERIOD:]
+        inverse_vol = 1 / returns.std().replace(0, np.nan)
+        inverse_vol = inverse_vol.fillna(inverse_vol.mean() if inverse_vol.notna().any() else 1.0)
+        raw = inverse_vol / inverse_vol.sum()
+    else:
+        raw = pd.Series(1.0 / len(targets), index=targets)
+
+    return targets, {symbol: round(float(raw[symbol]), 4) for symbol in targets}
+
+
+def rotation_due(last_rotation, now=None):
+    """判断本周是否还需要轮动（到了轮动日且本周尚未轮动）"""
+    now = now or clock.now(pytz.timezone('US/Eastern'))
+    if now.weekday() < ROTATION_WEEKDAY:
+        return False
+    if not last_rotation:
+        return True
+    last = datetime.date.fromisoformat(last_rotation)
+    return now.date().isocalendar()[:2] != last.isocalendar()[:2]
+
+
+def run_rotation(fear_greed=None, universe=None):
+    """下载候选池行情并排名，返回 (targets, target_weights)"""
+    from data_feed import fetch_price_matrix
+
+    universe = universe or ROTATION_UNIVERSE
+    prices, failed = fetch_price_matrix(universe, period=ROTATION_HISTORY_PERIOD)
+    if prices.empty:
+        return [], {}
+    return select_targets(prices, fear_greed)
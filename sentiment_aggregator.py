@@ -0,0 +1,172 @@
+"""
+多数据源情绪聚合
+
+同时请求多个情绪数据源，每次最多等待 SENTIMENT_DEADLINE 秒，把按时返回的读数合成一个 0~100 的情绪分数
+（越低越恐慌，与恐慌贪婪指数同向）：
+- cnn_api：CNN 恐慌贪婪指数接口
+- cnn_scrape：CNN 网页上的同一个指数
+- vix_term：VIX / VIX3M 期限结构，倒挂（近月高于远月）代表恐慌
+- put_call：CBOE 股票期权认沽/认购比，比值越高越恐慌
+
+每个数据源返回 (分数, 数据时间戳) 或 None。超时的请求不会被取消，之后返回的结果仍会保存下来供下次使用；
+上一次的请求还没返回时不会重复提交，因此一个卡住的连接最多占用一个线程。
+合成时每个读数的权重为 基础权重 × 0.5 ^ (数据年龄 / SENTIMENT_HALF_LIFE)，超过 SENTIMENT_MAX_AGE 的读数不参与。
+"""
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import pytz
+import requests
+import clock
+from config import *
+from market_sentiment import FearGreedIndex, fetch_cnn_api, scrape_cnn_page
+from metrics import metrics
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def _close_timestamp(day):
+    """某个交易日收盘时刻的时间戳"""
+    return EASTERN.localize(datetime.datetime.combine(day, datetime.time(16, 0))).timestamp()
+
+
+def vix_term_structure():
+    """VIX / VIX3M：比值 0.9 左右为中性，每偏离 0.1 分数变化 25"""
+    from data_feed import fetch_bars
+
+    bars, failed = fetch_bars(["^VIX", "^VIX3M"], period="1mo")
+    if failed:
+        return None
+    vix, vix3m = bars["^VIX"]["Close"].dropna(), bars["^VIX3M"]["Close"].dropna()
+    if vix.empty or vix3m.empty:
+        return None
+    ratio = float(vix.iloc[-1]) / float(vix3m.iloc[-1])
+    score = min(100.0, max(0.0, 50 - (ratio - 0.9) * 250))
+    return score, _close_timestamp(min(vix.index[-1], vix3m.index[-1]).date())
+
+
+def put_call_ratio(days=5):
+    """CBOE 股票期权认沽/认购比：0.65 左右为中性，每偏离 0.1 分数变化 20；从今天往前找最近一个有数据的交易日"""
+    if not SENTIMENT_PUT_CALL_URL:
+        return None
+    today = clock.now(EASTERN).date()
+    for offset in range(days):
+        day = today - datetime.timedelta(days=offset)
+        metrics.count("http.put_call")
+        response = requests.get(SENTIMENT_PUT_CALL_URL.format(date=day.isoformat()), timeout=SENTIMENT_HTTP_TIMEOUT)
+        if response.status_code != 200:
+            continue
+        for item in response.json().get("ratios", []):
+            if item.get("name", "").upper() == "EQUITY PUT/CALL RATIO":
+                ratio = float(item["value"])
+                return min(100.0, max(0.0, 50 - (ratio - 0.65) * 200)), _close_timestamp(day)
+    return None
+
+
+SOURCES = {
+    "cnn_api": fetch_cnn_api,
+    "cnn_scrape": scrape_cnn_page,
+    "vix_term": vix_term_structure,
+    "put_call": put_call_ratio,
+}
+
+
+class SentimentAggregator:
+    """在固定的时间预算内并发获取情绪数据并合成分数"""
+
+    def __init__(self, sources=None, weights=None, deadline=SENTIMENT_DEADLINE, half_life=SENTIMENT_HALF_LIFE,
+                 max_age=SENTIMENT_MAX_AGE, refresh_interval=SENTIMENT_REFRESH_INTERVAL):
+        weights = dict(SENTIMENT_SOURCE_WEIGHTS if weights is None else weights)
+        self.sources = {name: source for name, source in (sources or SOURCES).items() if weights.get(name, 1.0) > 0}
+        self.weights = weights
+        self.deadline = deadline
+        self.half_life = half_life
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.readings = {}  # name -> (分数, 数据时间戳, 获取时间)
+        self.pending = {}   # name -> 尚未处理结果的请求
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.sources)), thread_name_prefix="sentiment")
+        self.ratings = FearGreedIndex()
+
+    def _store(self, name, future):
+        """保存一个请求的结果；按时返回的在 collect 中处理，超时后才返回的由回调处理"""
+        with self.lock:
+            if self.pending.get(name) is not future:
+                return
+            del self.pending[name]
+        try:
+            reading = future.result()
+        except Exception as e:
+            metrics.count(f"sentiment.error.{name}")
+            print(f"获取情绪数据 {name} 出错: {e}")
+            return
+        if reading is None:
+            return
+        score, as_of = reading
+        fetched_at = clock.time()
+        with self.lock:
+            self.readings[name] = (float(score), as_of if as_of is not None else fetched_at, fetched_at)
+
+    def collect(self):
+        """
+        请求需要更新的数据源并等待最多 deadline 秒，返回合成结果
+
+        返回 {"value", "rating", "sources": {name: {"score", "age"}}, "missing": [...], "late": [...]}，
+        missing 为没有可用读数的数据源，late 为本次没有按时返回的数据源；没有任何可用读数时返回 None。
+        """
+        requested = {}
+        now = clock.time()
+        for name, source in self.sources.items():
+            with self.lock:
+                future = self.pending.get(name)
+                reading = self.readings.get(name)
+            if future is None:
+                if reading is not None and now - reading[2] < self.refresh_interval:
+                    continue
+                future = self.executor.submit(source)
+                with self.lock:
+                    self.pending[name] = future
+                future.add_done_callback(lambda f, name=name: self._store(name, f))
+            # 上一次的请求还没返回时不重复提交，本次继续等待它
+            requested[name] = future
+
+        late = []
+        if requested:
+            done, _ = wait(requested.values(), timeout=self.deadline)
+            for name, future in requested.items():
+                if future in done:
+                    self._store(name, future)
+                else:
+                    late.append(name)
+                    metrics.count(f"sentiment.late.{name}")
+        return self.composite(late)
+
+    def composite(self, late=()):
+        """按数据年龄衰减后的权重合成情绪分数"""
+        now = clock.time()
+        with self.lock:
+            readings = dict(self.readings)
+        total = weight_sum = 0.0
+        sources, missing = {}, []
+        for name in self.sources:
+            reading = readings.get(name)
+            age = now - reading[1] if reading else None
+            if reading is None or age > self.max_age:
+                missing.append(name)
+                continue
+            weight = self.weights.get(name, 1.0) * 0.5 ** (max(age, 0.0) / self.half_life)
+            total += reading[0] * weight
+            weight_sum += weight
+            sources[name] = {"score": reading[0], "age": age}
+
+        if weight_sum == 0:
+            return None
+        value = round(total / weight_sum, 1)
+        return {
+            "value": value,
+            "rating": self.ratings.get_rating_from_score(value),
+            "sources": sources,
+            "missing": missing,
+            "late": list(late),
+        }
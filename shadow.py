@@ -0,0 +1,267 @@
+"""
+影子配置评估
+
+每个决策周期结束后，用本周期的行情（strategy.last_ticks）、已完成的日线和市场状态，
+同时评估 SHADOW_GRID 中的全部参数组合，只记录模拟持仓，不下单、不另开进程：
+- 每组参数有独立的现金和持仓，持仓按 (参数组 × 股票) 存放在几个 numpy 数组中，所有参数组一起计算
+- 第 0 组为 config.py 中的当前参数，用来区分参数差异和实盘执行差异（滑点、超时跳过等）
+- 规则与 strategy.evaluate_symbol 一致：死叉、贪婪、ATR 止损、止损、止盈、跟踪止损、开仓和加仓，
+  开仓比例与 entry_rule 一致，仓位按股票权重、市场状况系数和单只股票上限计算，按整股成交
+- 均线信号按参数组中不同的均线组合分别计算一次，再按组展开；ATR 与实盘共用同一个值
+
+影子账户从第一次评估时的实盘总值开始（全部为现金），评估结果保存在 SHADOW_FILE，
+单次运行模式下每次启动接着上次的结果继续；参数网格改变后重新开始。
+"""
+import os
+import itertools
+import numpy as np
+import pandas as pd
+import strategy
+from config import *
+
+RULE_NAMES = ["stop_loss", "take_profit", "trailing_stop", "ma_short", "ma_long", "extreme_fear_boost"]
+
+
+def current_rules():
+    """config.py 中的当前参数"""
+    return {
+        "stop_loss": STOP_LOSS,
+        "take_profit": TAKE_PROFIT,
+        "trailing_stop": TRAILING_STOP,
+        "ma_short": 9,
+        "ma_long": 20,
+        "extreme_fear_boost": EXTREME_FEAR_BOOST,
+    }
+
+
+def expand_grid(grid=None):
+    """参数网格的全部组合，第 0 组为当前参数；网格中没有的参数使用当前值，返回 {参数名: 数组}"""
+    grid = SHADOW_GRID if grid is None else grid
+    base = current_rules()
+    names = [name for name in RULE_NAMES if name in grid]
+    combos = [base] + [dict(base, **dict(zip(names, values)))
+                       for values in itertools.product(*(grid[name] for name in names))]
+    return {name: np.array([combo[name] for combo in combos], dtype=float) for name in RULE_NAMES}
+
+
+class ShadowBook:
+    """所有参数组的模拟账户，数组形状为 (参数组数, 股票数)"""
+
+    def __init__(self, rules, symbols, cash):
+        self.rules = {name: np.asarray(rules[name], dtype=float) for name in RULE_NAMES}
+        self.n = len(self.rules["stop_loss"])
+        self.symbols = []
+        self.start_equity = float(cash)
+        self.cash = np.full(self.n, float(cash))
+        self.qty = np.zeros((self.n, 0))
+        self.avg_entry = np.zeros((self.n, 0))   # 持仓成本
+        self.anchor = np.zeros((self.n, 0))      # 首次买入价，加仓和跟踪止损以此为基准
+        self.highest = np.zeros((self.n, 0))
+        self.layers = np.zeros((self.n, 0))
+        self.trades = np.zeros(self.n)           # 平仓次数
+        self.wins = np.zeros(self.n)
+        self.price = np.zeros(0)
+        self.add_symbols(symbols)
+
+        # 均线组合去重，每个周期每只股票每个组合只计算一次信号
+        pairs = np.stack([self.rules["ma_short"], self.rules["ma_long"]], axis=1).astype(int)
+        self.ma_pairs, self.ma_index = np.unique(pairs, axis=0, return_inverse=True)
+        self.ma_index = self.ma_index.reshape(-1)
+
+    def add_symbols(self, symbols):
+        """加入新的股票（例如轮动后的新目标），新列为空仓"""
+        new = [symbol for symbol in symbols if symbol not in self.symbols]
+        if not new:
+            return
+        self.symbols += new
+        pad = ((0, 0), (0, len(new)))
+        for name in ["qty", "avg_entry", "anchor", "highest", "layers"]:
+            setattr(self, name, np.pad(getattr(self, name), pad))
+        self.price = np.pad(self.price, (0, len(new)))
+
+    def signals(self, closes):
+        """(参数组 × 股票) 的均线交叉信号，closes 为 {symbol: 已完成日线收盘价}"""
+        by_pair = np.zeros((len(self.ma_pairs), len(self.symbols)))
+        for j, symbol in enumerate(self.symbols):
+            series = closes.get(symbol)
+            if series is None:
+                continue
+            for k, (short, long) in enumerate(self.ma_pairs):
+                by_pair[k, j] = strategy.ma_crossover_from_closes(series, short, long)
+        return by_pair[self.ma_index]
+
+    def equity(self):
+        return self.cash + self.qty @ self.price
+
+    def update(self, prices, closes, context, atrs=None, weights=None):
+        """
+        用一个周期的行情更新所有参数组
+
+        prices 为 {symbol: 价格}，本周期没有价格的股票不交易；atrs 为 {symbol: ATR}，
+        weights 为股票权重，默认使用策略当前的 TARGET_WEIGHTS。
+        """
+        self.add_symbols(list(prices))
+        quoted = np.array([symbol in prices for symbol in self.symbols])
+        self.price = np.array([prices.get(symbol, last) for symbol, last in zip(self.symbols, self.price)])
+        price = self.price
+        rules = {name: values[:, None] for name, values in self.rules.items()}
+        ma = self.signals(closes)
+        fg = context.fg_signal if USE_FEAR_GREED_INDEX else "NEUTRAL"
+        greedy = fg in ["SELL", "STRONG_SELL"]
+
+        # 卖出：所有规则都是全部卖出，按参数组同时判断
+        held = (self.qty > 0) & quoted
+        change = np.where(held, price / np.where(held, self.avg_entry, 1.0) - 1, 0.0)
+        exit_mask = (ma == -1) & ((change > 0) | greedy)
+        if greedy:
+            exit_mask |= (change > 0) | (fg == "STRONG_SELL")
+        if USE_ATR_STOP and atrs:
+            atr = np.array([atrs.get(symbol, np.nan) for symbol in self.symbols])
+            exit_mask |= price <= self.avg_entry - atr * ATR_MULTIPLIER
+        exit_mask |= (change <= rules["stop_loss"]) | (change >= rules["take_profit"])
+        above = held & (price > self.anchor)
+        np.maximum(self.highest, np.where(above, price, 0.0), out=self.highest)
+        exit_mask |= above & ((self.highest - price) / np.where(self.highest > 0, self.highest, 1.0)
+                              >= rules["trailing_stop"])
+        exit_mask &= held
+
+        proceeds = self.qty * price * exit_mask
+        self.cash += proceeds.sum(axis=1)
+        self.trades += exit_mask.sum(axis=1)
+        self.wins += (exit_mask & (change > 0)).sum(axis=1)
+        for name in ["qty", "avg_entry", "anchor", "highest", "layers"]:
+            getattr(self, name)[exit_mask] = 0.0
+
+        # 开仓比例与 entry_rule 一致；加仓比例与 evaluate_symbol 一致
+        fear = fg in ["BUY", "STRONG_BUY"]
+        boost = rules["extreme_fear_boost"] if fg == "STRONG_BUY" else 1.0
+        entry_size = np.where(ma == 1, LAYER_SIZE * 1.2 * boost if fear else LAYER_SIZE,
+                              LAYER_SIZE * boost if fear else LAYER_SIZE * 0.8)
+        add_size = LAYER_SIZE * np.where(ma == 1, 1.3, 1.0)
+        if USE_FEAR_GREED_INDEX:
+            add_size = add_size * {"STRONG_BUY": boost, "BUY": 1.2, "SELL": 0.8, "STRONG_SELL": 0.0}.get(fg, 1.0)
+
+        held = (self.qty > 0) & quoted
+        new_entry = ~held & quoted & ~exit_mask  # 与实盘一致，卖出后下一个周期才重新开仓
+        drop = price / np.where(held, self.anchor, 1.0) - 1
+        add_layer = (held & (self.layers < MAX_LAYERS) & (drop <= -LAYER_DROP * self.layers)
+                     & (price / np.where(held, self.avg_entry, 1.0) - 1 >= -0.03))
+        percent = np.where(new_entry, entry_size, np.where(add_layer, add_size, 0.0))
+
+        # 与 order_quantity 一致：每只股票按当时剩余现金计算，按整股买入并限制单只股票的仓位
+        weights = strategy.TARGET_WEIGHTS if weights is None else weights
+        equity = self.equity()
+        for j, symbol in enumerate(self.symbols):
+            if not quoted[j] or not percent[:, j].any():
+                continue
+            weight = weights.get(symbol, 1.0 / len(self.symbols))
+            budget = self.cash * percent[:, j] * context.size_multiplier * weight
+            room = np.maximum(MAX_POSITION_SIZE * equity - self.qty[:, j] * price[j], 0.0)
+            shares = np.floor(np.minimum(budget, room) / price[j])
+            bought = shares > 0
+            total = self.qty[:, j] + shares
+            self.avg_entry[:, j] = np.where(bought, (self.avg_entry[:, j] * self.qty[:, j] + shares * price[j])
+                                            / np.where(bought, total, 1.0), self.avg_entry[:, j])
+            self.anchor[:, j] = np.where(bought & new_entry[:, j], price[j], self.anchor[:, j])
+            self.layers[:, j] += bought
+            self.qty[:, j] = total
+            self.cash -= shares * price[j]
+
+    def summary(self, live_equity=None, live_start=None):
+        """每组参数的总值、收益、平仓次数和胜率，按收益从高到低排列；传入实盘总值时加一行实盘"""
+        equity = self.equity()
+        frame = pd.DataFrame({name: values for name, values in self.rules.items()})
+        frame["ma_short"] = frame["ma_short"].astype(int)
+        frame["ma_long"] = frame["ma_long"].astype(int)
+        frame["equity"] = equity
+        frame["return"] = equity / self.start_equity - 1
+        frame["trades"] = self.trades.astype(int)
+        frame["win_rate"] = np.where(self.trades > 0, self.wins / np.maximum(self.trades, 1), np.nan)
+        frame.index = [f"shadow_{i}" for i in range(self.n)]
+        frame = frame.rename(index={"shadow_0": "current"})
+        if live_equity is not None:
+            start = live_start or self.start_equity
+            frame.loc["live", ["equity", "return"]] = [live_equity, live_equity / start - 1]
+        return frame.sort_values("return", ascending=False)
+
+    def save(self, path):
+        arrays = {f"rule_{name}": values for name, values in self.rules.items()}
+        arrays.update({name: getattr(self, name) for name in
+                       ["cash", "qty", "avg_entry", "anchor", "highest", "layers", "trades", "wins", "price"]})
+        np.savez(path, symbols=np.array(self.symbols), start_equity=self.start_equity, **arrays)
+
+    @classmethod
+    def load(cls, path, rules):
+        """读取保存的影子账户，参数网格与 rules 不同时返回 None"""
+        with np.load(path) as data:
+            saved = {name: data[f"rule_{name}"] for name in RULE_NAMES}
+            if any(saved[name].shape != np.shape(rules[name]) or not np.allclose(saved[name], rules[name])
+                   for name in RULE_NAMES):
+                return None
+            book = cls(saved, [], float(data["start_equity"]))
+            book.symbols = [str(symbol) for symbol in data["symbols"]]
+            for name in ["cash", "qty", "avg_entry", "anchor", "highest", "layers", "trades", "wins", "price"]:
+                setattr(book, name, data[name].astype(float))
+        return book
+
+
+shadow_book = None
+live_start_equity = None
+
+
+def load_book(rules, equity, path=None):
+    path = SHADOW_FILE if path is None else path
+    if path and os.path.exists(path):
+        try:
+            book = ShadowBook.load(path, rules)
+            if book is not None:
+                return book
+            print("影子配置的参数网格已改变，重新开始评估")
+        except Exception as e:
+            print(f"读取影子配置结果出错: {e}")
+    return ShadowBook(rules, strategy.TARGETS, equity)
+
+
+def cycle_inputs():
+    """本周期的共享行情：价格、已完成日线收盘价和日线 ATR（不向券商或网络请求数据）"""
+    prices, closes, atrs = {}, {}, {}
+    for symbol in strategy.TARGETS:
+        tick = strategy.last_ticks.get(symbol)
+        if tick is None:
+            continue
+        prices[symbol] = tick.price
+        closes[symbol] = strategy.bar_engine.closes(symbol, "1d")
+        if USE_ATR_STOP and len(closes[symbol]) > 14:
+            atrs[symbol] = strategy.calculate_atr(symbol)
+    return prices, closes, atrs
+
+
+def run_cycle(context, live_equity):
+    """每个决策周期结束后评估所有影子配置，返回与实盘对比的一行文字"""
+    global shadow_book, live_start_equity
+    if shadow_book is None:
+        shadow_book = load_book(expand_grid(), live_equity)
+        live_start_equity = shadow_book.start_equity
+    prices, closes, atrs = cycle_inputs()
+    if not prices:
+        return None
+    shadow_book.update(prices, closes, context, atrs)
+    if SHADOW_FILE:
+        shadow_book.save(SHADOW_FILE)
+    return format_comparison(shadow_book, live_equity / live_start_equity - 1)
+
+
+def describe(book, i):
+    rules = {name: values[i] for name, values in book.rules.items()}
+    return (f"止损{rules['stop_loss']:.0%} 止盈{rules['take_profit']:.0%} 跟踪{rules['trailing_stop']:.0%} "
+            f"均线{int(rules['ma_short'])}/{int(rules['ma_long'])} 恐慌加仓{rules['extreme_fear_boost']:g}")
+
+
+def format_comparison(book, live_return=None, top=None):
+    """当前参数、收益最高的几组参数和实盘的收益（每个周期调用，不生成完整的汇总表）"""
+    top = SHADOW_REPORT_TOP if top is None else top
+    returns = book.equity() / book.start_equity - 1
+    best = np.argsort(-returns, kind="stable")[:top]
+    return (f"影子配置 {book.n} 组: 当前参数 {returns[0]:+.2%}"
+            + (f"，实盘 {live_return:+.2%}" if live_return is not None else "")
+            + "，最佳: " + "; ".join(f"#{i}({describe(book, i)}) {returns[i]:+.2%}" for i in best))
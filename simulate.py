@@ -0,0 +1,216 @@
+"""
+历史行情模拟
+
+用虚拟时钟驱动未修改的 main.main() 主循环：交易时段判断、每5分钟的决策周期、收盘后的每小时检查、
+缓存过期和每日重置都按虚拟时间运行，一周的历史行情几秒钟就能跑完。
+
+券商替换为内存模拟券商，盘中价格由当天的日线按 开盘 → 最低/最高 → 最高/最低 → 收盘 的路径插值
+（开盘前沿用前一天收盘价，因此会出现真实的隔夜跳空）；行情历史只返回虚拟时间之前的数据。
+通知、图表、看板、事件日志和成交记录在模拟时关闭（影子配置照常评估，但不保存到文件），轮动排名需要批量下载候选池，模拟时不执行；
+恐慌贪婪指数没有历史数据，整个模拟期间使用 --fear-greed 指定的固定值。
+
+用法:
+    python simulate.py --start 2020-03-09 --days 5
+    python simulate.py --start 2025-03-03 --days 5 --fixtures
+"""
+import os
+import sys
+import argparse
+import datetime
+import contextlib
+import pandas as pd
+import pytz
+import clock
+from clock import SimulatedClock, SimulationFinished
+from config import *
+
+EASTERN = pytz.timezone('US/Eastern')
+PERIOD_DAYS = {"1d": 1, "2d": 2, "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731}
+SESSION_OPEN = datetime.time(9, 30)
+SESSION_MINUTES = 390
+
+
+def load_daily_bars(symbols, start, end, fixtures=False):
+    """获取模拟区间及之前一年的日线"""
+    bars = {}
+    for symbol in symbols:
+        if fixtures:
+            df = pd.read_csv(os.path.join("fixtures", "bars", f"{symbol.replace('^', '_')}.csv"),
+                             index_col="Date", parse_dates=True)
+        else:
+            import yfinance as yf
+            df = yf.Ticker(symbol).history(start=start - datetime.timedelta(days=400),
+                                           end=end + datetime.timedelta(days=1), auto_adjust=True)
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        bars[symbol] = df[["Open", "High", "Low", "Close", "Volume"]].sort_index()
+    return bars
+
+
+class HistoricalFeed:
+    """按虚拟时间提供价格和历史日线，同时替代 yfinance 的 Ticker 接口"""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.rows = {symbol: {ts.date(): row for ts, row in zip(df.index, df.itertuples(index=False))}
+                     for symbol, df in bars.items()}
+
+    def _completed(self, symbol, day):
+        df = self.bars[symbol]
+        return df[df.index.date < day]
+
+    def price_at(self, symbol, now):
+        """虚拟时间点的价格"""
+        day = now.date()
+        row = self.rows[symbol].get(day)
+        minutes = (now.hour * 60 + now.minute) - (SESSION_OPEN.hour * 60 + SESSION_OPEN.minute)
+        if row is None or minutes < 0:
+            completed = self._completed(symbol, day)
+            return float(completed["Close"].iloc[-1]) if len(completed) else None
+
+        progress = min(1.0, minutes / SESSION_MINUTES)
+        first, second = (row.Low, row.High) if row.Close >= row.Open else (row.High, row.Low)
+        path = [row.Open, first, second, row.Close]
+        segment = min(2, int(progress * 3))
+        fraction = progress * 3 - segment
+        return float(path[segment] + (path[segment + 1] - path[segment]) * fraction)
+
+    def history(self, symbol, period="1mo", now=None, **kwargs):
+        """虚拟时间之前的日线；交易时段内包含当天到目前为止的K线"""
+        now = now or clock.now(EASTERN)
+        day = now.date()
+        df = self._completed(symbol, day)
+        df = df[df.index.date >= day - datetime.timedelta(days=PERIOD_DAYS.get(period, 183))]
+
+        row = self.rows[symbol].get(day)
+        if row is not None and now.time() >= SESSION_OPEN:
+            price = self.price_at(symbol, now)
+            today = pd.DataFrame({"Open": [row.Open], "High": [max(row.Open, price)], "Low": [min(row.Open, price)],
+                                  "Close": [price], "Volume": [0.0]}, index=pd.DatetimeIndex([pd.Timestamp(day)]))
+            df = pd.concat([df, today])
+        return df.copy()
+
+    def prices(self, now):
+        prices = {}
+        for symbol in self.bars:
+            price = self.price_at(symbol, now)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def Ticker(self, symbol):
+        feed = self
+
+        class _Ticker:
+            def history(self, period="1mo", **kwargs):
+                return feed.history(symbol, period)
+
+        return _Ticker()
+
+
+class _NoCharts:
+    """模拟时不生成图表"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def simulate(start, end, symbols=None, cash=100000.0, fear_greed=50, fixtures=False, quiet=True):
+    """
+    在 [start, end) 的虚拟时间内运行 main.main()
+
+    返回 (交易记录, 资产历史, 通知列表)
+    """
+    import main
+    import strategy
+    import warmup
+    import shadow
+    import market_monitor as market_monitor_module
+    import risk_manager as risk_manager_module
+    import protective_orders as protective_orders_module
+    import execution as execution_module
+    from paper_broker import PaperBroker
+    from market_sentiment import FearGreedIndex
+    from sentiment_aggregator import SentimentAggregator
+
+    symbols = list(symbols or strategy.TARGETS)
+    index_symbols = [item["symbol"] for item in MARKET_REGIME_INPUTS]
+    feed = HistoricalFeed(load_daily_bars(list(dict.fromkeys(symbols + index_symbols)), start, end, fixtures))
+
+    start_time = EASTERN.localize(datetime.datetime.combine(start, datetime.time(9, 0)))
+    end_time = EASTERN.localize(datetime.datetime.combine(end, datetime.time(0, 0)))
+    broker = PaperBroker(feed.prices(start_time), cash=cash)
+    virtual_clock = SimulatedClock(start_time, end_time, on_advance=lambda now: broker.set_prices(feed.prices(now)))
+
+    notifications = []
+    fg_rating = strategy.market_monitor.fear_greed_index.get_rating_from_score(fear_greed)
+    patches = [
+        (main, "notify", notifications.append), (strategy, "notify", notifications.append),
+        (warmup, "notify", notifications.append),
+        (shadow, "SHADOW_FILE", None), (shadow, "shadow_book", None),
+        (main, "ChartGenerator", _NoCharts), (main, "METRICS_PORT", 0), (main, "DASHBOARD_PORT", 0),
+        (main, "USE_TRADE_STREAM", False), (main, "USE_ROTATION", False),
+        (main, "record_regime", lambda context: None),
+        (strategy, "yf", feed), (market_monitor_module, "yf", feed),
+        (strategy, "TARGETS", symbols), (strategy, "TARGET_WEIGHTS", {s: 1.0 / len(symbols) for s in symbols}),
+        (strategy.journal, "enabled", False), (strategy.trade_store, "enabled", False),
+        (FearGreedIndex, "get_fear_greed_index", lambda self: (fear_greed, fg_rating)),
+        (SentimentAggregator, "collect", lambda self: {"value": fear_greed, "rating": fg_rating, "sources": {},
+                                                       "missing": [], "late": []}),
+        # 虚拟时间下后台刷新应在下一次读取前完成，改为同步刷新，结果也不受线程调度影响
+        (market_monitor_module.MarketMonitor, "_refresh_in_background", market_monitor_module.MarketMonitor.refresh),
+    ]
+    saved = [(owner, name, getattr(owner, name)) for owner, name, _ in patches]
+    for owner, name, value in patches:
+        setattr(owner, name, value)
+    previous_clock = clock.install(virtual_clock)
+    broker.install(strategy, risk_manager_module, protective_orders_module, execution_module)
+
+    output = open(os.devnull, "w") if quiet else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            main.main()
+    except SimulationFinished:
+        pass
+    finally:
+        broker.uninstall()
+        clock.install(previous_clock)
+        for owner, name, value in reversed(saved):
+            setattr(owner, name, value)
+        if quiet:
+            output.close()
+    return main.transactions, main.balance_history, notifications
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="用虚拟时钟在历史行情上运行主循环")
+    parser.add_argument("--start", required=True, help="开始日期，例如 2020-03-09")
+    parser.add_argument("--days", type=int, default=5, help="模拟的自然日天数")
+    parser.add_argument("--symbols", nargs="*", help="交易标的，默认为 TARGETS")
+    parser.add_argument("--cash", type=float, default=100000.0)
+    parser.add_argument("--fear-greed", type=int, default=50, help="模拟期间使用的恐慌贪婪指数")
+    parser.add_argument("--fixtures", action="store_true", help="使用 fixtures/bars 中的离线行情")
+    parser.add_argument("--verbose", action="store_true", help="输出主循环的日志")
+    args = parser.parse_args()
+
+    start = datetime.date.fromisoformat(args.start)
+    end = start + datetime.timedelta(days=args.days)
+    started = datetime.datetime.now()
+    transactions, balance_history, notifications = simulate(
+        start, end, args.symbols, args.cash, args.fear_greed, args.fixtures, quiet=not args.verbose)
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+
+    print(f"模拟 {start} ~ {end}，耗时 {elapsed:.1f} 秒，{len(balance_history)} 个决策周期")
+    for trade in transactions:
+        print(f"  {trade['date']:%m-%d %H:%M} {trade['action']:4} {trade['symbol']:6} {trade['qty']:>6} 股 "
+              f"@ {trade['price']:.2f}")
+    if balance_history:
+        equity = pd.Series([value for _, value in balance_history])
+        drawdown = (1 - equity / equity.cummax()).max()
+        print(f"期初资产 {args.cash:.2f}，期末资产 {equity.iloc[-1]:.2f}，"
+              f"收益 {equity.iloc[-1] / args.cash - 1:.2%}，最大回撤 {drawdown:.2%}")
+    print(f"通知 {len(notifications)} 条")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,187 @@
+import json
+import os
+import time
+import datetime
+
+SNAPSHOT_FILE = "state_snapshot.json"
+SNAPSHOT_VERSION = 1
+MAX_HISTORY_ITEMS = 500  # 快照中最多保留的交易/资产历史条数
+DAILY_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]  # 快照中保存的日线列
+
+
+def _to_iso(value):
+    return value.isoformat() if isinstance(value, (datetime.datetime, datetime.date)) else value
+
+
+def _from_iso(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _history_to_dict(entry):
+    """日线历史缓存转为可以写入 JSON 的字典，日线的时间只保留日期"""
+    data = entry["data"]
+    return {
+        "date": entry["date"].isoformat(),
+        "index": [day.isoformat() for day in data.index.date],
+        "columns": {column: data[column].tolist() for column in DAILY_COLUMNS if column in data},
+    }
+
+
+def _history_from_dict(item):
+    import pandas as pd
+
+    index = pd.DatetimeIndex(pd.to_datetime(item["index"]), name="Date")
+    return pd.DataFrame(item["columns"], index=index, dtype=float)
+
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """读取状态快照，文件不存在或损坏时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            print(f"状态快照版本不匹配，忽略: {snapshot.get('version')}")
+            return {}
+        return snapshot
+    except Exception as e:
+        print(f"读取状态快照失败: {e}")
+        return {}
+
+
+def save_snapshot(snapshot, path=SNAPSHOT_FILE):
+    """原子写入状态快照，避免进程被中断时留下半个文件"""
+    snapshot = dict(snapshot, version=SNAPSHOT_VERSION, saved_at=time.time())
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'), default=_to_iso)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存状态快照失败: {e}")
+
+
+def capture_state(strategy, transactions=None, balance_history=None, last_chart_date=None):
+    """从策略模块及其风险管理器、市场监控器收集需要持久化的状态"""
+    risk_manager = strategy.risk_manager
+    market_monitor = strategy.market_monitor
+    fear_greed = market_monitor.fear_greed_index
+
+    return {
+        'states': strategy.states,
+        'global_state': strategy.global_state,
+        'ma_signal_cache': strategy.ma_signal_cache,
+        'plugin_books': strategy.plugin_host.books(),
+        # 当天下载的日线历史：单次运行模式下每次都是新进程，不保存时每次运行都要重新下载
+        'daily_history': {symbol: _history_to_dict(entry) for symbol, entry in strategy.daily_history.items()},
+        'risk': {
+            'position_data': risk_manager.position_data,
+            'daily_loss': risk_manager.daily_loss,
+            'daily_reset_time': _to_iso(risk_manager.daily_reset_time),
+        },
+        'market': {
+            'cached_data': market_monitor.cached_data,
+            'cache_time': _to_iso(market_monitor.cache_time),
+            'source_times': {label: _to_iso(when) for label, when in market_monitor.source_times.items()},
+        },
+        'fear_greed': {
+            'value': fear_greed.current_value,
+            'rating': fear_greed.current_rating,
+            'last_update': fear_greed.last_update,
+        },
+        'transactions': [dict(tx, date=_to_iso(tx['date'])) for tx in (transactions or [])[-MAX_HISTORY_ITEMS:]],
+        'balance_history': [(_to_iso(d), b) for d, b in (balance_history or [])[-MAX_HISTORY_ITEMS:]],
+        'last_chart_date': _to_iso(last_chart_date),
+    }
+
+
+def restore_state(strategy, snapshot, transactions=None, balance_history=None):
+    """把快照中的状态写回策略模块，返回上次生成日图表的日期"""
+    if not snapshot:
+        return None
+
+    for symbol, state in snapshot.get('states', {}).items():
+        strategy.states.setdefault(symbol, {}).update(state)
+    strategy.global_state.update(snapshot.get('global_state', {}))
+    if strategy.global_state.get('targets'):
+        strategy.set_targets(strategy.global_state['targets'], strategy.global_state.get('target_weights', {}))
+    strategy.ma_signal_cache.update(snapshot.get('ma_signal_cache', {}))
+    strategy.plugin_host.restore_books(snapshot.get('plugin_books', {}))
+    for symbol, item in snapshot.get('daily_history', {}).items():
+        try:
+            day = datetime.date.fromisoformat(item['date'])
+            strategy.restore_daily_history(symbol, day, _history_from_dict(item))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"恢复{symbol}日线历史失败: {e}")
+
+    risk = snapshot.get('risk', {})
+    risk_manager = strategy.risk_manager
+    risk_manager.position_data.update(risk.get('position_data', {}))
+    risk_manager.daily_loss = risk.get('daily_loss', 0)
+    reset_time = _from_iso(risk.get('daily_reset_time'))
+    if reset_time is not None:
+        risk_manager.daily_reset_time = reset_time
+
+    market = snapshot.get('market', {})
+    market_monitor = strategy.market_monitor
+    if market.get('cached_data'):
+        market_monitor.cached_data = market['cached_data']
+        market_monitor.cache_time = _from_iso(market.get('cache_time'))
+        # 旧快照没有各数据源的时间，按整体缓存时间判断是否过期
+        market_monitor.source_times = {label: _from_iso(when) for label, when in market.get('source_times', {}).items()}
+
+    fear_greed = snapshot.get('fear_greed', {})
+    if fear_greed.get('value') is not None:
+        fg_index = market_monitor.fear_greed_index
+        fg_index.current_value = fear_greed['value']
+        fg_index.current_rating = fear_greed.get('rating')
+        fg_index.last_update = fear_greed.get('last_update', 0)
+
+    if transactions is not None:
+        for tx in snapshot.get('transactions', []):
+            transactions.append(dict(tx, date=_from_iso(tx['date'])))
+    if balance_history is not None:
+        for d, b in snapshot.get('balance_history', []):
+            balance_history.append((_from_iso(d), b))
+
+    last_chart_date = _from_iso(snapshot.get('last_chart_date'))
+    return last_chart_date.date() if last_chart_date else None
+
+
+class RunLock:
+    """单次运行互斥锁，防止 cron 启动的进程相互重叠"""
+
+    def __init__(self, path="trader.lock", stale_after=600):
+        self.path = path
+        self.stale_after = stale_after
+        self.acquired = False
+
+    def acquire(self):
+        # 锁文件存在时间过长说明上次进程异常退出，直接清理
+        if os.path.exists(self.path) and time.time() - os.path.getmtime(self.path) > self.stale_after:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        self.acquired = True
+        return True
+
+    def release(self):
+        if self.acquired:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.acquired = False
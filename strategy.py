@@ -2,9 +2,21 @@ from broker import get_cash, get_price, get_position, buy, sell
 from notifier import notify
 from risk_manager import RiskManager
 from market_monitor import MarketMonitor
+from metrics import metrics
+from bar_engine import BarEngine
+from cycle_context import CycleContext, build_cycle_context
+from dashboard import dashboard
+from journal import journal
+from trade_store import trade_store
+from plugins import Tick, build_plugin_host
+from protective_orders import ProtectiveOrders, exit_prices
+from execution import ExecutionScheduler
+from deadline import CycleBudget, CircuitBreaker, run_stage
+from indicator_cache import indicator_cache, ma_crossover_signals
+from indicators import atr
 from config import *
 import time
-import datetime
+import clock
 import pytz
 import numpy as np
 import yfinance as yf
@@ -13,12 +25,16 @@ import yfinance as yf
 risk_manager = RiskManager()
 market_monitor = MarketMonitor()
 
+def new_symbol_state():
+    return {
+        "layers": 0,
+        "entry_price": None,
+        "last_check_time": None,
+    }
+
+
 # 为每个股票创建状态字典
-states = {symbol: {
-    "layers": 0,
-    "entry_price": None,
-    "last_check_time": None,
-} for symbol in TARGETS}
+states = {symbol: new_symbol_state() for symbol in TARGETS}
 
 # 全局状态
 global_state = {
@@ -26,40 +42,242 @@ global_state = {
     "current_drawdown": 0
 }
 
+# 均线交叉信号缓存，日线信号只在日线收盘时变化
+ma_signal_cache = {}
 
-def buy_with_percent_cash(symbol, percent):
-    price = get_price(symbol)
+# 下载的日线历史（不含当天），每只股票每个交易日下载一次
+daily_history = {}
+
+# 多周期K线引擎，轮询到的价格（或实时成交推送）都写入这里
+bar_engine = BarEngine()
+for _timeframe in bar_engine.timeframes:
+    bar_engine.subscribe(_timeframe, journal.bar)
+
+# 同一进程内运行的策略插件，共用上面的K线引擎
+plugin_host = build_plugin_host()
+plugin_host.attach(bar_engine)
+
+# 下单闸门：多进程运行时由风险协调器审批买单、登记卖单，单进程运行时为 None
+order_gate = None
+
+# 券商端保护单，未启用时为 None
+protective_orders = ProtectiveOrders() if USE_PROTECTIVE_ORDERS else None
 
-    # 根据恐慌贪婪指数调整仓位大小
-    adjusted_percent = market_monitor.adjust_position_size(percent)
+# 大额买单的分批执行，未启用时为 None
+executor = ExecutionScheduler() if USE_EXECUTION else None
+
+# 周期时间预算和单只股票的熔断器；last_ticks 为每只股票最近一次成功获取的行情，取价失败时沿用
+cycle_budget = None
+circuit_breaker = CircuitBreaker()
+last_ticks = {}
+last_context = None
+
+
+def set_targets(targets, target_weights):
+    """更新当前交易标的和资金权重（每周轮动时调用）"""
+    global TARGETS, TARGET_WEIGHTS
+    TARGETS = list(targets)
+    TARGET_WEIGHTS = dict(target_weights)
+    global_state["targets"] = TARGETS
+    global_state["target_weights"] = TARGET_WEIGHTS
+    for symbol in TARGETS:
+        states.setdefault(symbol, new_symbol_state())
+
+
+def apply_rotation(targets, target_weights):
+    """切换到新的标的组合，按配置卖出被轮出的持仓；首次轮动时原有的 TARGETS 不是轮动选出的，不卖出"""
+    dropped = [symbol for symbol in TARGETS if symbol not in targets]
+    set_targets(targets, target_weights)
+
+    results = []
+    if not ROTATION_SELL_DROPPED:
+        return results
+    if not global_state.get("last_rotation"):
+        if dropped:
+            print(f"首次轮动，保留未入选的持仓: {', '.join(dropped)}")
+        return results
+
+    for symbol in dropped:
+        entry, qty = get_position(symbol)
+        if qty <= 0:
+            continue
+        price = get_price(symbol)
+        submit_sell(symbol, qty, price, entry, "rotation")
+        risk_manager.update_position(symbol, 0, -qty)
+        states[symbol] = new_symbol_state()
+        notify(f"轮动卖出 {symbol} 全部 {qty} 股，价格 {price:.2f}")
+        results.append({
+            "action": "sell",
+            "symbol": symbol,
+            "qty": qty,
+            "price": price,
+            "reason": "rotation"
+        })
+    return results
+
+
+def order_quantity(symbol, percent, price, context, cash=None):
+    """按现金比例计算买入股数，并应用市场状况系数、股票权重和风险管理检查；cash 为可用现金，未传入时向券商查询"""
+    # 根据恐慌贪婪指数和市场状况调整仓位大小（本周期统一计算的系数）
+    adjusted_percent = percent * context.size_multiplier
 
     # 应用股票权重
     symbol_weight = TARGET_WEIGHTS.get(symbol, 1.0 / len(TARGETS))
     adjusted_percent *= symbol_weight
 
-    invest_cash = get_cash() * adjusted_percent
+    invest_cash = (get_cash() if cash is None else cash) * adjusted_percent
 
     # 应用风险管理检查
     raw_qty = int(invest_cash // price)
-    qty = risk_manager.check_position_size(symbol, price, raw_qty)
+    return risk_manager.check_position_size(symbol, price, raw_qty)
+
+
+def planned_quantity(symbol, reason, price):
+    """
+    盘前准备（warmup.py）预算的买入股数
+
+    只用于当天的预算，且开仓规则与预算时一致、价格与盘前价格相差不超过 WARMUP_PRICE_TOLERANCE；
+    按预算的金额换算为当前价格下的股数，每个预算只使用一次。不满足条件时返回 None，按常规方式计算。
+    """
+    warmup = global_state.get("warmup") or {}
+    if warmup.get("date") != clock.now(pytz.timezone('US/Eastern')).date().isoformat():
+        return None
+    order = warmup.get("orders", {}).pop(symbol, None)
+    if order is None or order["reason"] != reason or abs(price / order["price"] - 1) > WARMUP_PRICE_TOLERANCE:
+        return None
+    return int(order["amount"] // price)
+
+
+def entries_allowed(symbol):
+    """本周期是否还能为这只股票开仓或加仓：时间预算不足、行情用了旧数据或熔断中时只检查卖出"""
+    return (cycle_budget is None or cycle_budget.entries_allowed()) and circuit_breaker.healthy(symbol)
+
+
+def is_held(symbol):
+    """是否持有这只股票（时间预算不足或熔断时据此保证卖出检查）"""
+    return states.get(symbol, {}).get("layers", 0) > 0 or \
+        risk_manager.position_data.get(symbol, {}).get("qty", 0) > 0
+
+
+def buy_with_percent_cash(symbol, percent, context, reason="initial"):
+    """按现金比例买入，reason 为触发买入的规则，记入成交记录"""
+    if not entries_allowed(symbol):
+        print(f"{symbol} 本周期只检查卖出，跳过买入")
+        return None
+    if executor is not None and executor.active(symbol):
+        print(f"{symbol} 还有分批执行中的买单，跳过买入")
+        return None
+    price = get_price(symbol)
+    qty = planned_quantity(symbol, reason, price)
+    if qty is None:
+        qty = order_quantity(symbol, percent, price, context)
+
+    # 账户级限制由协调器统一把关
+    if qty > 0 and order_gate is not None:
+        qty = order_gate.request_buy(symbol, price, qty)
+
+    if qty > 0 and executor is not None and executor.wants(symbol, qty, price):
+        # 大额买单分批执行，成交后再记入持仓和成交记录（见 work_orders）
+        journal.order(symbol, price, qty)
+        executor.submit(symbol, qty, price, reason, bar_engine.get_bars(symbol, "15m"))
+        return {
+            "action": "buy",
+            "symbol": symbol,
+            "qty": qty,
+            "price": price,
+            "reason": reason,
+            "scheduled": True
+        }
 
     if qty > 0:
+        journal.order(symbol, price, qty)
         buy(symbol, qty)
+        trade_store.buy(symbol, qty, price, reason)
         # 更新风险管理器中的持仓数据
         risk_manager.update_position(symbol, price, qty)
         return {
             "action": "buy",
             "symbol": symbol,
             "qty": qty,
-            "price": price
+            "price": price,
+            "reason": reason
         }
     return None
 
 
+def submit_sell(symbol, qty, price, entry, reason, strategy_name="legacy"):
+    """提交卖单，并向协调器登记成交（卖出不需要审批，保证止损始终可执行）；reason 为触发卖出的规则"""
+    # 先撤销分批执行中的买单；撤销前还有新成交时，按券商的最新持仓全部卖出
+    late = executor.cancel(symbol) if executor is not None else None
+    if late:
+        late_qty, late_price, late_reason = late
+        trade_store.buy(symbol, late_qty, late_price, late_reason)
+        qty = max(qty, get_position(symbol)[1])
+    journal.order(symbol, price, -qty)
+    # 先撤销保护单，释放被占用的股票
+    if protective_orders is not None:
+        protective_orders.cancel_all(symbol)
+    sell(symbol, qty)
+    trade_store.sell(symbol, qty, price, reason, strategy_name, entry)
+    if order_gate is not None:
+        order_gate.report_sell(symbol, price, qty, entry)
+
+
+def record_execution_fill(symbol, qty, price, reason):
+    """把分批执行的子单成交记入风险管理器和成交记录"""
+    trade_store.buy(symbol, qty, price, reason)
+    risk_manager.update_position(symbol, price, qty)
+    return {
+        "action": "buy",
+        "symbol": symbol,
+        "qty": qty,
+        "price": price,
+        "reason": reason
+    }
+
+
+def work_orders():
+    """推进分批执行的母单（在两个周期之间由主循环调用），返回子单的成交信息"""
+    if executor is None:
+        return []
+    fills, finished = executor.step()
+    results = [record_execution_fill(symbol, qty, price, reason) for symbol, qty, price, reason in fills]
+    for parent in finished:
+        average = parent["cost"] / parent["filled"] if parent["filled"] else 0.0
+        notify(f"{parent['symbol']} 分批买入结束，成交 {parent['filled']}/{parent['qty']} 股，"
+               f"均价 {average:.2f}（下单时价格 {parent['price']:.2f}）")
+    return results
+
+
+@metrics.timed("indicators")
 def calculate_atr(symbol, period=14):
-    """计算ATR (平均真实波幅)"""
-    # 这里应该获取历史数据，但简化起见，使用估计值
-    # 实际使用时应当接入历史价格API获取真实ATR
+    """
+    计算ATR (平均真实波幅)
+
+    已完成的日线使用下载的日线历史，K线引擎只提供当天正在形成的日线，按 Wilder 平滑追加到最后一天。
+    """
+    try:
+        history = completed_daily_history(symbol)
+    except Exception as e:
+        print(f"获取{symbol}日线数据出错: {e}")
+        history = None
+
+    if history is not None and len(history) > period:
+        def compute():
+            return atr(history["High"].to_numpy(dtype=float), history["Low"].to_numpy(dtype=float),
+                       history["Close"].to_numpy(dtype=float), period)[-1]
+
+        value = indicator_cache.get_or_compute(symbol, "atr_daily", (period,), history.index[-1].isoformat(), compute)
+        today = bar_engine.current_bar(symbol, "1d")
+        if today is not None and today["start"].date() > history.index[-1].date():
+            prev_close = float(history["Close"].iloc[-1])
+            true_range = max(today["high"] - today["low"], abs(today["high"] - prev_close),
+                             abs(today["low"] - prev_close))
+            value = (value * (period - 1) + true_range) / period
+        if np.isfinite(value):
+            return value
+
+    # 日线不足时使用波动率估计
     price = get_price(symbol)
 
     # 为不同股票设置不同的波动率估计
@@ -72,7 +290,62 @@ def calculate_atr(symbol, period=14):
     volatility = price * volatility_estimates.get(symbol, 0.02)
     return volatility
 
-def calculate_ma_crossover(symbol, short_period=9, long_period=20):
+def load_daily_history(symbol, period="3mo"):
+    """获取日线历史数据"""
+    metrics.count("http.yfinance")
+    ticker = yf.Ticker(symbol)
+    return ticker.history(period=period)
+
+
+def completed_daily_history(symbol):
+    """
+    已完成的日线历史（不含当天），每个交易日下载一次，并用它初始化K线引擎的日线
+
+    日线指标以下载的 OHLC 为准：K线引擎的日线由轮询到的价格合成，最高价和最低价不完整。
+    下载出错时抛出异常。
+    """
+    today = clock.now(pytz.timezone('US/Eastern')).date()
+    cached = daily_history.get(symbol)
+    if cached and cached["date"] == today:
+        return cached["data"]
+
+    data = load_daily_history(symbol)
+    completed = data[data.index.date < today]
+    restore_daily_history(symbol, today, completed)
+    return completed
+
+
+def restore_daily_history(symbol, day, completed):
+    """写入 day 当天的日线历史缓存并初始化K线引擎（也用于从状态快照恢复），不是当天的数据直接丢弃"""
+    if day != clock.now(pytz.timezone('US/Eastern')).date():
+        return
+    daily_history[symbol] = {"date": day, "data": completed}
+    bar_engine.seed(symbol, "1d", completed)
+
+
+def ma_crossover_from_closes(closes, short_period=9, long_period=20):
+    """根据收盘价序列判断最后一根K线是否出现金叉/死叉"""
+    if len(closes) < max(short_period, long_period) + 2:
+        return 0  # 数据不足以计算
+
+    # 获取最新的和前一天的均线数据
+    current_short_ma = closes[-short_period:].mean()
+    current_long_ma = closes[-long_period:].mean()
+    prev_short_ma = closes[-short_period - 1:-1].mean()
+    prev_long_ma = closes[-long_period - 1:-1].mean()
+
+    # 判断金叉
+    if prev_short_ma <= prev_long_ma and current_short_ma > current_long_ma:
+        return 1
+
+    # 判断死叉
+    if prev_short_ma >= prev_long_ma and current_short_ma < current_long_ma:
+        return -1
+
+    return 0
+
+
+def calculate_ma_crossover(symbol, short_period=9, long_period=20, data=None):
     """
     计算移动平均线金叉死叉信号
 
@@ -83,48 +356,225 @@ def calculate_ma_crossover(symbol, short_period=9, long_period=20):
     """
     try:
         # 获取历史数据
-        ticker = yf.Ticker(symbol)
-        data = ticker.history(period="3mo")
-
+        if data is None:
+            data = load_daily_history(symbol)
         if len(data) < max(short_period, long_period) + 2:
             return 0  # 数据不足以计算
+        # 同一根K线内重复计算直接读取缓存，图表使用同一份结果
+        return int(ma_crossover_signals(symbol, data, short_period, long_period)['Signal'].iloc[-1])
+    except Exception as e:
+        print(f"计算均线交叉出错: {e}")
+        return 0
 
-        # 计算移动平均线
-        data[f'MA{short_period}'] = data['Close'].rolling(window=short_period).mean()
-        data[f'MA{long_period}'] = data['Close'].rolling(window=long_period).mean()
 
-        # 获取最新的和前一天的均线数据
-        current_short_ma = data[f'MA{short_period}'].iloc[-1]
-        current_long_ma = data[f'MA{long_period}'].iloc[-1]
-        prev_short_ma = data[f'MA{short_period}'].iloc[-2]
-        prev_long_ma = data[f'MA{long_period}'].iloc[-2]
+def _on_daily_bar_close(symbol, timeframe, bar):
+    """
+    日线收盘时清除基于旧K线的指标缓存
 
-        # 判断金叉
-        if prev_short_ma <= prev_long_ma and current_short_ma > current_long_ma:
-            return 1
+    收盘事件中的日线由轮询价格合成，不用来计算均线信号；下一个交易日下载包含这一天的日线历史后重新计算。
+    """
+    indicator_cache.invalidate(symbol)
 
-        # 判断死叉
-        if prev_short_ma >= prev_long_ma and current_short_ma < current_long_ma:
-            return -1
 
-        return 0
+bar_engine.subscribe("1d", _on_daily_bar_close)
+
+
+def get_ma_signal(symbol):
+    """
+    获取均线交叉信号
+
+    信号基于下载的已完成日线计算，每个交易日只计算一次，当天正在形成的日线不参与计算。
+    """
+    today = clock.now(pytz.timezone('US/Eastern')).date().isoformat()
+    cached = ma_signal_cache.get(symbol)
+    if cached and cached["date"] == today:
+        return cached["signal"]
+
+    try:
+        completed = completed_daily_history(symbol)
     except Exception as e:
-        print(f"计算均线交叉出错: {e}")
+        print(f"获取{symbol}日线数据出错: {e}")
         return 0
 
+    signal = calculate_ma_crossover(symbol, data=completed)
+    ma_signal_cache[symbol] = {
+        "date": today,
+        "bar_date": completed.index[-1].date().isoformat() if len(completed) else None,
+        "signal": signal,
+    }
+    return signal
 
-def process_symbol(symbol):
-    # 获取当前价格和持仓
-    price = get_price(symbol)
-    entry, qty = get_position(symbol)
 
-    # 获取恐慌贪婪指数信号
-    fg_signal, fg_value = market_monitor.get_fear_greed_signal()
+def fetch_tick(symbol):
+    """
+    获取当前价格和持仓，每个周期每只股票只取一次，所有策略插件共用
+
+    取价或查询持仓超时、出错时沿用最近一次的价格（不超过 PRICE_MAX_STALE 秒）和风险管理器记录的持仓，
+    并记为这只股票本周期失败，只检查卖出。
+    """
+    now = clock.now(pytz.timezone('US/Eastern'))
+    price = None
+    try:
+        with metrics.stage("market_data"):
+            price = run_stage("price", get_price, symbol)
+            entry, qty = run_stage("position", get_position, symbol)
+    except Exception as e:
+        last = last_ticks.get(symbol)
+        if last is None or (now - last.time).total_seconds() > PRICE_MAX_STALE:
+            raise
+        circuit_breaker.failure(symbol)
+        print(f"{symbol} 获取行情失败（{e}），沿用{'' if price else f' {last.time:%H:%M:%S} 的价格和'}已知持仓")
+        # 上次取行情之后的下单已记入风险管理器，优先使用那里的持仓
+        known = risk_manager.position_data.get(symbol)
+        entry, qty = (known.get('entry_price'), known['qty']) if known else (last.entry, last.qty)
+        return Tick(symbol, now, price or last.price, entry if qty > 0 else None, qty)
+
+    # 没有订阅实时成交时，用轮询到的价格合成K线
+    if not USE_TRADE_STREAM:
+        bar_engine.on_trade(symbol, now, price)
+    tick = Tick(symbol, now, price, entry, qty)
+    last_ticks[symbol] = tick
+    return tick
+
+
+def cached_ma_signal(symbol):
+    """缓存中的均线信号，没有时为 0（不触发金叉买入和死叉卖出）"""
+    return ma_signal_cache.get(symbol, {}).get("signal", 0)
+
+
+def market_context(monitor=None):
+    """本周期的市场状态；超时或出错时沿用上个周期的市场状态，没有时按中性处理"""
+    global last_context
+    now = clock.now(pytz.timezone('US/Eastern'))
+
+    def previous():
+        if last_context is not None:
+            return last_context._replace(time=now.isoformat(timespec="seconds"))
+        return CycleContext(now.isoformat(timespec="seconds"), "中性", None, None, "NEUTRAL", 1.0, 1.0)
+
+    with metrics.stage("market_conditions"):
+        last_context = run_stage("market_conditions", build_cycle_context, monitor or market_monitor, now,
+                                 fallback=previous)
+    return last_context
+
+
+def account_equity():
+    """账户总值；超时或出错时沿用上次的值"""
+    def previous():
+        if global_state.get("last_equity") is None:
+            raise RuntimeError("没有可沿用的账户总值")
+        return global_state["last_equity"]
+
+    with metrics.stage("equity"):
+        equity = run_stage("equity", risk_manager.get_total_equity, fallback=previous)
+    global_state["last_equity"] = equity
+    return equity
+
+
+def ladder_enabled():
+    """是否预挂加仓限价单；分片运行时每笔买单都要经协调器审批，不预挂"""
+    return protective_orders is not None and PROTECTIVE_LADDER and order_gate is None
+
+
+def apply_protective_fills(symbol):
+    """处理上个周期以来券商端保护单和加仓单的成交"""
+    state = states.setdefault(symbol, new_symbol_state())
+    for kind, layer, qty, price in protective_orders.fills(symbol):
+        if kind == "ladder":
+            trade_store.buy(symbol, qty, price, "ladder_fill")
+            risk_manager.update_position(symbol, price, qty)
+            state["layers"] = max(state["layers"], layer + 1)
+            notify(f"{symbol} 加仓限价单成交，第 {state['layers']} 层，加 {qty} 股，价格 {price:.2f}")
+            continue
+
+        entry = risk_manager.position_data.get(symbol, {}).get('entry_price') or price
+        trade_store.sell(symbol, qty, price, "protective_exit", entry=entry)
+        realized = (price - entry) * qty
+        if realized < 0:
+            risk_manager.check_daily_loss_limit(realized)
+        risk_manager.update_position(symbol, 0, -qty)
+        if order_gate is not None:
+            order_gate.report_sell(symbol, price, qty, entry)
+        states[symbol] = new_symbol_state()
+        notify(f"保护单成交卖出 {symbol} {qty} 股，价格 {price:.2f}，盈亏 {realized:.2f}")
+
+
+def sync_protective_orders(symbol, context, tick, result):
+    """按最新持仓同步券商端的卖出保护单和加仓限价单"""
+    price, entry, qty = tick.price, tick.entry, tick.qty
+    if result and result["action"] == "sell":
+        return  # 卖出前已撤销全部保护单
+    if result:
+        # 本周期买入过，重新查询持仓
+        entry, qty = get_position(symbol)
+    if qty <= 0:
+        protective_orders.cancel_all(symbol)
+        return
+
+    state = states.setdefault(symbol, new_symbol_state())
+    highest = max(price, risk_manager.position_data.get(symbol, {}).get('highest_price') or price)
+    atr = run_stage("indicators", calculate_atr, symbol, fallback=lambda: None) if USE_ATR_STOP else None
+    stop_price, limit_price = exit_prices(entry, highest, atr)
+    protective_orders.sync_exit(symbol, qty, stop_price, limit_price,
+                                trailing_active=highest * (1 - TRAILING_STOP) > entry)
+
+    if not ladder_enabled():
+        return
+    levels = {}
+    # 极度贪婪时暂停加仓，与轮询逻辑一致
+    if state["entry_price"] is not None and not (USE_FEAR_GREED_INDEX and context.fg_signal == "STRONG_SELL"):
+        for layer in range(max(state["layers"], 1), MAX_LAYERS):
+            limit = round(state["entry_price"] * (1 - LAYER_DROP * layer), 2)
+            # 不高于止损价的加仓价位不挂单：轮询逻辑中止损先于加仓执行
+            if limit > stop_price:
+                levels[layer] = (limit, order_quantity(symbol, LAYER_SIZE, limit, context))
+    protective_orders.sync_ladder(symbol, levels)
+
+
+def process_symbol(symbol, context, tick=None):
+    """执行单只股票的策略；启用券商端保护单时，先处理保护单成交，决策后再同步保护单"""
+    if tick is None:
+        tick = fetch_tick(symbol)
+    if protective_orders is None:
+        return evaluate_symbol(symbol, context, tick)
+
+    apply_protective_fills(symbol)
+    result = evaluate_symbol(symbol, context, tick)
+    sync_protective_orders(symbol, context, tick, result)
+    return result
+
+
+def entry_rule(ma_signal, fg_signal):
+    """空仓时触发的开仓规则和买入比例，返回 (规则, 现金比例)"""
+    fear = USE_FEAR_GREED_INDEX and fg_signal in ["BUY", "STRONG_BUY"]
+    boost = EXTREME_FEAR_BOOST if fg_signal == "STRONG_BUY" else 1.0
+    if ma_signal == 1:
+        # 恐慌区域+金叉，强买入信号，增加买入比例；仅金叉信号也买入，但比例较小
+        return ("golden_cross_fear", LAYER_SIZE * 1.2 * boost) if fear else ("golden_cross", LAYER_SIZE)
+    if fear:
+        # 恐慌区域，是买入信号
+        return "fear_buy", LAYER_SIZE * boost
+    # 常规策略买入（优先级最低），降低常规买入比例
+    return "initial", LAYER_SIZE * 0.8
+
+
+def evaluate_symbol(symbol, context, tick):
+    # 当前价格和持仓
+    price, entry, qty = tick.price, tick.entry, tick.qty
+
+    # 恐慌贪婪指数信号在周期开始时统一获取
+    fg_signal, fg_value = context.fg_signal, context.fg_value
 
     # 获取移动平均线交叉信号 (9日/20日)
-    ma_signal = calculate_ma_crossover(symbol)
+    with metrics.stage("indicators"):
+        ma_signal = run_stage("indicators", get_ma_signal, symbol, fallback=lambda: cached_ma_signal(symbol))
+
+    journal.quote(symbol, price, entry, qty)
+    journal.signal(symbol, ma_signal)
 
-    state = states[symbol]
+    state = states.setdefault(symbol, new_symbol_state())
+    dashboard.update_symbol(symbol, price=price, qty=qty, entry=entry, layers=state["layers"],
+                            ma_signal=ma_signal, fg_signal=fg_signal)
 
     # 返回结果
     result = None
@@ -135,47 +585,44 @@ def process_symbol(symbol):
             notify(f"已达到每日亏损限制，暂停交易")
             return None
 
+        reason, buy_size = entry_rule(ma_signal, fg_signal)
+
         # 金叉信号增强买入条件
         if ma_signal == 1:
             notify(f"{symbol} 检测到金叉信号，考虑买入")
 
             # 恐慌贪婪指数与金叉信号结合
-            if USE_FEAR_GREED_INDEX and fg_signal in ["BUY", "STRONG_BUY"]:
-                # 恐慌区域+金叉，强买入信号
-                buy_size = LAYER_SIZE * 1.2  # 增加买入比例
+            if reason == "golden_cross_fear":
                 if fg_signal == "STRONG_BUY":
-                    buy_size *= EXTREME_FEAR_BOOST
                     notify(f"检测到极度恐慌指数: {fg_value}与金叉共振，大幅增加{symbol}买入仓位")
 
-                result = buy_with_percent_cash(symbol, buy_size)
+                result = buy_with_percent_cash(symbol, buy_size, context, reason)
                 if result:
                     state["layers"] = 1
                     state["entry_price"] = price
                     notify(f"金叉+恐慌指数触发买入 {symbol} {result['qty']} 股，价格 {price:.2f}，恐慌指数: {fg_value}")
             else:
                 # 仅金叉信号也买入，但比例较小
-                result = buy_with_percent_cash(symbol, LAYER_SIZE)
+                result = buy_with_percent_cash(symbol, buy_size, context, reason)
                 if result:
                     state["layers"] = 1
                     state["entry_price"] = price
                     notify(f"金叉信号触发买入 {symbol} {result['qty']} 股，价格 {price:.2f}")
 
         # 原有买入逻辑，但优先级较低
-        elif USE_FEAR_GREED_INDEX and fg_signal in ["BUY", "STRONG_BUY"]:
+        elif reason == "fear_buy":
             # 恐慌区域，是买入信号
-            buy_size = LAYER_SIZE
             if fg_signal == "STRONG_BUY":
-                buy_size *= EXTREME_FEAR_BOOST
                 notify(f"检测到极度恐慌指数: {fg_value}，增加买入{symbol}仓位")
 
-            result = buy_with_percent_cash(symbol, buy_size)
+            result = buy_with_percent_cash(symbol, buy_size, context, reason)
             if result:
                 state["layers"] = 1
                 state["entry_price"] = price
                 notify(f"恐慌指数触发买入 {symbol} {result['qty']} 股，价格 {price:.2f}，恐慌指数: {fg_value}")
         else:
             # 常规策略买入（优先级最低）
-            result = buy_with_percent_cash(symbol, LAYER_SIZE * 0.8)  # 降低常规买入比例
+            result = buy_with_percent_cash(symbol, buy_size, context, reason)
             if result:
                 state["layers"] = 1
                 state["entry_price"] = price
@@ -190,7 +637,7 @@ def process_symbol(symbol):
 
             # 如果已经有盈利或在贪婪区域，死叉信号触发卖出
             if change > 0 or (USE_FEAR_GREED_INDEX and fg_signal in ["SELL", "STRONG_SELL"]):
-                sell(symbol, qty)
+                submit_sell(symbol, qty, price, entry, "death_cross")
                 risk_manager.update_position(symbol, 0, -qty)
                 notify(f"死叉信号触发卖出 {symbol} 全部 {qty} 股，价格 {price:.2f}" +
                        (f"，贪婪指数: {fg_value}" if USE_FEAR_GREED_INDEX and fg_signal in ["SELL",
@@ -200,14 +647,15 @@ def process_symbol(symbol):
                     "action": "sell",
                     "symbol": symbol,
                     "qty": qty,
-                    "price": price
+                    "price": price,
+                    "reason": "death_cross"
                 }
 
         # 原有的恐慌贪婪指数卖出逻辑
         if USE_FEAR_GREED_INDEX and fg_signal in ["SELL", "STRONG_SELL"]:
             # 在贪婪区域，是卖出信号
             if fg_signal == "STRONG_SELL" or change > 0:  # 极度贪婪或已有盈利
-                sell(symbol, qty)
+                submit_sell(symbol, qty, price, entry, "greed")
                 risk_manager.update_position(symbol, 0, -qty)
                 notify(f"贪婪指数触发卖出 {symbol} 全部 {qty} 股，价格 {price:.2f}，贪婪指数: {fg_value}")
                 state["layers"] = 0
@@ -215,15 +663,17 @@ def process_symbol(symbol):
                     "action": "sell",
                     "symbol": symbol,
                     "qty": qty,
-                    "price": price
+                    "price": price,
+                    "reason": "greed"
                 }
 
-        # ATR止损检查
-        if USE_ATR_STOP:
-            atr = calculate_atr(symbol)
+        # ATR止损检查（ATR 超时时跳过，固定止损仍然有效）
+        atr = run_stage("indicators", calculate_atr, symbol, fallback=lambda: None) if USE_ATR_STOP else None
+        if atr is not None:
+            journal.atr(symbol, atr)
             atr_stop_price = entry - (atr * ATR_MULTIPLIER)
             if price <= atr_stop_price:
-                sell(symbol, qty)
+                submit_sell(symbol, qty, price, entry, "atr_stop")
                 # 记录实现的亏损
                 realized_loss = (price - entry) * qty
                 risk_manager.check_daily_loss_limit(realized_loss)
@@ -234,12 +684,13 @@ def process_symbol(symbol):
                     "action": "sell",
                     "symbol": symbol,
                     "qty": qty,
-                    "price": price
+                    "price": price,
+                    "reason": "atr_stop"
                 }
 
         # 常规止损检查
         if change <= STOP_LOSS:
-            sell(symbol, qty)
+            submit_sell(symbol, qty, price, entry, "stop_loss")
             # 记录实现的亏损
             realized_loss = (price - entry) * qty
             risk_manager.check_daily_loss_limit(realized_loss)
@@ -250,12 +701,13 @@ def process_symbol(symbol):
                 "action": "sell",
                 "symbol": symbol,
                 "qty": qty,
-                "price": price
+                "price": price,
+                "reason": "stop_loss"
             }
 
         # 止盈检查
         elif change >= TAKE_PROFIT:
-            sell(symbol, qty)
+            submit_sell(symbol, qty, price, entry, "take_profit")
             risk_manager.update_position(symbol, 0, -qty)
             notify(f"止盈卖出 {symbol} 全部 {qty} 股，盈利 {change:.2%}")
             state["layers"] = 0
@@ -263,7 +715,8 @@ def process_symbol(symbol):
                 "action": "sell",
                 "symbol": symbol,
                 "qty": qty,
-                "price": price
+                "price": price,
+                "reason": "take_profit"
             }
 
         # 跟踪止损检查
@@ -273,7 +726,7 @@ def process_symbol(symbol):
 
             # 如果从高点回落超过跟踪止损比例，则卖出
             if (highest_price - price) / highest_price >= TRAILING_STOP:
-                sell(symbol, qty)
+                submit_sell(symbol, qty, price, entry, "trailing_stop")
                 risk_manager.update_position(symbol, 0, -qty)
                 notify(f"跟踪止损卖出 {symbol} 全部 {qty} 股，从高点 {highest_price:.2f} 回落至 {price:.2f}")
                 state["layers"] = 0
@@ -281,11 +734,12 @@ def process_symbol(symbol):
                     "action": "sell",
                     "symbol": symbol,
                     "qty": qty,
-                    "price": price
+                    "price": price,
+                    "reason": "trailing_stop"
                 }
 
-        # 判断是否加仓
-        if state["entry_price"] is not None:
+        # 判断是否加仓（已预挂加仓限价单时由券商成交）
+        if state["entry_price"] is not None and not ladder_enabled():
             drop = (price - state["entry_price"]) / state["entry_price"]
             if drop <= -LAYER_DROP * state["layers"] and state["layers"] < MAX_LAYERS:
                 # 检查是否可以根据风险管理规则加仓
@@ -317,29 +771,36 @@ def process_symbol(symbol):
                         notify(f"检测到极度贪婪指数: {fg_value}，暂停{symbol}加仓")
                         return None
 
-                    result = buy_with_percent_cash(symbol, buy_size)
+                    result = buy_with_percent_cash(symbol, buy_size, context, "layer_add")
                 else:
-                    result = buy_with_percent_cash(symbol, LAYER_SIZE * add_amount_multiplier)
+                    result = buy_with_percent_cash(symbol, LAYER_SIZE * add_amount_multiplier, context, "layer_add")
 
                 if result:
-                    risk_manager.update_position(symbol, price, result["qty"])
+                    if not result.get("scheduled"):
+                        risk_manager.update_position(symbol, price, result["qty"])
                     state["layers"] += 1
                     notify(f"{symbol} 触发加仓，第 {state['layers']} 层，加 {result['qty']} 股，当前价格 {price:.2f}")
-        else:
+        elif state["entry_price"] is None:
             # 如果 entry_price 不存在，更新为当前价格
             state["entry_price"] = price
 
     return result
 
 
-def run_strategy():
-    """运行所有股票的交易策略"""
+def run_strategy(context=None, budget=None):
+    """
+    运行所有股票的交易策略
+
+    context 为本周期的市场状态（cycle_context.CycleContext），未传入时在这里计算一次；
+    budget 为本周期的时间预算（deadline.CycleBudget），未传入时从这里开始计时
+    """
+    budget = budget or CycleBudget()
     # 检查是否在交易时段
     if not risk_manager.check_market_hours():
         return None
 
     # 更新账户总值记录以计算回撤
-    current_equity = risk_manager.get_total_equity()
+    current_equity = account_equity()
     global_state["max_equity"] = max(global_state["max_equity"], current_equity)
     global_state["current_drawdown"] = (global_state["max_equity"] - current_equity) / global_state["max_equity"] if \
     global_state["max_equity"] > 0 else 0
@@ -348,14 +809,66 @@ def run_strategy():
     if global_state["current_drawdown"] > MAX_DRAWDOWN:
         notify(f"警告: 当前回撤 {global_state['current_drawdown']:.2%} 超过限制 {MAX_DRAWDOWN:.2%}")
 
-    # 为每个股票执行策略
+    if context is None:
+        context = market_context()
+    journal.cycle(current_equity, TARGETS, TARGET_WEIGHTS)
+    journal.regime(context)
+
+    # 为每个股票执行策略，被轮出但仍有持仓的股票继续执行卖出检查
+    held = [symbol for symbol, state in states.items() if state["layers"] > 0 and symbol not in TARGETS]
+    results = process_symbols(TARGETS + held, context, current_equity, budget=budget)
+    # 盘前预算的开仓股数只用于开盘后的第一个周期
+    global_state.get("warmup", {}).pop("orders", None)
+    return results if results else None
+
+
+def poll_symbols(symbols, context=None):
+    """
+    在两个完整周期之间只检查部分股票（由 poll_scheduler.py 安排）
+
+    沿用上个周期的市场状态和账户总值，不检查回撤、不处理其他策略独有的股票。
+    """
+    if context is None:
+        context = last_context or market_context()
+    equity = global_state.get("last_equity")
+    journal.poll(equity, symbols)
+    journal.regime(context)
+    return process_symbols(symbols, context, equity, include_plugins=False)
+
+
+def process_symbols(symbols, context=None, equity=None, include_plugins=True, budget=None):
+    """
+    依次处理一组股票，单个股票出错不影响其他股票，所有股票共用同一个周期上下文
+
+    symbols 由原有策略处理，include_plugins 为 True 时其他策略插件关注的股票也一起处理；
+    每只股票只取一次行情，再分发给所有关注它的策略。equity 为账户总值，用于计算各策略的资金预算。
+    剩余时间少于 CYCLE_EXIT_RESERVE 后，以及熔断中的股票，只在有持仓时处理（只检查卖出）。
+    """
+    global cycle_budget
+    cycle_budget = budget or CycleBudget()
+    if context is None:
+        context = market_context()
+    plugin_host.begin_cycle(equity)
+    if protective_orders is not None:
+        protective_orders.begin_cycle()
+    circuit_breaker.begin_cycle()
+    trade_store.set_context(context)
+
+    legacy_symbols = set(symbols)
     results = []
-    for symbol in TARGETS:
+    for symbol in plugin_host.symbols(symbols, include_plugins):
+        if not is_held(symbol) and not entries_allowed(symbol):
+            metrics.count("skipped_symbols")
+            continue
         try:
-            result = process_symbol(symbol)
-            if result:
-                results.append(result)
+            with metrics.stage("process_symbol"):
+                tick = fetch_tick(symbol)
+                results.extend(plugin_host.on_tick(tick, context, legacy=symbol in legacy_symbols))
+            circuit_breaker.success(symbol)
         except Exception as e:
+            metrics.count("errors")
             notify(f"处理 {symbol} 时出错: {str(e)}")
-
-    return results if results else None
\ No newline at end of file
+            if circuit_breaker.failure(symbol):
+                notify(f"{symbol} 连续 {circuit_breaker.failures} 个周期处理失败，熔断 {circuit_breaker.cooldown // 60} 分钟"
+                       f"（有持仓时仍检查卖出）")
+    return results
@@ -0,0 +1,325 @@
+import math
+import time
+import clock
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import pytz
+from notifier import notify
+from market_monitor import MarketMonitor
+from cycle_context import build_cycle_context, record_regime
+from config import *
+
+
+class RiskCoordinator:
+    """账户级风险协调器：统一管理每日亏损、最大回撤、仓位集中度和购买力"""
+
+    def __init__(self):
+        self.cash = 0
+        self.equity = 0
+        self.start_equity = 0
+        self.max_equity = 0
+        self.position_values = {}
+        self.realized_pnl = 0
+        self.trading_day = None
+        self.halted_reason = None
+
+    def sync_account(self, account, position_values, trading_day):
+        """每个周期开始时用券商账户数据校准内部账本"""
+        if trading_day != self.trading_day:
+            self.trading_day = trading_day
+            self.realized_pnl = 0
+
+        self.cash = account["cash"]
+        self.equity = account["equity"]
+        self.start_equity = account["last_equity"] or account["equity"]
+        self.max_equity = max(self.max_equity, self.equity)
+        self.position_values = dict(position_values)
+        self._update_halt()
+
+    def current_drawdown(self):
+        if self.max_equity <= 0:
+            return 0
+        return (self.max_equity - self.equity) / self.max_equity
+
+    def daily_loss(self):
+        """当日亏损比例，取已实现亏损和账户净值下跌中较大者"""
+        if self.start_equity <= 0:
+            return 0
+        loss = max(-self.realized_pnl, self.start_equity - self.equity)
+        return loss / self.start_equity
+
+    def _update_halt(self):
+        if self.daily_loss() >= DAILY_LOSS_LIMIT:
+            self.halted_reason = f"当日亏损 {self.daily_loss():.2%} 超过限制 {DAILY_LOSS_LIMIT:.2%}"
+        elif self.current_drawdown() > MAX_DRAWDOWN:
+            self.halted_reason = f"当前回撤 {self.current_drawdown():.2%} 超过限制 {MAX_DRAWDOWN:.2%}"
+        else:
+            self.halted_reason = None
+
+    def request_buy(self, symbol, price, qty):
+        """审批买单，返回批准的股数（0 表示拒绝）"""
+        if self.halted_reason or price <= 0:
+            return 0
+
+        # 购买力限制
+        qty = min(qty, int(self.cash // price))
+
+        # 仓位集中度限制
+        invested = sum(self.position_values.values())
+        room = self.equity * MAX_CONCENTRATION - invested
+        qty = min(qty, int(room // price)) if room > 0 else 0
+
+        if qty <= 0:
+            return 0
+
+        # 预留资金，避免多个工作进程同时用掉同一笔现金
+        notional = qty * price
+        self.cash -= notional
+        self.position_values[symbol] = self.position_values.get(symbol, 0) + notional
+        return qty
+
+    def report_sell(self, symbol, price, qty, entry):
+        """登记卖出成交，更新现金、持仓和已实现盈亏"""
+        proceeds = price * qty
+        self.cash += proceeds
+        self.position_values[symbol] = max(0, self.position_values.get(symbol, 0) - proceeds)
+        if entry:
+            self.realized_pnl += (price - entry) * qty
+        self._update_halt()
+
+    def status(self):
+        return {
+            "cash": self.cash,
+            "equity": self.equity,
+            "daily_loss": self.daily_loss(),
+            "drawdown": self.current_drawdown(),
+            "halted_reason": self.halted_reason,
+        }
+
+
+class CoordinatorGate:
+    """工作进程侧的下单闸门，通过管道与协调器通信"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def request_buy(self, symbol, price, qty):
+        self.conn.send(("buy", symbol, price, qty))
+        return self.conn.recv()
+
+    def report_sell(self, symbol, price, qty, entry):
+        self.conn.send(("sell", symbol, price, qty, entry))
+
+
+def _coordinator_main(conns):
+    """协调器进程：轮询所有管道并逐条处理请求"""
+    coordinator = RiskCoordinator()
+    conns = list(conns)
+    while conns:
+        for conn in wait(conns):
+            try:
+                message = conn.recv()
+            except EOFError:
+                conns.remove(conn)
+                continue
+
+            kind = message[0]
+            if kind == "buy":
+                conn.send(coordinator.request_buy(*message[1:]))
+            elif kind == "sell":
+                coordinator.report_sell(*message[1:])
+            elif kind == "sync":
+                coordinator.sync_account(*message[1:])
+                conn.send(coordinator.status())
+            elif kind == "status":
+                conn.send(coordinator.status())
+            elif kind == "stop":
+                return
+
+
+def _worker_main(symbols, control, gate_conn):
+    """工作进程：每收到一次周期指令，处理自己分片内的股票"""
+    import strategy
+
+    strategy.order_gate = CoordinatorGate(gate_conn)
+    # 多个进程不能写同一个日志文件和成交记录（追加写入和字典编码都不是进程安全的），分片模式下不记录
+    strategy.journal.enabled = False
+    strategy.trade_store.enabled = False
+    # 工作进程只在收到周期指令时运行，无法在周期之间推进子单，买单一次下单
+    strategy.executor = None
+    while True:
+        message = control.recv()
+        if message[0] == "stop":
+            break
+        if message[0] == "cycle":
+            try:
+                # 其他策略插件只处理本分片内的股票，避免同一只股票在多个进程中重复下单
+                control.send(strategy.process_symbols(symbols, message[1], include_plugins=False))
+            except Exception as e:
+                print(f"工作进程处理分片出错: {e}")
+                control.send([])
+
+
+class Supervisor:
+    """把股票池分片到多个工作进程执行，并由独立的协调器进程管理账户级风险"""
+
+    def __init__(self, universe=None, shard_size=SHARD_SIZE, max_workers=MAX_WORKER_PROCESSES):
+        self.universe = list(universe or UNIVERSE)
+        worker_count = min(max_workers, max(1, math.ceil(len(self.universe) / shard_size)))
+        # 轮流分配，使每个分片大小接近
+        self.shards = [self.universe[i::worker_count] for i in range(worker_count)]
+        self.coordinator = None
+        self.workers = []   # 与 shards 一一对应的工作进程
+        self.controls = []
+        # 工作进程与协调器之间的管道，监督进程保留工作进程一端，重启工作进程时沿用
+        self.gates = []
+        self.coordinator_conn = None
+        self.market_monitor = MarketMonitor()
+        # 使用 spawn，避免子进程继承父进程中的 HTTP 连接
+        self.ctx = mp.get_context("spawn")
+
+    def start(self):
+        coordinator_ends = []
+        supervisor_end, coordinator_end = self.ctx.Pipe()
+        self.coordinator_conn = supervisor_end
+        coordinator_ends.append(coordinator_end)
+
+        for _ in self.shards:
+            gate_end, coordinator_end = self.ctx.Pipe()
+            coordinator_ends.append(coordinator_end)
+            self.gates.append(gate_end)
+
+        self.coordinator = self.ctx.Process(target=_coordinator_main, args=(coordinator_ends,), daemon=True)
+        self.coordinator.start()
+
+        self.workers = [None] * len(self.shards)
+        self.controls = [None] * len(self.shards)
+        for index in range(len(self.shards)):
+            self._start_worker(index)
+
+        print(f"已启动 {len(self.shards)} 个工作进程，共 {len(self.universe)} 只股票")
+
+    def _start_worker(self, index):
+        """启动第 index 个分片的工作进程；控制管道每次新建，进程退出后监督进程一端读到 EOF"""
+        gate = self.gates[index]
+        # 上一个进程退出前可能留下没有读取的审批回复
+        while gate.poll():
+            gate.recv()
+
+        control_end, worker_control = self.ctx.Pipe()
+        worker = self.ctx.Process(target=_worker_main, args=(self.shards[index], worker_control, gate), daemon=True)
+        worker.start()
+        worker_control.close()
+        self.workers[index] = worker
+        self.controls[index] = control_end
+
+    def _restart_worker(self, index, reason):
+        """结束并重启出问题的分片，该分片本周期的股票不处理"""
+        worker = self.workers[index]
+        if worker.is_alive():
+            worker.terminate()
+        worker.join(timeout=5)
+        self.controls[index].close()
+        print(f"分片 {index} 的工作进程{reason}，重启工作进程")
+        notify(f"分片 {index} 的工作进程{reason}，本周期跳过 {len(self.shards[index])} 只股票，已重启")
+        self._start_worker(index)
+
+    def dispatch(self, context):
+        """
+        把周期指令发给所有分片并汇总交易结果
+
+        所有分片共用 SHARD_CYCLE_TIMEOUT 秒的等待时间。工作进程已退出或超时没有回复时，
+        结束并重启该分片的工作进程，本周期跳过该分片，其他分片的结果照常返回。
+        """
+        failed = {}
+        for index, control in enumerate(self.controls):
+            try:
+                control.send(("cycle", context))
+            except (BrokenPipeError, OSError):
+                failed[index] = "已退出"
+
+        results = []
+        deadline = time.time() + SHARD_CYCLE_TIMEOUT
+        for index, control in enumerate(self.controls):
+            if index in failed:
+                continue
+            while True:
+                if control.poll(min(1.0, max(0.0, deadline - time.time()))):
+                    try:
+                        results.extend(control.recv())
+                    except EOFError:
+                        failed[index] = "已退出"
+                    break
+                if not self.workers[index].is_alive():
+                    failed[index] = "已退出"
+                    break
+                if time.time() >= deadline:
+                    failed[index] = f"超过 {SHARD_CYCLE_TIMEOUT} 秒没有返回结果"
+                    break
+
+        for index, reason in sorted(failed.items()):
+            self._restart_worker(index, reason)
+        return results
+
+    def run_cycle(self):
+        """执行一个周期：同步账户，通知所有分片并行处理，汇总交易结果"""
+        from broker import get_account_summary, get_position_values
+
+        trading_day = clock.now(pytz.timezone('US/Eastern')).date().isoformat()
+        self.coordinator_conn.send(("sync", get_account_summary(), get_position_values(), trading_day))
+        status = self.coordinator_conn.recv()
+        if status["halted_reason"]:
+            print(f"协调器暂停新开仓: {status['halted_reason']}")
+
+        # 市场状态只计算一次，所有分片使用相同的上下文
+        context = build_cycle_context(self.market_monitor)
+        record_regime(context)
+        return self.dispatch(context), status
+
+    def stop(self):
+        for control in self.controls:
+            try:
+                control.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        if self.coordinator_conn is not None:
+            try:
+                self.coordinator_conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in [self.coordinator] + self.workers:
+            if process is not None:
+                process.join(timeout=5)
+
+
+def main():
+    from risk_manager import RiskManager
+
+    risk_manager = RiskManager()
+    supervisor = Supervisor()
+    supervisor.start()
+    notify(f"分片交易系统已启动，{len(supervisor.shards)} 个工作进程，股票池 {len(supervisor.universe)} 只")
+
+    try:
+        while True:
+            try:
+                if not risk_manager.check_market_hours():
+                    clock.sleep(3600)
+                    continue
+
+                started = time.time()
+                results, status = supervisor.run_cycle()
+                print(f"本周期完成 {len(results)} 笔交易，耗时 {time.time() - started:.1f} 秒，"
+                      f"当日亏损 {status['daily_loss']:.2%}，回撤 {status['drawdown']:.2%}")
+                clock.sleep(300)
+            except Exception as e:
+                print(f"系统错误: {str(e)}\n{traceback.format_exc()}")
+                notify(f"分片交易系统出错: {str(e)}")
+                clock.sleep(300)
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
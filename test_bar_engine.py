@@ -0,0 +1,61 @@
+import unittest
+import datetime
+import pytz
+from bar_engine import BarEngine
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def at(hour, minute, second=0, day=3):
+    return EASTERN.localize(datetime.datetime(2024, 6, day, hour, minute, second))
+
+
+class BarEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = BarEngine()
+        self.events = []
+        for timeframe in ["1m", "5m", "1d"]:
+            self.engine.subscribe(timeframe, lambda symbol, tf, bar: self.events.append((tf, bar["close"])))
+
+    def test_minute_bar_ohlc(self):
+        """1分钟K线的开高低收应该正确"""
+        for second, price in [(0, 10.0), (10, 12.0), (20, 9.0), (50, 11.0)]:
+            self.engine.on_trade("SOXL", at(9, 30, second), price, 100)
+        self.engine.on_trade("SOXL", at(9, 31), 11.5, 100)
+
+        bars = self.engine.get_bars("SOXL", "1m")
+        self.assertEqual(len(bars), 1)
+        bar = bars[0]
+        self.assertEqual((bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"]),
+                         (10.0, 12.0, 9.0, 11.0, 400))
+
+    def test_rollup_only_on_close(self):
+        """5分钟K线只在整个周期结束后才触发收盘事件"""
+        for minute in range(30, 36):
+            self.engine.on_trade("SOXL", at(9, minute), 10.0 + minute - 30)
+        self.assertNotIn("5m", [tf for tf, _ in self.events])
+
+        self.engine.on_trade("SOXL", at(9, 36), 20.0)
+        five_minute = [close for tf, close in self.events if tf == "5m"]
+        self.assertEqual(five_minute, [14.0])
+        bar = self.engine.get_bars("SOXL", "5m")[0]
+        self.assertEqual((bar["open"], bar["high"], bar["low"]), (10.0, 14.0, 10.0))
+
+    def test_flush_closes_daily_bar(self):
+        """收盘后 flush 应该关闭当天的日线"""
+        self.engine.on_trade("SOXL", at(15, 59), 30.0)
+        self.engine.flush(at(16, 5))
+        self.assertIn(("1d", 30.0), self.events)
+        self.assertEqual(list(self.engine.closes("SOXL", "1d")), [30.0])
+
+    def test_ring_buffer_is_bounded(self):
+        """每个周期的缓冲区大小固定"""
+        engine = BarEngine(buffer_sizes={"1m": 5})
+        for minute in range(20):
+            engine.on_trade("SOXL", at(10, minute), float(minute))
+        self.assertEqual(len(engine.get_bars("SOXL", "1m")), 5)
+        self.assertEqual(engine.get_bars("SOXL", "1m")[-1]["close"], 18.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import tempfile
+import shutil
+import pandas as pd
+from cassette import Cassette, CassetteMissError, CassetteReplayError
+
+
+class CassetteTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="cassette_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def record_and_reload(self, calls):
+        recorder = Cassette(self.path, "record")
+        for namespace, name, key, func in calls:
+            try:
+                recorder.play(namespace, name, key, func)
+            except ValueError:
+                pass
+        recorder.save()
+        return Cassette(self.path, "replay")
+
+    def test_replay_in_recorded_order(self):
+        """同一参数的多次调用按录制顺序返回"""
+        prices = iter([10.0, 10.5, 11.0])
+        player = self.record_and_reload(
+            [("broker", "get_price", [["SOXL"], {}], lambda: next(prices)) for _ in range(3)])
+
+        replayed = [player.play("broker", "get_price", [["SOXL"], {}], None) for _ in range(4)]
+        self.assertEqual(replayed, [10.0, 10.5, 11.0, 11.0])
+
+    def test_dataframe_and_tuple_roundtrip(self):
+        """K线数据和元组返回值应该原样回放"""
+        df = pd.DataFrame({"Close": [1.0, 2.0], "Volume": [100.0, 200.0]},
+                          index=pd.to_datetime(["2024-06-03", "2024-06-04"]))
+        player = self.record_and_reload([
+            ("yfinance", "history", ["SOXL"], lambda: df),
+            ("broker", "get_position", ["SOXL"], lambda: (25.5, 10)),
+        ])
+
+        replayed = player.play("yfinance", "history", ["SOXL"], None)
+        pd.testing.assert_frame_equal(replayed, df, check_names=False, check_freq=False)
+        self.assertEqual(player.play("broker", "get_position", ["SOXL"], None), (25.5, 10))
+
+    def test_errors_are_replayed(self):
+        """录制时的异常在回放时同样抛出"""
+        def failing():
+            raise ValueError("boom")
+
+        player = self.record_and_reload([("http", "get", ["https://example.com"], failing)])
+        with self.assertRaises(CassetteReplayError):
+            player.play("http", "get", ["https://example.com"], None)
+
+    def test_missing_record_raises(self):
+        """回放时没有记录不应访问网络，而是直接报错"""
+        player = self.record_and_reload([])
+        with self.assertRaises(CassetteMissError):
+            player.play("broker", "get_cash", [[], {}], lambda: self.fail("不应调用真实接口"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import datetime
+import pytz
+import clock
+from clock import SimulatedClock, SimulationFinished
+from risk_manager import RiskManager
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def at(day, hour, minute=0):
+    return EASTERN.localize(datetime.datetime(2025, 3, day, hour, minute))
+
+
+class ClockTests(unittest.TestCase):
+    def tearDown(self):
+        clock.install(clock.WallClock())
+
+    def test_sleep_advances_virtual_time(self):
+        """sleep 立即推进虚拟时间并通知回调，超过终点时结束模拟"""
+        seen = []
+        virtual = SimulatedClock(at(3, 9, 0), end=at(3, 10, 0), on_advance=seen.append)
+        clock.install(virtual)
+        clock.sleep(1800)
+        self.assertEqual(clock.now(EASTERN), at(3, 9, 30))
+        self.assertEqual(clock.time(), at(3, 9, 30).timestamp())
+        self.assertEqual(seen, [at(3, 9, 30)])
+        with self.assertRaises(SimulationFinished):
+            clock.sleep(3600)
+
+    def test_risk_manager_follows_clock(self):
+        """交易时段判断和每日亏损重置使用注入的时钟"""
+        virtual = SimulatedClock(at(7, 15, 55))
+        clock.install(virtual)
+        manager = RiskManager()
+        self.assertTrue(manager.check_market_hours())
+        manager.check_daily_loss_limit(-500)
+        self.assertEqual(manager.daily_loss, -500)
+
+        virtual.advance(600)
+        self.assertFalse(manager.check_market_hours())
+        virtual.advance(3 * 24 * 3600)
+        manager.check_daily_loss_limit()
+        self.assertEqual(manager.daily_loss, 0)
+
+    def test_simulated_day_runs_main_loop(self):
+        """主循环在虚拟时钟下跑完一个交易日：9:00 盘前准备，9:30 开盘起每5分钟一个周期，收盘后按小时检查"""
+        import main
+        from simulate import simulate
+
+        main.transactions.clear()
+        main.balance_history.clear()
+        transactions, balance_history, notifications = simulate(
+            datetime.date(2025, 3, 3), datetime.date(2025, 3, 4), fixtures=True)
+        self.assertEqual(len(balance_history), 79)
+        self.assertTrue(any(message.startswith("盘前准备完成") for message in notifications))
+        self.assertTrue(transactions)
+        self.assertIs(type(clock._clock), clock.WallClock)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import time
+import datetime
+import threading
+import unittest
+import pytz
+import clock
+import deadline
+import strategy
+import risk_manager as risk_manager_module
+from clock import SimulatedClock
+from cycle_context import CycleContext
+from deadline import CircuitBreaker, CycleBudget, StageTimeout, run_stage
+from paper_broker import PaperBroker
+from plugins import PluginHost, LegacyStrategy
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+class RunStageTests(unittest.TestCase):
+    def setUp(self):
+        self.saved_timeouts = dict(deadline.STAGE_TIMEOUTS)
+        deadline.STAGE_TIMEOUTS["price"] = 0.1
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        deadline.STAGE_TIMEOUTS.clear()
+        deadline.STAGE_TIMEOUTS.update(self.saved_timeouts)
+
+    def test_timeout_uses_fallback(self):
+        """超时的阶段使用备用值，没有备用值时抛出 StageTimeout"""
+        started = time.perf_counter()
+        self.assertEqual(run_stage("price", self.release.wait, 5, fallback=lambda: 30.0), 30.0)
+        with self.assertRaises(StageTimeout):
+            run_stage("price", self.release.wait, 5)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(run_stage("price", lambda: 31.0, fallback=lambda: 30.0), 31.0)
+
+    def test_circuit_breaker(self):
+        """连续失败后熔断，熔断结束后再失败一次立即重新熔断，成功一次恢复"""
+        virtual = SimulatedClock(EASTERN.localize(datetime.datetime(2024, 6, 3, 10, 0)))
+        previous = clock.install(virtual)
+        try:
+            breaker = CircuitBreaker(failures=3, cooldown=600)
+            for _ in range(2):
+                breaker.begin_cycle()
+                self.assertFalse(breaker.failure("SOXL"))
+            breaker.begin_cycle()
+            self.assertTrue(breaker.failure("SOXL"))
+            self.assertFalse(breaker.allow("SOXL"))
+
+            virtual.advance(601)
+            breaker.begin_cycle()
+            self.assertTrue(breaker.allow("SOXL"))
+            self.assertTrue(breaker.failure("SOXL"))
+
+            virtual.advance(601)
+            breaker.begin_cycle()
+            breaker.success("SOXL")
+            self.assertTrue(breaker.healthy("SOXL"))
+            self.assertFalse(breaker.failure("SOXL"))
+        finally:
+            clock.install(previous)
+
+
+class CycleDeadlineTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = PaperBroker({"SOXL": 30.0, "NVDA": 100.0}, cash=100000.0)
+        self.saved = {name: getattr(strategy, name) for name in
+                      ["get_ma_signal", "calculate_atr", "notify", "TARGETS", "TARGET_WEIGHTS", "plugin_host",
+                       "circuit_breaker"]}
+        self.saved_market_hours = strategy.risk_manager.check_market_hours
+        self.saved_enabled = strategy.journal.enabled, strategy.trade_store.enabled
+        self.saved_timeouts = dict(deadline.STAGE_TIMEOUTS)
+        deadline.STAGE_TIMEOUTS["position"] = 0.1
+        strategy.get_ma_signal = lambda symbol: 0
+        strategy.calculate_atr = lambda symbol, period=14: 0.0
+        strategy.notify = lambda content: None
+        strategy.TARGETS = ["SOXL", "NVDA"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 0.5, "NVDA": 0.5}
+        strategy.plugin_host = PluginHost([LegacyStrategy()])
+        strategy.circuit_breaker = CircuitBreaker()
+        strategy.risk_manager.check_market_hours = lambda: True
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.states.clear()
+        strategy.last_ticks.clear()
+        strategy.risk_manager.position_data = {}
+        self.broker.install(strategy, risk_manager_module)
+        self.context = CycleContext("2024-06-03T10:00:00-04:00", "中性", 50, "Neutral", "HOLD", 1.0, 1.0)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.broker.uninstall()
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        strategy.risk_manager.check_market_hours = self.saved_market_hours
+        strategy.journal.enabled, strategy.trade_store.enabled = self.saved_enabled
+        deadline.STAGE_TIMEOUTS.clear()
+        deadline.STAGE_TIMEOUTS.update(self.saved_timeouts)
+        strategy.states.clear()
+        strategy.last_ticks.clear()
+
+    def test_stuck_position_query_still_exits(self):
+        """持仓查询卡住时沿用上次的持仓，止损照常执行，同一周期不再买入这只股票"""
+        strategy.process_symbols(["SOXL"], self.context)
+        qty = self.broker.positions["SOXL"][1]
+
+        paper_get_position = strategy.get_position
+        strategy.get_position = lambda symbol: self.release.wait(5) if symbol == "SOXL" else paper_get_position(symbol)
+        self.broker.set_prices({"SOXL": 28.0})
+        started = time.perf_counter()
+        results = strategy.process_symbols(["SOXL", "NVDA"], self.context)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual([(r["action"], r["symbol"], r["qty"]) for r in results],
+                         [("sell", "SOXL", qty), ("buy", "NVDA", results[1]["qty"])])
+        self.assertFalse(strategy.entries_allowed("SOXL"))
+        self.assertTrue(strategy.entries_allowed("NVDA"))
+
+    def test_exhausted_budget_only_checks_exits(self):
+        """时间预算不足时跳过没有持仓的股票，持仓的卖出检查仍然执行"""
+        strategy.process_symbols(["SOXL"], self.context)
+        self.broker.set_prices({"SOXL": 28.0})
+        results = strategy.process_symbols(["SOXL", "NVDA"], self.context, budget=CycleBudget(budget=0))
+        self.assertEqual([(r["action"], r["symbol"]) for r in results], [("sell", "SOXL")])
+        self.assertNotIn("NVDA", self.broker.positions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import datetime
+import unittest
+import numpy as np
+import pytz
+import clock
+import strategy
+import execution
+import risk_manager as risk_manager_module
+from clock import SimulatedClock
+from cycle_context import CycleContext
+from paper_broker import PaperBroker
+from execution import ExecutionScheduler, volume_profile, slice_targets
+
+EASTERN = pytz.timezone('US/Eastern')
+START = EASTERN.localize(datetime.datetime(2025, 3, 3, 10, 0))
+CONTEXT = CycleContext(START.isoformat(), "中性", 50, "Neutral", "NEUTRAL", 1.0, 1.0)
+
+
+def bar(hour, minute, volume):
+    return {"start": EASTERN.localize(datetime.datetime(2025, 2, 28, hour, minute)), "open": 1.0, "high": 1.0,
+            "low": 1.0, "close": 1.0, "volume": volume}
+
+
+class VolumeProfileTests(unittest.TestCase):
+    def test_vwap_follows_intraday_volume(self):
+        """VWAP 按成交量分布分配时间片，没有成交量数据时均匀分配"""
+        profile = volume_profile([bar(9, 30, 300.0), bar(9, 45, 100.0), bar(16, 0, 500.0)])
+        self.assertAlmostEqual(profile[0], 0.75)
+        self.assertAlmostEqual(profile[1], 0.25)
+        self.assertIsNone(volume_profile([bar(10, 0, 0.0)]))
+
+        times = [EASTERN.localize(datetime.datetime(2025, 3, 3, 9, 40)),
+                 EASTERN.localize(datetime.datetime(2025, 3, 3, 9, 50))]
+        np.testing.assert_allclose(slice_targets(times, profile), [0.75, 1.0])
+        np.testing.assert_allclose(slice_targets(times), [0.5, 1.0])
+
+
+class ExecutionTests(unittest.TestCase):
+    def setUp(self):
+        self.virtual = SimulatedClock(START)
+        self.previous_clock = clock.install(self.virtual)
+        self.broker = PaperBroker({"SOXL": 30.0}, cash=100000.0)
+        self.saved = {name: getattr(strategy, name) for name in
+                      ["notify", "executor", "protective_orders", "TARGETS", "TARGET_WEIGHTS"]}
+        self.saved_enabled = strategy.journal.enabled, strategy.trade_store.enabled
+        self.notifications = []
+        strategy.notify = self.notifications.append
+        strategy.executor = ExecutionScheduler(algo="twap", horizon=300, interval=60, min_value=1000)
+        strategy.protective_orders = None
+        strategy.TARGETS = ["SOXL"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 1.0}
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.risk_manager.position_data = {}
+        self.broker.install(strategy, risk_manager_module, execution)
+
+    def tearDown(self):
+        self.broker.uninstall()
+        clock.install(self.previous_clock)
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        strategy.journal.enabled, strategy.trade_store.enabled = self.saved_enabled
+        strategy.risk_manager.position_data = {}
+
+    def run_for(self, seconds, prices=None):
+        """推进虚拟时间，每 10 秒更新一次价格（撮合子单）并推进母单"""
+        results = []
+        for _ in range(seconds // 10):
+            self.virtual.advance(10)
+            self.broker.set_prices(prices or {})
+            results += strategy.work_orders()
+        return results
+
+    def test_children_adapt_to_fills(self):
+        """母单拆成子单按时间片买入；未成交的子单超时撤销并入之后的时间片，价格上涨过多时暂停"""
+        result = strategy.buy_with_percent_cash("SOXL", 0.1, CONTEXT, "initial")
+        self.assertTrue(result["scheduled"])
+        parent_qty = result["qty"]
+        self.assertEqual(self.broker.orders, [])
+        self.assertNotIn("SOXL", strategy.risk_manager.position_data)
+        # 执行中不再重复买入
+        self.assertIsNone(strategy.buy_with_percent_cash("SOXL", 0.1, CONTEXT, "initial"))
+
+        results = strategy.work_orders()
+        # 第一个子单挂出后价格跳到限价之上，30 秒未成交被撤销，按新价格重新挂出
+        results += self.run_for(30, {"SOXL": 30.3})
+        self.assertEqual(len(self.broker.get_open_orders()), 1)
+        # 价格继续上涨，子单仍未成交；第二个时间片开始时涨幅超过 2%，撤销后暂停下单
+        results += self.run_for(60, {"SOXL": 30.7})
+        self.assertEqual(results, [])
+        self.assertEqual(self.broker.get_open_orders(), [])
+        # 价格回落后一个子单补上前两个时间片的股数
+        results += self.run_for(20, {"SOXL": 30.0})
+        self.assertEqual([item["qty"] for item in results], [int(np.ceil(parent_qty * 2 / 5))])
+
+        results += self.run_for(300)
+        self.assertEqual(sum(item["qty"] for item in results), parent_qty)
+        self.assertEqual(strategy.risk_manager.position_data["SOXL"]["qty"], parent_qty)
+        self.assertEqual(self.broker.positions["SOXL"][1], parent_qty)
+        self.assertFalse(strategy.executor.active("SOXL"))
+        self.assertTrue(self.notifications[-1].startswith("SOXL 分批买入结束"))
+
+    def test_sell_cancels_parent(self):
+        """触发卖出时撤销母单，按券商的持仓全部卖出"""
+        strategy.buy_with_percent_cash("SOXL", 0.1, CONTEXT, "initial")
+        results = strategy.work_orders() + self.run_for(60, {"SOXL": 30.0})
+        bought = sum(item["qty"] for item in results)
+        # 新的子单挂出后成交，但还没有被推进记录
+        self.virtual.advance(10)
+        self.broker.set_prices({"SOXL": 30.0})
+        held = self.broker.positions["SOXL"][1]
+        self.assertGreater(held, bought)
+
+        strategy.submit_sell("SOXL", bought, 30.0, 30.0, "stop_loss")
+        strategy.risk_manager.update_position("SOXL", 0, -bought)
+        self.assertNotIn("SOXL", self.broker.positions)
+        self.assertEqual(self.broker.get_open_orders(), [])
+        self.assertFalse(strategy.executor.active("SOXL"))
+        self.assertEqual(strategy.risk_manager.position_data["SOXL"]["qty"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,10 @@ import os
 from chart_generator import ChartGenerator
 from market_sentiment import FearGreedIndex
 from config import TARGETS
+import cassette
+
+# 回放 fixtures 中的行情（python benchmark.py --record-test-cassette 生成），没有记录的请求直接报错，不访问网络
+cassette.install("replay", os.path.join("fixtures", "cassette"))
 
 
 class ChartGeneratorTests(unittest.TestCase):
@@ -0,0 +1,115 @@
+import unittest
+import numpy as np
+import pandas as pd
+import indicators
+from indicator_cache import indicator_cache, ma_crossover_signals
+
+
+class IndicatorTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.prices = 100 * np.cumprod(1 + rng.normal(0, 0.02, size=(4, 120)), axis=1)
+        # 第二只股票历史较短，前面用 NaN 补齐
+        self.prices[1, :30] = np.nan
+
+    def assert_matches_pandas(self, result, expected_frame):
+        np.testing.assert_allclose(result, expected_frame.to_numpy().T, rtol=1e-9, equal_nan=True)
+
+    def test_sma_and_ema_match_pandas(self):
+        """SMA/EMA 与 pandas 的结果一致，短历史的股票也正确"""
+        frame = pd.DataFrame(self.prices.T)
+        self.assert_matches_pandas(indicators.sma(self.prices, 20), frame.rolling(20).mean())
+        self.assert_matches_pandas(indicators.ema(self.prices, 12), frame.ewm(span=12, adjust=False).mean())
+
+    def test_bollinger_and_zscore(self):
+        """布林带宽度和 z-score 使用同一个滚动标准差"""
+        frame = pd.DataFrame(self.prices.T)
+        middle, upper, lower = indicators.bollinger(self.prices, 20, 2.0)
+        std = frame.rolling(20).std(ddof=0)
+        self.assert_matches_pandas(upper - middle, 2.0 * std)
+        self.assert_matches_pandas(indicators.rolling_zscore(self.prices, 20), (frame - frame.rolling(20).mean()) / std)
+
+    def test_rsi_bounds(self):
+        """单边上涨 RSI 为 100，单边下跌为 0"""
+        up = np.arange(1.0, 41.0)
+        values = indicators.rsi(np.vstack([up, up[::-1]]), 14)
+        self.assertTrue(np.isnan(values[:, :14]).all())
+        np.testing.assert_allclose(values[0, 14:], 100.0)
+        np.testing.assert_allclose(values[1, 14:], 0.0)
+
+    def test_atr_constant_range(self):
+        """每天振幅固定且无跳空时 ATR 等于振幅"""
+        close = np.full(30, 50.0)
+        values = indicators.atr(close + 1.0, close - 1.0, close, 14)
+        self.assertEqual(values.shape, (30,))
+        np.testing.assert_allclose(values[13:], 2.0)
+
+    def test_wilder_seeded_with_sma(self):
+        """RSI 和 ATR 的 Wilder 平滑以前 period 个值的简单平均为初值，短历史的股票也正确"""
+        frame = pd.DataFrame(self.prices.T)
+        change = frame.diff()
+        expected = []
+        for column in change:
+            gains, losses = change[column].clip(lower=0).dropna(), (-change[column]).clip(lower=0).dropna()
+            avg_gain, avg_loss = gains.iloc[:14].mean(), losses.iloc[:14].mean()
+            row = [np.nan] * (len(frame) - len(gains) + 13) + [100 - 100 / (1 + avg_gain / avg_loss)]
+            for gain, loss in zip(gains.iloc[14:], losses.iloc[14:]):
+                avg_gain, avg_loss = (avg_gain * 13 + gain) / 14, (avg_loss * 13 + loss) / 14
+                row.append(100 - 100 / (1 + avg_gain / avg_loss))
+            expected.append(row)
+        np.testing.assert_allclose(indicators.rsi(self.prices, 14), expected, rtol=1e-9)
+
+        high, low = self.prices[0] * 1.01, self.prices[0] * 0.99
+        true_range = np.maximum(high - low, np.abs(high - np.roll(self.prices[0], 1)))
+        true_range = np.maximum(true_range, np.abs(low - np.roll(self.prices[0], 1)))
+        true_range[0] = high[0] - low[0]
+        values = indicators.atr(high, low, self.prices[0], 14)
+        self.assertTrue(np.isnan(values[:13]).all())
+        self.assertAlmostEqual(values[13], true_range[:14].mean())
+        self.assertAlmostEqual(values[14], (true_range[:14].mean() * 13 + true_range[14]) / 14)
+
+    def test_rolling_max_drawdown(self):
+        prices = np.array([10.0, 12.0, 9.0, 11.0, 6.0, 8.0])
+        values = indicators.rolling_max_drawdown(prices, 3)
+        np.testing.assert_allclose(values[2:], [0.25, 0.25, 1 - 6.0 / 11.0, 1 - 6.0 / 11.0])
+
+    def test_macd_and_out_buffers(self):
+        """传入的输出数组被原地写入并返回"""
+        buffers = tuple(np.empty_like(self.prices) for _ in range(3))
+        result = indicators.macd(self.prices, out=buffers)
+        for returned, buffer in zip(result, buffers):
+            self.assertIs(returned, buffer)
+        frame = pd.DataFrame(self.prices.T)
+        expected = frame.ewm(span=12, adjust=False).mean() - frame.ewm(span=26, adjust=False).mean()
+        self.assert_matches_pandas(buffers[0], expected)
+        np.testing.assert_allclose(buffers[2], buffers[0] - buffers[1], equal_nan=True)
+
+    def test_streaming_update_matches_batch(self):
+        """逐列推进的 EMA 状态与批量计算的最后一列一致"""
+        state = np.full(self.prices.shape[0], np.nan)
+        for t in range(self.prices.shape[1]):
+            indicators.ema_update(state, self.prices[:, t], span=12)
+        np.testing.assert_allclose(state, indicators.ema(self.prices, 12)[:, -1])
+
+        buffer = self.prices[:, :10].copy()
+        indicators.roll_append(buffer, self.prices[:, 10])
+        np.testing.assert_array_equal(buffer, self.prices[:, 1:11])
+
+    def test_cache_tracks_forming_bar(self):
+        """最后一根K线时间不变但收盘价变化时（当天正在形成的日线）重新计算均线交叉"""
+        index = pd.date_range("2025-01-01", periods=30, freq="D")
+        data = pd.DataFrame({"Close": np.linspace(100.0, 80.0, 30)}, index=index)
+        indicator_cache.invalidate("TEST")
+        first = ma_crossover_signals("TEST", data, 3, 5)
+        self.assertIs(ma_crossover_signals("TEST", data.copy(), 3, 5), first)
+
+        forming = data.copy()
+        forming.iloc[-1, 0] = 200.0
+        signals = ma_crossover_signals("TEST", forming, 3, 5)
+        self.assertEqual(signals["Signal"].iloc[-1], 1)
+        self.assertEqual(first["Signal"].iloc[-1], 0)
+        indicator_cache.invalidate("TEST")
+
+
+if __name__ == '__main__':
+    unittest.main()
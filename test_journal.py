@@ -0,0 +1,89 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+import pytz
+import strategy
+import risk_manager as risk_manager_module
+from cycle_context import CycleContext
+from journal import Journal, journal, read_journal, replay, QUOTE, CYCLE
+from paper_broker import PaperBroker
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def at(day, hour, minute):
+    return EASTERN.localize(datetime.datetime(2024, 6, day, hour, minute)).timestamp()
+
+
+class JournalTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="journal_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_roundtrip_and_growth(self):
+        """写满预分配空间后自动扩容，读出的记录与写入一致"""
+        writer = Journal(self.path, initial_records=4)
+        for i in range(10):
+            writer.write(QUOTE, "SOXL", a=30.0 + i, timestamp=at(3, 10, i))
+        writer.close()
+
+        records = read_journal(os.path.join(self.path, "20240603.bin"))
+        self.assertEqual(len(records), 10)
+        self.assertEqual(records["symbol"][0], b"SOXL")
+        self.assertEqual(list(records["a"]), [30.0 + i for i in range(10)])
+
+    def test_daily_rotation(self):
+        """跨交易日时写入新文件"""
+        writer = Journal(self.path)
+        writer.write(QUOTE, "SOXL", a=30.0, timestamp=at(3, 15, 59))
+        writer.write(QUOTE, "SOXL", a=31.0, timestamp=at(4, 9, 30))
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.path)), ["20240603.bin", "20240604.bin"])
+        self.assertEqual(len(read_journal(os.path.join(self.path, "20240604.bin"))), 1)
+
+    def test_replay_reproduces_orders(self):
+        """回放一个交易时段，产生的订单与记录的下单意图一致"""
+        saved_directory = journal.directory
+        journal.close()
+        journal.directory = self.path
+        broker = PaperBroker({"SOXL": 30.0, "NVDA": 100.0}, cash=100000.0)
+        saved = (strategy.get_ma_signal, strategy.notify, strategy.TARGETS, strategy.TARGET_WEIGHTS,
+                 strategy.risk_manager.check_market_hours, strategy.trade_store.enabled)
+        strategy.get_ma_signal = lambda symbol: 1
+        strategy.notify = lambda content: None
+        strategy.TARGETS = ["SOXL", "NVDA"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 0.5, "NVDA": 0.5}
+        strategy.risk_manager.check_market_hours = lambda: True
+        strategy.trade_store.enabled = False
+        strategy.states.clear()
+        strategy.risk_manager.position_data = {}
+        broker.install(strategy, risk_manager_module)
+        context = CycleContext("2024-06-03T10:00:00-04:00", "中性", 35, "Fear", "BUY", 1.2, 1.0)
+        try:
+            for prices in [{"SOXL": 30.0, "NVDA": 100.0}, {"SOXL": 33.5, "NVDA": 99.0},
+                           {"SOXL": 31.0, "NVDA": 94.0}]:
+                broker.set_prices(prices)
+                strategy.run_strategy(context)
+        finally:
+            broker.uninstall()
+            (strategy.get_ma_signal, strategy.notify, strategy.TARGETS, strategy.TARGET_WEIGHTS,
+             strategy.risk_manager.check_market_hours, strategy.trade_store.enabled) = saved
+            journal.close()
+            journal.directory = saved_directory
+
+        files = os.listdir(self.path)
+        self.assertEqual(len(files), 1)
+        records = read_journal(os.path.join(self.path, files[0]))
+        self.assertEqual((records["kind"] == CYCLE).sum(), 3)
+
+        replayed, recorded = replay(os.path.join(self.path, files[0]))
+        self.assertEqual(recorded, [("SOXL", 239), ("NVDA", 66), ("SOXL", -239), ("SOXL", 218), ("NVDA", -66)])
+        self.assertEqual(replayed, recorded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,10 @@ from chart_generator import ChartGenerator
 from config import TARGETS
 import yfinance as yf
 from strategy import calculate_ma_crossover
+import cassette
+
+# 回放 fixtures 中的行情（python benchmark.py --record-test-cassette 生成），没有记录的请求直接报错，不访问网络
+cassette.install("replay", os.path.join("fixtures", "cassette"))
 
 
 class MACrossoverTests(unittest.TestCase):
@@ -0,0 +1,74 @@
+import datetime
+import unittest
+import pytz
+import clock
+import market_monitor
+from clock import SimulatedClock
+from market_monitor import MarketMonitor
+from config import MARKET_DATA_MAX_STALE
+
+START = pytz.timezone('US/Eastern').localize(datetime.datetime(2025, 3, 3, 10, 0))
+INPUTS = [{"label": "sp500", "symbol": "^GSPC", "kind": "trend"},
+          {"label": "vix", "symbol": "^VIX", "kind": "volatility"}]
+
+
+class MarketMonitorTests(unittest.TestCase):
+    def setUp(self):
+        self.virtual = SimulatedClock(START)
+        self.previous_clock = clock.install(self.virtual)
+        self.saved_fear_greed = market_monitor.USE_FEAR_GREED_INDEX
+        market_monitor.USE_FEAR_GREED_INDEX = False
+        self.monitor = MarketMonitor(INPUTS)
+        self.failing = set()
+        self.calls = 0
+
+        def fetch(symbol):
+            self.calls += 1
+            if symbol in self.failing:
+                raise ConnectionError("timeout")
+            return {"price": 20.0, "change": 0.0}
+
+        self.monitor._fetch_index = fetch
+
+    def tearDown(self):
+        clock.install(self.previous_clock)
+        market_monitor.USE_FEAR_GREED_INDEX = self.saved_fear_greed
+        self.monitor.executor.shutdown(wait=False)
+
+    def test_failed_refresh_keeps_cache_time(self):
+        """所有数据源都失败时不更新缓存时间，下次取数据时仍同步刷新"""
+        self.monitor.refresh()
+        started = clock.now()
+        self.assertEqual(self.monitor.cache_time, started)
+
+        self.failing = {"^GSPC", "^VIX"}
+        self.virtual.advance(MARKET_DATA_MAX_STALE)
+        self.monitor.refresh()
+        self.assertEqual(self.monitor.cache_time, started)
+        # 旧数据已超过最长可用时间，全部丢弃
+        self.assertEqual(self.monitor.cached_data, {})
+
+        calls = self.calls
+        self.monitor._get_market_data()
+        self.assertEqual(self.calls, calls + 2)
+
+    def test_stale_source_dropped(self):
+        """一个数据源持续失败时，其他数据源照常更新，失败的旧值超过最长可用时间后不再使用"""
+        self.monitor.refresh()
+        started = clock.now()
+        self.failing = {"^VIX"}
+        self.virtual.advance(MARKET_DATA_MAX_STALE / 2)
+        self.monitor.refresh()
+        self.assertIn("vix", self.monitor.cached_data)
+        self.assertEqual(self.monitor.source_times["vix"], started)
+
+        self.virtual.advance(MARKET_DATA_MAX_STALE / 2)
+        # 整体缓存还新，但 vix 已过期，强制同步刷新后丢弃
+        data = self.monitor._get_market_data()
+        self.assertEqual(list(data), ["sp500"])
+        self.assertNotIn("vix", self.monitor.source_times)
+        self.assertEqual(self.monitor._get_market_data(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pytz
+import strategy
+import risk_manager as risk_manager_module
+from cycle_context import CycleContext
+from paper_broker import PaperBroker
+from plugins import PluginHost, StrategyPlugin
+from state_store import capture_state, restore_state, save_snapshot, load_snapshot
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+class ScriptedPlugin(StrategyPlugin):
+    """按顺序返回预先设定的下单股数"""
+    name = "scripted"
+    timeframes = ("1d",)
+
+    def __init__(self, orders, **kwargs):
+        super().__init__(**kwargs)
+        self.orders = list(orders)
+        self.ticks = []
+        self.bars = []
+
+    def on_bar(self, symbol, timeframe, bar):
+        self.bars.append((symbol, timeframe, bar["close"]))
+
+    def on_tick(self, tick, context):
+        self.ticks.append((tick.symbol, tick.price))
+        return self.orders.pop(0) if self.orders else 0
+
+
+class PluginHostTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = PaperBroker({"SPY": 100.0, "QQQ": 50.0}, cash=100000.0)
+        self.saved = (strategy.plugin_host, strategy.notify, strategy.journal.enabled, strategy.trade_store.enabled)
+        strategy.notify = lambda content: None
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.risk_manager.position_data = {}
+        self.broker.install(strategy, risk_manager_module)
+        self.context = CycleContext("2024-06-03T10:00:00-04:00", "中性", 50, "Neutral", "HOLD", 1.0, 1.0)
+
+    def tearDown(self):
+        self.broker.uninstall()
+        strategy.plugin_host, strategy.notify, strategy.journal.enabled, strategy.trade_store.enabled = self.saved
+
+    def run_cycles(self, host, cycles):
+        strategy.plugin_host = host
+        for _ in range(cycles):
+            strategy.process_symbols([], self.context, equity=100000.0)
+
+    def test_capital_budget_caps_buys(self):
+        """买入不超过策略的资金预算，卖出不超过策略自己的持仓"""
+        plugin = ScriptedPlugin([500, 50, -1000], symbols=["SPY"], capital_budget=0.1)
+        self.run_cycles(PluginHost([plugin]), 3)
+        self.assertEqual(self.broker.orders, [("buy", "SPY", 100, 100.0), ("sell", "SPY", 100, 100.0)])
+        self.assertEqual(plugin.book.qty("SPY"), 0)
+        self.assertEqual(self.broker.positions.get("SPY", (0, 0))[1], 0)
+
+    def test_risk_budget_blocks_new_buys(self):
+        """当日亏损超过风险预算后不再买入"""
+        plugin = ScriptedPlugin([100, -100, 100], symbols=["SPY"], capital_budget=0.5, risk_budget=0.001)
+        strategy.plugin_host = PluginHost([plugin])
+        strategy.process_symbols([], self.context, equity=100000.0)
+        self.broker.set_prices({"SPY": 95.0})
+        strategy.process_symbols([], self.context, equity=100000.0)
+        strategy.process_symbols([], self.context, equity=100000.0)
+        self.assertEqual(plugin.book.realized, -500.0)
+        self.assertEqual([order[0] for order in self.broker.orders], ["buy", "sell"])
+        self.assertEqual(plugin.book.qty("SPY"), 0)
+
+    def test_shared_tick_and_bar_fan_out(self):
+        """同一只股票每个周期只取一次行情，行情和K线收盘事件分发给所有关注它的策略"""
+        first = ScriptedPlugin([], symbols=["SPY", "QQQ"])
+        second = ScriptedPlugin([], symbols=["SPY"])
+        host = PluginHost([first, second])
+        host.on_bar("SPY", "1d", {"close": 101.0})
+        host.on_bar("QQQ", "5m", {"close": 51.0})
+
+        calls = []
+        get_price = strategy.get_price
+        strategy.get_price = lambda symbol: calls.append(symbol) or get_price(symbol)
+        try:
+            self.run_cycles(host, 1)
+        finally:
+            strategy.get_price = get_price
+        self.assertEqual(calls, ["SPY", "QQQ"])
+        self.assertEqual(first.ticks, [("SPY", 100.0), ("QQQ", 50.0)])
+        self.assertEqual(second.ticks, [("SPY", 100.0)])
+        self.assertEqual(first.bars, [("SPY", "1d", 101.0)])
+        self.assertEqual(second.bars, [("SPY", "1d", 101.0)])
+
+    def test_books_survive_snapshot(self):
+        """策略账本随状态快照保存，单次运行模式下次启动后仍能卖出上次买入的持仓"""
+        plugin = ScriptedPlugin([100], symbols=["SPY"], capital_budget=0.5)
+        self.run_cycles(PluginHost([plugin]), 1)
+        directory = tempfile.mkdtemp(prefix="test_plugins_")
+        try:
+            path = os.path.join(directory, "state_snapshot.json")
+            save_snapshot(capture_state(strategy), path)
+            restarted = ScriptedPlugin([-1000], symbols=["SPY"], capital_budget=0.5)
+            strategy.plugin_host = PluginHost([restarted])
+            restore_state(strategy, load_snapshot(path))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.assertEqual(restarted.book.qty("SPY"), 100)
+        self.assertEqual(restarted.book.day, plugin.book.day)
+        self.run_cycles(strategy.plugin_host, 1)
+        self.assertEqual(self.broker.orders[-1], ("sell", "SPY", 100, 100.0))
+        self.assertEqual(restarted.book.positions, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import datetime
+import unittest
+import numpy as np
+import pytz
+import clock
+import strategy
+import risk_manager as risk_manager_module
+from clock import SimulatedClock
+from bar_engine import BarEngine
+from cycle_context import CycleContext
+from paper_broker import PaperBroker
+from plugins import Tick, PluginHost, LegacyStrategy
+from poll_scheduler import PollScheduler, ma_cross_price
+
+EASTERN = pytz.timezone('US/Eastern')
+START = EASTERN.localize(datetime.datetime(2025, 3, 3, 10, 0))
+
+
+class PollSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.virtual = SimulatedClock(START)
+        self.previous_clock = clock.install(self.virtual)
+        self.broker = PaperBroker({"SOXL": 28.8, "NVDA": 100.0}, cash=100000.0)
+        self.broker.positions = {"SOXL": [30.0, 100], "NVDA": [100.0, 10]}
+        self.saved = {name: getattr(strategy, name) for name in
+                      ["get_ma_signal", "calculate_atr", "notify", "bar_engine", "plugin_host", "last_context",
+                       "TARGETS", "TARGET_WEIGHTS"]}
+        self.saved_market_hours = strategy.risk_manager.check_market_hours
+        self.saved_enabled = strategy.journal.enabled, strategy.trade_store.enabled
+        strategy.get_ma_signal = lambda symbol: 0
+        strategy.calculate_atr = lambda symbol, period=14: 1.0
+        strategy.notify = lambda content: None
+        strategy.bar_engine = BarEngine()
+        strategy.plugin_host = PluginHost([LegacyStrategy()])
+        strategy.TARGETS = ["SOXL", "NVDA"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 0.5, "NVDA": 0.5}
+        strategy.risk_manager.check_market_hours = lambda: True
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.last_context = CycleContext(START.isoformat(), "中性", 50, "Neutral", "NEUTRAL", 1.0, 1.0)
+        strategy.states.clear()
+        strategy.last_ticks.clear()
+        strategy.risk_manager.position_data = {}
+        for symbol, (entry, qty) in self.broker.positions.items():
+            strategy.states[symbol] = dict(strategy.new_symbol_state(), layers=1, entry_price=entry)
+            strategy.risk_manager.update_position(symbol, entry, qty)
+        self.broker.install(strategy, risk_manager_module)
+
+    def tearDown(self):
+        self.broker.uninstall()
+        clock.install(self.previous_clock)
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        strategy.risk_manager.check_market_hours = self.saved_market_hours
+        strategy.journal.enabled, strategy.trade_store.enabled = self.saved_enabled
+        strategy.states.clear()
+        strategy.last_ticks.clear()
+        strategy.risk_manager.position_data = {}
+
+    def test_near_trigger_polled_sooner(self):
+        """离止损价近的股票很快再检查，离所有触发价都远的股票等下一个完整周期"""
+        closes = np.array([10.0] * 12 + [10.5] * 8)
+        self.assertIsNone(ma_cross_price(closes[:10]))
+        # 今天收在 6.0 时 9 日均线和 20 日均线都是 10.0
+        cross = ma_cross_price(closes)
+        self.assertAlmostEqual(cross, 6.0)
+        self.assertAlmostEqual((closes[-8:].sum() + cross) / 9, (closes[-19:].sum() + cross) / 20)
+
+        scheduler = PollScheduler(min_interval=30, max_interval=300, safety=0.1, budget=100)
+        now = clock.now(EASTERN)
+        scheduler.schedule({"SOXL": Tick("SOXL", now, 28.55, 30.0, 100), "NVDA": Tick("NVDA", now, 100.0, 100.0, 10)})
+        self.assertEqual(scheduler.plan["SOXL"]["trigger"], "stop_loss")
+        self.assertEqual(scheduler.plan["SOXL"]["interval"], 30)
+        self.assertEqual(scheduler.plan["NVDA"]["interval"], 300)
+        self.assertEqual(list(scheduler.next_due), ["SOXL"])
+        self.assertEqual(scheduler.next_due["SOXL"], int(scheduler.next_due["SOXL"]))
+
+    def test_budget_counts_actual_requests(self):
+        """超出预算时拉长间隔；每分钟按实际发出的券商请求数限制检查次数"""
+        now = clock.now(EASTERN)
+        ticks = {f"S{i}": Tick(f"S{i}", now, 28.6, 30.0, 100) for i in range(10)}
+        scheduler = PollScheduler(min_interval=30, max_interval=300, safety=0.1, budget=20, calls_per_check=2)
+        scheduler.schedule(ticks)
+        # 10 只股票每 30 秒检查一次需要每分钟 40 个请求，预算 20，间隔拉长一倍
+        self.assertEqual(min(scheduler.next_due.values()) - clock.time(), 60)
+
+        self.virtual.advance(60)
+        self.assertEqual(len(scheduler.due()), 10)
+        scheduler.record(10, 15)
+        scheduler.schedule(ticks)
+        self.virtual.advance(300)
+        scheduler.record(1, 18)
+        # 实际每次检查约 3 个请求，本分钟只剩 2 个请求的预算，不再检查
+        self.assertEqual(scheduler.due(), [])
+        self.assertEqual(scheduler.next_wakeup(), clock.time() + 60)
+
+    def test_poll_until_catches_stop_between_cycles(self):
+        """虚拟时钟下，价格跌破止损价后在下一个完整周期之前卖出，等待不会卡在不足一微秒的间隔上"""
+        import main
+
+        self.virtual.on_advance = lambda current: self.broker.set_prices(
+            {"SOXL": 28.8 - 0.004 * (current - START).total_seconds()})
+        for symbol in strategy.TARGETS:
+            strategy.fetch_tick(symbol)
+        main.transactions.clear()
+        scheduler = PollScheduler(min_interval=30, max_interval=300, safety=0.1, budget=20)
+        # 到期时间带小数时也能推进虚拟时钟
+        self.virtual.advance(0.3)
+        main.poll_until(scheduler, strategy.risk_manager, clock.time() + 300)
+
+        sells = [tx for tx in main.transactions if tx["action"] == "sell"]
+        self.assertEqual([(tx["symbol"], tx["reason"]) for tx in sells], [("SOXL", "stop_loss")])
+        self.assertLess(clock.time() - START.timestamp(), 301)
+        self.assertGreater(scheduler.calls, 0)
+        main.transactions.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import strategy
+import risk_manager as risk_manager_module
+import protective_orders as protective_orders_module
+from cycle_context import CycleContext
+from paper_broker import PaperBroker
+from plugins import PluginHost, LegacyStrategy
+from protective_orders import ProtectiveOrders, exit_prices
+
+
+class ProtectiveOrdersTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = PaperBroker({"SOXL": 30.0}, cash=100000.0)
+        self.saved = {name: getattr(strategy, name) for name in
+                      ["get_ma_signal", "calculate_atr", "notify", "TARGETS", "TARGET_WEIGHTS",
+                       "protective_orders", "plugin_host"]}
+        self.saved_market_hours = strategy.risk_manager.check_market_hours
+        self.saved_enabled = strategy.journal.enabled, strategy.trade_store.enabled
+        strategy.get_ma_signal = lambda symbol: 0
+        strategy.calculate_atr = lambda symbol, period=14: 0.0
+        strategy.notify = lambda content: None
+        strategy.TARGETS = ["SOXL"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 1.0}
+        strategy.plugin_host = PluginHost([LegacyStrategy()])
+        strategy.protective_orders = ProtectiveOrders(mode="oco")
+        strategy.risk_manager.check_market_hours = lambda: True
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.states.clear()
+        strategy.risk_manager.position_data = {}
+        self.broker.install(strategy, risk_manager_module, protective_orders_module)
+        self.context = CycleContext("2024-06-03T10:00:00-04:00", "中性", 50, "Neutral", "HOLD", 1.0, 1.0)
+
+    def tearDown(self):
+        self.broker.uninstall()
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        strategy.risk_manager.check_market_hours = self.saved_market_hours
+        strategy.journal.enabled, strategy.trade_store.enabled = self.saved_enabled
+        strategy.states.clear()
+
+    def test_exit_prices(self):
+        """止损价取固定止损和跟踪止损中较高者，跟踪止损只在高于成本时生效"""
+        self.assertEqual(exit_prices(100.0, 100.0), (95.0, 110.0))
+        self.assertEqual(exit_prices(100.0, 102.0), (95.0, 110.0))
+        self.assertEqual(exit_prices(100.0, 108.0), (104.76, 110.0))
+
+    def test_entry_places_exit_and_gap_is_protected(self):
+        """建仓后挂出覆盖全部持仓的保护单，跳空下跌时由券商成交，下个周期同步状态"""
+        strategy.process_symbols(["SOXL"], self.context)
+        qty = self.broker.positions["SOXL"][1]
+        open_orders = self.broker.get_open_orders()
+        self.assertEqual([(o["type"], o["qty"]) for o in open_orders], [("oco", qty)])
+
+        # 价格上涨后止损价随最高价上移
+        strategy.risk_manager.position_data["SOXL"]["highest_price"] = 33.0
+        self.broker.set_prices({"SOXL": 32.5})
+        strategy.process_symbols(["SOXL"], self.context)
+        exit_order = next(iter(self.broker.resting.values()))
+        self.assertEqual(exit_order["stop"], 32.01)
+
+        # 两个周期之间跳空下跌，券商端止损单成交
+        self.broker.set_prices({"SOXL": 29.0})
+        self.assertEqual(self.broker.fills, [("sell", "SOXL", qty, 29.0)])
+        self.assertNotIn("SOXL", self.broker.positions)
+
+        strategy.protective_orders.begin_cycle()
+        strategy.apply_protective_fills("SOXL")
+        self.assertEqual(strategy.states["SOXL"]["layers"], 0)
+        self.assertEqual(strategy.risk_manager.position_data["SOXL"]["qty"], 0)
+
+    def test_polled_sell_releases_protection(self):
+        """轮询逻辑主动卖出前撤销保护单"""
+        strategy.process_symbols(["SOXL"], self.context)
+        strategy.get_ma_signal = lambda symbol: -1
+        self.broker.set_prices({"SOXL": 31.0})
+        strategy.process_symbols(["SOXL"], self.context)
+        self.assertEqual(self.broker.orders[-1][0], "sell")
+        self.assertEqual(self.broker.resting, {})
+
+    def test_ladder_orders_fill_and_add_layers(self):
+        """加仓限价单成交后记为新的一层"""
+        manager = strategy.protective_orders
+        self.broker.buy("SOXL", 100)
+        manager.begin_cycle()
+        manager.fills("SOXL")
+        manager.sync_ladder("SOXL", {1: (28.5, 50), 2: (27.0, 60)})
+        manager.sync_ladder("SOXL", {1: (28.5, 55), 2: (27.0, 60)})
+        self.assertEqual(len(self.broker.resting), 2)
+
+        self.broker.set_prices({"SOXL": 28.0})
+        manager.begin_cycle()
+        self.assertEqual(manager.fills("SOXL"), [("ladder", 1, 50, 28.0)])
+        self.assertEqual(self.broker.positions["SOXL"][1], 150)
+        self.assertEqual(list(manager.orders["SOXL"]["ladder"]), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
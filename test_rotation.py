@@ -0,0 +1,95 @@
+import unittest
+import datetime
+import time
+import numpy as np
+import pandas as pd
+import strategy
+import risk_manager as risk_manager_module
+from paper_broker import PaperBroker
+from rotation import compute_scores, select_targets, rotation_due
+
+
+def make_prices(n_days=260, drifts=(0.004, 0.0, -0.004), seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2024-01-01", periods=n_days)
+    returns = rng.normal(0, 0.005, size=(n_days, len(drifts))) + np.array(drifts)
+    prices = 100 * np.cumprod(1 + returns, axis=0)
+    return pd.DataFrame(prices, index=index, columns=[f"S{i}" for i in range(len(drifts))])
+
+
+class RotationTests(unittest.TestCase):
+    def test_strong_trend_ranks_first(self):
+        """上涨趋势最强的股票应该排名第一"""
+        scores = compute_scores(make_prices())
+        self.assertEqual(list(scores.index), ["S0", "S1", "S2"])
+
+    def test_select_targets_weights(self):
+        """选出的权重之和应该接近1"""
+        targets, weights = select_targets(make_prices(), top_n=2)
+        self.assertEqual(targets, ["S0", "S1"])
+        self.assertAlmostEqual(sum(weights.values()), 1.0, places=3)
+
+    def test_short_history_excluded(self):
+        """历史数据不足的股票不参与排名"""
+        prices = make_prices()
+        prices.iloc[:-30, 0] = np.nan
+        scores = compute_scores(prices)
+        self.assertNotIn("S0", scores.index)
+
+    def test_large_universe_speed(self):
+        """数千只ETF的排名应该在1秒内完成"""
+        rng = np.random.default_rng(1)
+        drifts = rng.normal(0, 0.001, size=3000)
+        prices = make_prices(drifts=drifts)
+        started = time.perf_counter()
+        select_targets(prices, fear_greed=30, top_n=10)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+    def test_rotation_due_once_per_week(self):
+        """同一周内只轮动一次"""
+        monday = datetime.datetime(2024, 6, 3, 10, 0)
+        self.assertTrue(rotation_due(None, monday))
+        self.assertFalse(rotation_due("2024-06-03", monday + datetime.timedelta(days=2)))
+        self.assertTrue(rotation_due("2024-06-03", monday + datetime.timedelta(days=7)))
+
+
+class ApplyRotationTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = PaperBroker({"SOXL": 30.0, "NVDA": 100.0, "TQQQ": 50.0}, cash=100000.0)
+        self.broker.positions["SOXL"] = (28.0, 50)
+        self.saved = {name: getattr(strategy, name) for name in
+                      ["TARGETS", "TARGET_WEIGHTS", "notify", "ROTATION_SELL_DROPPED"]}
+        self.saved_state = dict(strategy.global_state)
+        self.saved_enabled = strategy.journal.enabled, strategy.trade_store.enabled
+        strategy.TARGETS = ["SOXL", "NVDA"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 0.5, "NVDA": 0.5}
+        strategy.notify = lambda content: None
+        strategy.ROTATION_SELL_DROPPED = True
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.global_state.pop("last_rotation", None)
+        self.broker.install(strategy, risk_manager_module)
+
+    def tearDown(self):
+        self.broker.uninstall()
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        strategy.global_state.clear()
+        strategy.global_state.update(self.saved_state)
+        strategy.journal.enabled, strategy.trade_store.enabled = self.saved_enabled
+        strategy.risk_manager.position_data = {}
+
+    def test_first_rotation_keeps_holdings(self):
+        """首次轮动只切换标的，不卖出原有 TARGETS 中未入选的持仓；之后的轮动卖出被轮出的持仓"""
+        targets = {"NVDA": 0.5, "TQQQ": 0.5}
+        self.assertEqual(strategy.apply_rotation(list(targets), targets), [])
+        self.assertEqual(strategy.TARGETS, ["NVDA", "TQQQ"])
+        self.assertEqual(self.broker.orders, [])
+
+        strategy.global_state["last_rotation"] = "2025-03-03"
+        strategy.TARGETS = ["SOXL", "NVDA"]
+        results = strategy.apply_rotation(list(targets), targets)
+        self.assertEqual([(result["symbol"], result["qty"]) for result in results], [("SOXL", 50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
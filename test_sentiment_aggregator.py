@@ -0,0 +1,63 @@
+import time
+import threading
+import unittest
+from sentiment_aggregator import SentimentAggregator
+
+
+class SentimentAggregatorTests(unittest.TestCase):
+    def test_deadline_and_missing_sources(self):
+        """卡住的数据源不会拖慢周期，晚到的结果保存下来供下次使用"""
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return 20, time.time()
+
+        def broken():
+            raise ConnectionError("timeout")
+
+        aggregator = SentimentAggregator(
+            sources={"fast": lambda: (60, time.time()), "slow": slow, "broken": broken},
+            weights={"fast": 1.0, "slow": 1.0, "broken": 1.0}, deadline=0.2, refresh_interval=0)
+        started = time.perf_counter()
+        result = aggregator.collect()
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(result["value"], 60)
+        self.assertEqual(result["rating"], "Greed")
+        self.assertEqual(result["missing"], ["slow", "broken"])
+        self.assertEqual(result["late"], ["slow"])
+
+        # 卡住的请求没有返回前不会重复提交
+        pending = aggregator.pending["slow"]
+        aggregator.collect()
+        self.assertIs(aggregator.pending["slow"], pending)
+
+        release.set()
+        pending.result()
+        time.sleep(0.05)
+        self.assertEqual(aggregator.composite()["value"], 40)
+
+    def test_freshness_weighting(self):
+        """读数的权重按数据年龄衰减，超过最长年龄的读数不参与"""
+        now = time.time()
+        aggregator = SentimentAggregator(
+            sources={"fresh": lambda: (80, now), "day_old": lambda: (20, now - 3600),
+                     "stale": lambda: (0, now - 7200)},
+            weights={"fresh": 1.0, "day_old": 1.0, "stale": 1.0}, half_life=3600, max_age=5000)
+        result = aggregator.collect()
+        self.assertAlmostEqual(result["value"], 60, delta=0.1)
+        self.assertEqual(result["missing"], ["stale"])
+        self.assertEqual(sorted(result["sources"]), ["day_old", "fresh"])
+
+    def test_disabled_sources_are_not_requested(self):
+        """权重为 0 的数据源不请求"""
+        calls = []
+        aggregator = SentimentAggregator(sources={"a": lambda: calls.append("a") or (50, None),
+                                                  "b": lambda: calls.append("b") or (50, None)},
+                                         weights={"a": 1.0, "b": 0})
+        self.assertEqual(aggregator.collect()["value"], 50)
+        self.assertEqual(calls, ["a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+import numpy as np
+import strategy
+import shadow
+from bar_engine import BarEngine
+from cycle_context import CycleContext
+from plugins import Tick
+from shadow import ShadowBook, expand_grid
+from config import LAYER_SIZE
+
+NEUTRAL = CycleContext("2025-03-03T10:00:00-05:00", "中性", 50, "Neutral", "NEUTRAL", 1.0, 1.0)
+FLAT = {"SOXL": np.full(30, 100.0)}
+
+
+class ShadowBookTests(unittest.TestCase):
+    def test_stop_loss_per_config(self):
+        """同一份行情下，各参数组按自己的止损价卖出，卖出的周期内不重新开仓"""
+        rules = expand_grid({"stop_loss": [-0.03, -0.08]})
+        self.assertEqual(list(rules["stop_loss"]), [-0.05, -0.03, -0.08])
+        book = ShadowBook(rules, ["SOXL"], 100000.0)
+        weights = {"SOXL": 1.0}
+
+        book.update({"SOXL": 100.0}, FLAT, NEUTRAL, weights=weights)
+        self.assertEqual(list(book.qty[:, 0]), [80, 80, 80])
+
+        book.update({"SOXL": 96.0}, FLAT, NEUTRAL, weights=weights)
+        self.assertEqual(list(book.qty[:, 0]), [80, 0, 80])
+        self.assertEqual(list(book.trades), [0, 1, 0])
+        self.assertAlmostEqual(book.cash[1], 100000.0 - 80 * 4.0)
+
+        # 跌 5.1%：当前参数止损；-3% 的一组重新开仓；-8% 的一组达到加仓价位，但持仓亏损超过 3% 不加仓
+        book.update({"SOXL": 94.9}, FLAT, NEUTRAL, weights=weights)
+        self.assertEqual(list(book.qty[:, 0]), [0, int(99680.0 * 0.08 // 94.9), 80])
+        self.assertEqual(list(book.layers[:, 0]), [0, 1, 1])
+        self.assertEqual(list(book.wins), [0, 0, 0])
+
+        summary = book.summary(live_equity=100100.0)
+        self.assertEqual(summary.index[0], "live")
+        self.assertAlmostEqual(summary.loc["current", "return"], -80 * 5.1 / 100000.0)
+
+    def test_ma_pairs_evaluated_once(self):
+        """不同均线组合各算一次信号：5/20 日线出现金叉按金叉比例买入，9/20 日线没有交叉按常规比例买入"""
+        closes = {"SOXL": np.array([10.0] * 25 + [11.0] * 8 + [9.0] * 2 + [14.0])}
+        book = ShadowBook(expand_grid({"ma_short": [5, 9]}), ["SOXL"], 100000.0)
+        self.assertEqual(len(book.ma_pairs), 2)
+        self.assertEqual(list(book.signals(closes)[:, 0]), [0, 1, 0])
+
+        book.update({"SOXL": 100.0}, closes, NEUTRAL, weights={"SOXL": 1.0})
+        self.assertEqual(list(book.qty[:, 0]), [80, int(100000 * LAYER_SIZE / 100), 80])
+
+
+class ShadowCycleTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="test_shadow_")
+        self.saved = {name: getattr(strategy, name) for name in ["TARGETS", "TARGET_WEIGHTS", "bar_engine"]}
+        self.saved_shadow = shadow.SHADOW_FILE, shadow.shadow_book, shadow.live_start_equity
+        self.saved_ticks = dict(strategy.last_ticks)
+        shadow.SHADOW_FILE = os.path.join(self.directory, "shadow_book.npz")
+        shadow.shadow_book = None
+        strategy.TARGETS = ["SOXL", "NVDA"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 0.5, "NVDA": 0.5}
+        strategy.bar_engine = BarEngine()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        shadow.SHADOW_FILE, shadow.shadow_book, shadow.live_start_equity = self.saved_shadow
+        strategy.last_ticks.clear()
+        strategy.last_ticks.update(self.saved_ticks)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def tick(self, symbol, price):
+        strategy.last_ticks[symbol] = Tick(symbol, datetime.datetime(2025, 3, 3, 15), price, None, 0)
+
+    def test_run_cycle_reports_and_resumes(self):
+        """每个周期与实盘收益对比；重新启动后从保存的影子账户继续"""
+        self.tick("SOXL", 30.0)
+        self.tick("NVDA", 100.0)
+        line = shadow.run_cycle(NEUTRAL, 100000.0)
+        self.assertIn("当前参数", line)
+        self.assertIn("实盘 +0.00%", line)
+        book = shadow.shadow_book
+        self.assertEqual(book.n, len(expand_grid()["stop_loss"]))
+        self.assertTrue((book.qty > 0).all())
+
+        shadow.shadow_book = None
+        self.tick("SOXL", 31.0)
+        line = shadow.run_cycle(NEUTRAL, 100500.0)
+        self.assertIn("实盘 +0.50%", line)
+        self.assertEqual(shadow.shadow_book.start_equity, 100000.0)
+        np.testing.assert_array_equal(shadow.shadow_book.qty, book.qty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import time
+import threading
+import unittest
+import multiprocessing as mp
+import supervisor
+from supervisor import RiskCoordinator, CoordinatorGate, Supervisor, _coordinator_main
+from config import MAX_CONCENTRATION, DAILY_LOSS_LIMIT
+
+
+def account(cash, equity, last_equity=None):
+    return {"cash": cash, "equity": equity, "last_equity": last_equity}
+
+
+def _echo_worker(symbols, control, gate_conn):
+    """测试用的工作进程：每个周期返回分片内的股票，上下文为 "hang" 时第一个分片不回复"""
+    while True:
+        message = control.recv()
+        if message[0] == "stop":
+            break
+        if message[1] == "hang" and "SOXL" in symbols:
+            time.sleep(60)
+        control.send(list(symbols))
+
+
+class RiskCoordinatorTests(unittest.TestCase):
+    def test_buys_share_cash_and_concentration(self):
+        """多个买单共用同一笔现金，已批准的金额计入集中度，超出部分只批准剩余额度"""
+        coordinator = RiskCoordinator()
+        coordinator.sync_account(account(30000.0, 100000.0), {"NVDA": 10000.0}, "2025-03-03")
+
+        self.assertEqual(coordinator.request_buy("SOXL", 100.0, 200), 200)
+        self.assertEqual(coordinator.cash, 10000.0)
+        # 现金只剩 1 万，按购买力削减
+        self.assertEqual(coordinator.request_buy("MSTU", 100.0, 200), 100)
+        self.assertEqual(coordinator.cash, 0)
+        self.assertEqual(coordinator.request_buy("TSLA", 100.0, 1), 0)
+
+        # 现金充足时按集中度上限削减：持仓 4 万，上限为净值的 MAX_CONCENTRATION
+        coordinator.sync_account(account(100000.0, 100000.0), {"NVDA": 40000.0}, "2025-03-03")
+        room = 100000.0 * MAX_CONCENTRATION - 40000.0
+        self.assertEqual(coordinator.request_buy("SOXL", 100.0, 1000), int(room // 100.0))
+        self.assertEqual(coordinator.request_buy("MSTU", 100.0, 1000), 0)
+
+    def test_halt_on_daily_loss(self):
+        """已实现亏损达到每日亏损限制后拒绝所有买单，换日后恢复"""
+        coordinator = RiskCoordinator()
+        coordinator.sync_account(account(50000.0, 100000.0, 100000.0), {"SOXL": 50000.0}, "2025-03-03")
+        loss_per_share = 100000.0 * DAILY_LOSS_LIMIT / 500
+        coordinator.report_sell("SOXL", 100.0 - loss_per_share, 500, 100.0)
+        self.assertIsNotNone(coordinator.halted_reason)
+        self.assertEqual(coordinator.request_buy("NVDA", 100.0, 10), 0)
+
+        # 同一天重新校准不清除已实现亏损
+        coordinator.sync_account(account(100000.0, 100000.0, 100000.0), {}, "2025-03-03")
+        self.assertEqual(coordinator.request_buy("NVDA", 100.0, 10), 0)
+
+        coordinator.sync_account(account(100000.0, 100000.0, 100000.0), {}, "2025-03-04")
+        self.assertIsNone(coordinator.halted_reason)
+        self.assertEqual(coordinator.request_buy("NVDA", 100.0, 10), 10)
+
+
+class CoordinatorGateTests(unittest.TestCase):
+    def test_gates_share_one_coordinator(self):
+        """两个工作进程的闸门通过管道向同一个协调器申请，共用现金；卖出登记后现金回到可用额度"""
+        pipes = [mp.Pipe() for _ in range(3)]
+        coordinator = threading.Thread(target=_coordinator_main, args=([theirs for _, theirs in pipes],), daemon=True)
+        coordinator.start()
+        (control, _), (first_conn, _), (second_conn, _) = pipes
+        control.send(("sync", account(10000.0, 100000.0), {}, "2025-03-03"))
+        self.assertEqual(control.recv()["cash"], 10000.0)
+
+        first, second = CoordinatorGate(first_conn), CoordinatorGate(second_conn)
+        self.assertEqual(first.request_buy("SOXL", 100.0, 80), 80)
+        self.assertEqual(second.request_buy("NVDA", 100.0, 80), 20)
+        self.assertEqual(second.request_buy("NVDA", 100.0, 80), 0)
+
+        first.report_sell("SOXL", 100.0, 50, 100.0)
+        # 卖出没有回复，同一管道上的查询返回时卖出已经登记
+        first_conn.send(("status",))
+        self.assertEqual(first_conn.recv()["cash"], 5000.0)
+        self.assertEqual(second.request_buy("NVDA", 100.0, 80), 50)
+
+        control.send(("status",))
+        self.assertEqual(control.recv()["cash"], 0)
+        control.send(("stop",))
+        coordinator.join(5)
+        self.assertFalse(coordinator.is_alive())
+
+
+class SupervisorTests(unittest.TestCase):
+    UNIVERSE = ["SOXL", "NVDA", "MSTU", "TQQQ"]
+
+    def setUp(self):
+        self.saved = supervisor._worker_main, supervisor.notify, supervisor.SHARD_CYCLE_TIMEOUT
+        self.notices = []
+        supervisor._worker_main = _echo_worker
+        supervisor.notify = self.notices.append
+        # 子进程启动时需要导入行情和策略模块，第一个周期留足时间
+        supervisor.SHARD_CYCLE_TIMEOUT = 60
+        self.supervisor = Supervisor(self.UNIVERSE, shard_size=2, max_workers=2)
+        self.supervisor.start()
+        self.assertEqual(sorted(self.supervisor.dispatch(None)), sorted(self.UNIVERSE))
+
+    def tearDown(self):
+        self.supervisor.stop()
+        self.supervisor.market_monitor.executor.shutdown(wait=False)
+        supervisor._worker_main, supervisor.notify, supervisor.SHARD_CYCLE_TIMEOUT = self.saved
+
+    def test_killed_worker_restarted(self):
+        """工作进程被杀死后本周期跳过该分片并重启，其他分片照常返回，下个周期恢复"""
+        killed = self.supervisor.workers[0]
+        killed.kill()
+        killed.join(5)
+
+        self.assertEqual(self.supervisor.dispatch(None), self.supervisor.shards[1])
+        self.assertEqual(len(self.notices), 1)
+        self.assertIsNot(self.supervisor.workers[0], killed)
+        self.assertEqual(sorted(self.supervisor.dispatch(None)), sorted(self.UNIVERSE))
+
+    def test_hung_worker_restarted(self):
+        """工作进程超过 SHARD_CYCLE_TIMEOUT 秒没有回复时结束并重启，不会一直阻塞周期"""
+        hung = self.supervisor.workers[0]
+        supervisor.SHARD_CYCLE_TIMEOUT = 1
+        self.assertEqual(self.supervisor.dispatch("hang"), self.supervisor.shards[1])
+        self.assertFalse(hung.is_alive())
+        self.assertEqual(len(self.notices), 1)
+
+        supervisor.SHARD_CYCLE_TIMEOUT = 60
+        self.assertEqual(sorted(self.supervisor.dispatch(None)), sorted(self.UNIVERSE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import unittest
+from cycle_context import CycleContext
+from trade_store import TradeStore, read_table
+from trade_analytics import load_lots, summarize, attribution
+
+
+class TradeAnalyticsTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="trades_test_")
+        self.store = TradeStore(self.path)
+        self.store.set_context(CycleContext("2024-06-03T10:00:00-04:00", "强势", 35, "Fear", "BUY", 1.2, 1.2))
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_sells_close_lots_first_in_first_out(self):
+        """卖出按先进先出平掉买入批次，分层加仓的盈亏单独归因；重启后从成交记录还原未平仓批次"""
+        self.store.buy("SOXL", 100, 10.0, "golden_cross")
+        self.store.buy("SOXL", 50, 9.0, "layer_add")
+        self.store.sell("SOXL", 120, 11.0, "trailing_stop")
+
+        restarted = TradeStore(self.path)
+        restarted.sell("SOXL", 30, 8.0, "stop_loss")
+
+        fills = read_table(self.path, "fills")
+        self.assertEqual(list(fills["reason"]), ["golden_cross", "layer_add", "trailing_stop", "stop_loss"])
+        lots = load_lots(self.path)
+        self.assertEqual(list(zip(lots["entry_reason"], lots["exit_reason"], lots["qty"], lots["pnl"])),
+                         [("golden_cross", "trailing_stop", 100, 100.0), ("layer_add", "trailing_stop", 20, 40.0),
+                          ("layer_add", "stop_loss", 30, -30.0)])
+        self.assertEqual(list(lots["entry_regime"]), ["强势"] * 3)
+
+    def test_attribution(self):
+        """按开仓规则分组的胜率、期望收益和盈亏比"""
+        self.store.buy("SOXL", 100, 10.0, "golden_cross")
+        self.store.buy("SOXL", 50, 9.0, "layer_add")
+        self.store.sell("SOXL", 120, 11.0, "trailing_stop")
+        self.store.sell("SOXL", 30, 8.0, "stop_loss")
+        self.store.sell("NVDA", 10, 100.0, "take_profit", entry=90.0)
+
+        lots = load_lots(self.path)
+        by_entry = summarize(lots, "entry_reason")
+        self.assertEqual(list(by_entry.index), ["golden_cross", "unknown", "layer_add"])
+        layer = by_entry.loc["layer_add"]
+        self.assertEqual(layer["trades"], 2)
+        self.assertAlmostEqual(layer["win_rate"], 0.5)
+        self.assertAlmostEqual(layer["expectancy"], 5.0)
+        self.assertAlmostEqual(layer["profit_factor"], 40.0 / 30.0)
+
+        report = attribution(lots, ["symbol", ["entry_reason", "exit_reason"]])
+        self.assertEqual(report["all"].loc["all", "trades"], 4)
+        self.assertAlmostEqual(report["all"].loc["all", "pnl"], 210.0)
+        self.assertEqual(report["symbol"].loc["NVDA", "trades"], 1)
+        self.assertEqual(report["entry_reason+exit_reason"].loc[("layer_add", "stop_loss"), "pnl"], -30.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+import datetime
+import unittest
+import pandas as pd
+import pytz
+import clock
+import strategy
+import warmup
+import main
+import risk_manager as risk_manager_module
+from clock import SimulatedClock
+from bar_engine import BarEngine
+from cycle_context import CycleContext
+from paper_broker import PaperBroker
+from state_store import RunLock
+from indicators import atr
+from config import LAYER_SIZE
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def at(hour, minute):
+    return EASTERN.localize(datetime.datetime(2025, 3, 3, hour, minute))
+
+
+def fixture_history(symbol, period="3mo"):
+    return pd.read_csv(os.path.join("fixtures", "bars", f"{symbol}.csv"), index_col="Date", parse_dates=True)
+
+
+class _Monitor:
+    def __init__(self):
+        self.refreshed = 0
+
+    def refresh(self):
+        self.refreshed += 1
+
+
+class WarmupTests(unittest.TestCase):
+    def setUp(self):
+        self.virtual = SimulatedClock(at(9, 5))
+        self.previous_clock = clock.install(self.virtual)
+        self.broker = PaperBroker({"SOXL": 30.0, "NVDA": 100.0, "MSTU": 10.0}, cash=100000.0)
+        self.broker.positions["NVDA"] = (90.0, 10)
+        self.saved = {name: getattr(strategy, name) for name in
+                      ["load_daily_history", "market_context", "notify", "bar_engine", "TARGETS", "TARGET_WEIGHTS"]}
+        self.saved_notify = warmup.notify
+        self.saved_enabled = strategy.journal.enabled, strategy.trade_store.enabled
+        self.saved_cache = dict(strategy.ma_signal_cache)
+        self.saved_history = dict(strategy.daily_history)
+        self.context = CycleContext(at(9, 5).isoformat(), "中性", 50, "Neutral", "NEUTRAL", 1.0, 1.0)
+        self.downloads = []
+
+        def history(symbol, period="3mo"):
+            self.downloads.append(symbol)
+            return fixture_history(symbol, period)
+
+        strategy.load_daily_history = history
+        strategy.market_context = lambda monitor=None: self.context
+        strategy.notify = warmup.notify = lambda content: None
+        strategy.bar_engine = BarEngine()
+        strategy.TARGETS = ["SOXL", "NVDA", "MSTU"]
+        strategy.TARGET_WEIGHTS = {"SOXL": 0.4, "NVDA": 0.3, "MSTU": 0.3}
+        strategy.journal.enabled = strategy.trade_store.enabled = False
+        strategy.ma_signal_cache.clear()
+        strategy.daily_history.clear()
+        strategy.states.clear()
+        strategy.global_state.pop("warmup", None)
+        # 本地记录的 SOXL 持仓已在券商端平掉，NVDA 的持仓本地没有记录
+        strategy.risk_manager.position_data = {"SOXL": {'entry_price': 28.0, 'qty': 50, 'highest_price': 31.0,
+                                                        'cost_basis': 1400.0}}
+        strategy.states["SOXL"] = {"layers": 1, "entry_price": 28.0, "last_check_time": None}
+        self.broker.install(strategy, risk_manager_module)
+
+    def tearDown(self):
+        self.broker.uninstall()
+        clock.install(self.previous_clock)
+        for name, value in self.saved.items():
+            setattr(strategy, name, value)
+        warmup.notify = self.saved_notify
+        strategy.journal.enabled, strategy.trade_store.enabled = self.saved_enabled
+        strategy.ma_signal_cache.clear()
+        strategy.ma_signal_cache.update(self.saved_cache)
+        strategy.daily_history.clear()
+        strategy.daily_history.update(self.saved_history)
+        strategy.states.clear()
+        strategy.global_state.pop("warmup", None)
+        strategy.risk_manager.position_data = {}
+
+    def test_schedule(self):
+        """休市时按时醒来做盘前准备和开盘，每个交易日只准备一次"""
+        self.assertFalse(warmup.warmup_due(at(8, 59)))
+        self.assertTrue(warmup.warmup_due(at(9, 0)))
+        self.assertFalse(warmup.warmup_due(at(9, 30)))
+        self.assertEqual(warmup.seconds_until_next_check(3600, at(8, 47)), 13 * 60)
+        self.assertEqual(warmup.seconds_until_next_check(3600, at(7, 0)), 3600)
+
+        strategy.global_state["warmup"] = {"date": "2025-03-03"}
+        self.assertFalse(warmup.warmup_due(at(9, 5)))
+        self.assertEqual(warmup.seconds_until_next_check(3600, at(9, 5)), 25 * 60)
+        self.assertEqual(warmup.seconds_until_next_check(3600, at(16, 5)), 3600)
+
+    def test_warmup_prepares_first_cycle(self):
+        """盘前下载日线、核对持仓并预算开仓股数，开盘后第一个周期不再下载，也不查询现金"""
+        monitor = _Monitor()
+        report = warmup.run_warmup(strategy.risk_manager, monitor)
+
+        self.assertEqual(monitor.refreshed, 1)
+        self.assertEqual(report["reconciled"], ["SOXL", "NVDA"])
+        self.assertNotIn("SOXL", strategy.risk_manager.position_data)
+        self.assertEqual(strategy.states["SOXL"]["layers"], 0)
+        self.assertEqual(strategy.risk_manager.position_data["NVDA"]["qty"], 10)
+        self.assertEqual(sorted(report["orders"]), ["MSTU", "SOXL"])
+        self.assertTrue(all(order["reason"] == "initial" for order in report["orders"].values()))
+        self.assertTrue(strategy.bar_engine.get_bars("SOXL", "1d"))
+
+        # 开盘后：均线信号直接读缓存，SOXL 价格不变按预算下单，MSTU 跳空超过容差时重新计算
+        self.virtual.advance(25 * 60)
+        self.downloads.clear()
+        for symbol in strategy.TARGETS:
+            strategy.get_ma_signal(symbol)
+        self.assertEqual(self.downloads, [])
+
+        planned = report["orders"]["SOXL"]["qty"]
+        strategy.get_cash = lambda: self.fail("使用盘前预算时不应查询现金")
+        result = strategy.buy_with_percent_cash("SOXL", LAYER_SIZE * 0.8, self.context, "initial")
+        self.assertEqual(result["qty"], planned)
+        self.broker.set_prices({"MSTU": 10.5})
+        self.assertIsNone(strategy.planned_quantity("MSTU", "initial", 10.5))
+
+    def test_daily_indicators_use_downloaded_history(self):
+        """ATR 的已完成日线取自下载的历史，K线引擎只追加当天正在形成的日线；合成的日线收盘后不替代历史"""
+        self.virtual.advance(55 * 60)
+        history = fixture_history("SOXL")
+        history = history[history.index.date < at(10, 0).date()]
+        base = atr(history["High"].to_numpy(), history["Low"].to_numpy(), history["Close"].to_numpy(), 14)[-1]
+        prev_close = history["Close"].iloc[-1]
+
+        strategy.get_ma_signal("SOXL")
+        strategy.bar_engine.on_trade("SOXL", at(10, 0), prev_close)
+        strategy.bar_engine.on_trade("SOXL", at(10, 1), prev_close * 1.1)
+        self.assertAlmostEqual(strategy.calculate_atr("SOXL"), (base * 13 + prev_close * 0.1) / 14)
+
+        strategy.bar_engine.flush(at(16, 5))
+        self.assertIsNone(strategy.bar_engine.current_bar("SOXL", "1d"))
+        self.assertAlmostEqual(strategy.calculate_atr("SOXL"), base)
+        self.assertEqual(self.downloads, ["SOXL"])
+
+    def test_once_cycle_after_warmup_skips_download(self):
+        """单次运行模式：盘前准备把日线历史写入状态快照，开盘后新进程的第一个周期不再下载日线"""
+        directory = tempfile.mkdtemp()
+        saved_main = {name: getattr(main, name) for name in
+                      ["STATE_SNAPSHOT_FILE", "RunLock", "USE_ROTATION", "USE_SHADOW", "record_regime", "notify"]}
+        main.STATE_SNAPSHOT_FILE = os.path.join(directory, "state_snapshot.json")
+        main.RunLock = lambda stale_after: RunLock(os.path.join(directory, "trader.lock"), stale_after)
+        main.USE_ROTATION = main.USE_SHADOW = False
+        main.record_regime = main.notify = lambda *args: None
+        strategy.market_monitor.refresh = lambda: None
+        try:
+            self.assertEqual(main.run_once(), 0)
+            self.assertIn("warmup", strategy.global_state)
+            self.assertEqual(sorted(self.downloads), ["MSTU", "NVDA", "SOXL"])
+
+            # 模拟新进程：内存中的日线缓存和K线引擎都是空的
+            strategy.daily_history.clear()
+            strategy.ma_signal_cache.clear()
+            strategy.bar_engine = BarEngine()
+            for symbol in strategy.TARGETS:
+                strategy.indicator_cache.invalidate(symbol)
+            self.virtual.advance(30 * 60)
+            self.downloads.clear()
+
+            self.assertEqual(main.run_once(), 0)
+            self.assertEqual(self.downloads, [])
+            self.assertTrue(strategy.bar_engine.get_bars("SOXL", "1d"))
+        finally:
+            for name, value in saved_main.items():
+                setattr(main, name, value)
+            del strategy.market_monitor.refresh
+            main.transactions.clear()
+            main.balance_history.clear()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
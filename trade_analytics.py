@@ -0,0 +1,116 @@
+"""
+成交绩效归因
+
+读取 trade_store 记录的平仓批次，按开仓规则、平仓规则、股票和市场状况分组统计：
+笔数、胜率、期望收益（每笔平均盈亏）、总盈亏、平均收益率、Sharpe / Sortino（每笔收益率的均值除以标准差 / 下行偏差，
+不年化）、盈亏比和平均持仓时间。文本列读出来就是分类编号，每个统计量是一次 np.bincount，
+几年的成交也只需几毫秒。
+
+用法:
+    python trade_analytics.py
+    python trade_analytics.py --by entry_reason exit_reason
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from journal import MARKET_STATUS_CODES
+from trade_store import read_table
+from config import *
+
+REGIME_LABELS = {code: label for label, code in MARKET_STATUS_CODES.items()}
+GROUPINGS = ["entry_reason", "exit_reason", "symbol", "entry_regime"]
+STAT_COLUMNS = ["trades", "win_rate", "expectancy", "pnl", "avg_return", "sharpe", "sortino", "profit_factor",
+                "avg_hold_hours"]
+
+
+def lots_frame(columns):
+    """平仓批次的列（read_table 的结果）转为 DataFrame，市场状况编号转为分类列"""
+    frame = pd.DataFrame(columns)
+    regimes = [REGIME_LABELS[code] for code in sorted(REGIME_LABELS)]
+    for name in ("entry_regime", "exit_regime"):
+        frame[name] = pd.Categorical.from_codes(columns[name].astype(np.int8) - min(REGIME_LABELS), regimes)
+    frame["hold_hours"] = (frame["exit_time"] - frame["entry_time"]) / 3600
+    return frame
+
+
+def load_lots(directory=TRADE_STORE_DIR):
+    return lots_frame(read_table(directory, "lots"))
+
+
+def _group_codes(lots, by):
+    """分组列的分类编号合成一个编号，返回 (编号, 分组数, 索引)"""
+    if by is None:
+        return np.zeros(len(lots), dtype=np.intp), 1, pd.Index(["all"])
+    names = [by] if isinstance(by, str) else list(by)
+    categoricals = [lots[name].astype("category").cat for name in names]
+    sizes = [len(cat.categories) for cat in categoricals]
+    codes = np.ravel_multi_index([cat.codes.to_numpy() for cat in categoricals], sizes)
+    if len(names) == 1:
+        index = pd.Index(categoricals[0].categories, name=names[0])
+    else:
+        index = pd.MultiIndex.from_product([cat.categories for cat in categoricals], names=names)
+    return codes, int(np.prod(sizes)), index
+
+
+def summarize(lots, by=None):
+    """
+    按 by 分组统计（by 为列名或列名列表，None 表示全部成交合为一组）
+
+    每个统计量是一次 np.bincount，分组数与成交笔数无关。返回以分组为索引、按总盈亏降序的 DataFrame：
+    trades、win_rate、expectancy、pnl、avg_return、sharpe、sortino、profit_factor、avg_hold_hours。
+    """
+    codes, groups, index = _group_codes(lots, by)
+    pnl = lots["pnl"].to_numpy()
+    ret = lots["ret"].to_numpy()
+
+    def total(weights=None):
+        return np.bincount(codes, weights=weights, minlength=groups)
+
+    trades = total()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_return = total(ret) / trades
+        variance = (total(ret * ret) - trades * avg_return ** 2) / (trades - 1)
+        downside = np.sqrt(total(np.minimum(ret, 0) ** 2) / trades)
+        stats = pd.DataFrame({
+            "trades": trades.astype(np.int64),
+            "win_rate": total(pnl > 0) / trades,
+            "expectancy": total(pnl) / trades,
+            "pnl": total(pnl),
+            "avg_return": avg_return,
+            "sharpe": avg_return / np.sqrt(np.maximum(variance, 0)),
+            "sortino": avg_return / downside,
+            "profit_factor": total(np.maximum(pnl, 0)) / -total(np.minimum(pnl, 0)),
+            "avg_hold_hours": total(lots["hold_hours"].to_numpy()) / trades,
+        }, index=index)[STAT_COLUMNS]
+    stats = stats[stats["trades"] > 0].replace([np.inf, -np.inf], np.nan)
+    return stats if by is None else stats.sort_values("pnl", ascending=False)
+
+
+def attribution(lots, groupings=GROUPINGS):
+    """整体统计和各分组的统计，返回 {"all": DataFrame, 分组列: DataFrame}"""
+    report = {"all": summarize(lots)}
+    for by in groupings:
+        report[by if isinstance(by, str) else "+".join(by)] = summarize(lots, by)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按规则、股票和市场状况统计成交绩效")
+    parser.add_argument("--dir", default=TRADE_STORE_DIR, help="成交记录目录")
+    parser.add_argument("--by", nargs="*", help="自定义分组列，例如 entry_reason exit_reason")
+    args = parser.parse_args()
+
+    lots = load_lots(args.dir)
+    if lots.empty:
+        print("没有平仓记录")
+        return
+
+    groupings = [args.by] if args.by else GROUPINGS
+    pd.set_option("display.width", 160)
+    for name, stats in attribution(lots, groupings).items():
+        print(f"\n=== {name} ===")
+        print(stats.to_string(float_format=lambda value: f"{value:.4g}"))
+
+
+if __name__ == "__main__":
+    main()
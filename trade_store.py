@@ -0,0 +1,177 @@
+"""
+列式成交记录
+
+每笔成交带上触发它的规则（金叉、恐慌加码、ATR 止损、跟踪止损、分层加仓等）和当时的市场状态，
+按列追加到 trades/ 目录下的二进制文件中（每列一个文件，读取时 np.fromfile 直接得到整列）。
+股票、规则、策略等文本列按字典编码：列文件只存 int16 编号，编号对应的文本逐行记在同名的 .dict 文件中，
+读取后直接成为 pandas 分类列，分组统计不需要再解码字符串。
+- fills：每一笔买入和卖出
+- lots：平仓的持仓批次。卖出时按先进先出与之前的买入批次配对，每个被平掉的批次一行，
+  同时记录开仓规则和平仓规则，分层加仓的盈亏因此能单独归因
+
+统计分析见 trade_analytics.py。
+"""
+import os
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+import clock
+from journal import MARKET_STATUS_CODES, FG_SIGNALS
+from config import *
+
+DICT = "dict"        # 字典编码的文本列
+DICT_CODE = "<i2"    # 字典编号的存储类型
+
+FILL_COLUMNS = [("time", "<f8"), ("symbol", DICT), ("side", "i1"), ("qty", "<i8"), ("price", "<f8"),
+                ("reason", DICT), ("strategy", DICT), ("regime", "i1"), ("fg_signal", "i1"), ("fg_value", "<f8")]
+LOT_COLUMNS = [("entry_time", "<f8"), ("exit_time", "<f8"), ("symbol", DICT), ("qty", "<i8"),
+               ("entry_price", "<f8"), ("exit_price", "<f8"), ("pnl", "<f8"), ("ret", "<f8"),
+               ("entry_reason", DICT), ("exit_reason", DICT), ("strategy", DICT),
+               ("entry_regime", "i1"), ("exit_regime", "i1")]
+TABLES = {"fills": FILL_COLUMNS, "lots": LOT_COLUMNS}
+
+
+def _read_dictionary(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def read_table(directory, table):
+    """
+    读取一张表，返回 {列名: 数值列为 ndarray，文本列为 pd.Categorical}
+
+    各列分别追加，写入中途中断时列长度可能不一致，按最短的列截齐。
+    """
+    columns = {}
+    for name, dtype in TABLES[table]:
+        path = os.path.join(directory, table, f"{name}.bin")
+        storage = DICT_CODE if dtype == DICT else dtype
+        columns[name] = np.fromfile(path, dtype=storage) if os.path.exists(path) else np.empty(0, dtype=storage)
+    rows = min(len(values) for values in columns.values())
+    for name, dtype in TABLES[table]:
+        columns[name] = columns[name][:rows]
+        if dtype == DICT:
+            categories = _read_dictionary(os.path.join(directory, table, f"{name}.dict"))
+            columns[name] = pd.Categorical.from_codes(columns[name], categories)
+    return columns
+
+
+class TradeStore:
+    """按列追加成交和平仓批次，并在内存中维护未平仓的买入批次"""
+
+    def __init__(self, directory=TRADE_STORE_DIR, enabled=TRADE_STORE_ENABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.open_lots = None  # (策略, 股票) -> deque([股数, 价格, 时间, 规则, 市场状况])
+        self.dictionaries = {}  # (表目录, 列) -> {文本: 编号}
+        self.regime = 0
+        self.fg_signal = 0
+        self.fg_value = float("nan")
+
+    def set_context(self, context):
+        """记录本周期的市场状态，之后的成交都带上它"""
+        self.regime = MARKET_STATUS_CODES.get(context.market_status, 0)
+        self.fg_signal = FG_SIGNALS.index(context.fg_signal) if context.fg_signal in FG_SIGNALS else 0
+        self.fg_value = float("nan") if context.fg_value is None else float(context.fg_value)
+
+    def _code(self, directory, name, text):
+        """文本在字典中的编号，新文本先追加到 .dict 文件再使用"""
+        key = (directory, name)
+        if key not in self.dictionaries:
+            values = _read_dictionary(os.path.join(directory, f"{name}.dict"))
+            self.dictionaries[key] = {value: code for code, value in enumerate(values)}
+        codes = self.dictionaries[key]
+        if text not in codes:
+            with open(os.path.join(directory, f"{name}.dict"), "a", encoding="utf-8") as f:
+                f.write(text + "\n")
+            codes[text] = len(codes)
+        return codes[text]
+
+    def _append(self, table, row):
+        directory = os.path.join(self.directory, table)
+        os.makedirs(directory, exist_ok=True)
+        for name, dtype in TABLES[table]:
+            if dtype == DICT:
+                value, dtype = self._code(directory, name, row[name]), DICT_CODE
+            else:
+                value = row[name]
+            with open(os.path.join(directory, f"{name}.bin"), "ab") as f:
+                f.write(np.array([value], dtype=dtype).tobytes())
+
+    def _load_open_lots(self):
+        """启动后第一次写入前，按先进先出重放已有的成交，还原未平仓的买入批次"""
+        self.open_lots = {}
+        fills = read_table(self.directory, "fills")
+        for row in zip(fills["time"], fills["symbol"], fills["side"], fills["qty"], fills["price"],
+                       fills["reason"], fills["strategy"], fills["regime"]):
+            when, symbol, side, qty, price, reason, strategy, regime = row
+            key = (strategy, symbol)
+            if side > 0:
+                self.open_lots.setdefault(key, deque()).append([int(qty), float(price), float(when), reason,
+                                                                int(regime)])
+            else:
+                self._match(key, int(qty))
+
+    def _match(self, key, qty):
+        """从最早的买入批次开始平掉 qty 股，返回 [(股数, 价格, 时间, 规则, 市场状况)]"""
+        lots = self.open_lots.get(key, deque())
+        closed = []
+        while qty > 0 and lots:
+            lot = lots[0]
+            take = min(qty, lot[0])
+            closed.append((take, lot[1], lot[2], lot[3], lot[4]))
+            lot[0] -= take
+            qty -= take
+            if lot[0] == 0:
+                lots.popleft()
+        return closed, qty
+
+    def _record(self, side, symbol, qty, price, reason, strategy, entry):
+        when = clock.time()
+        with self.lock:
+            if self.open_lots is None:
+                self._load_open_lots()
+            self._append("fills", {"time": when, "symbol": symbol, "side": side, "qty": qty,
+                                   "price": price, "reason": reason, "strategy": strategy,
+                                   "regime": self.regime, "fg_signal": self.fg_signal, "fg_value": self.fg_value})
+            key = (strategy, symbol)
+            if side > 0:
+                self.open_lots.setdefault(key, deque()).append([qty, price, when, reason, self.regime])
+                return
+
+            closed, unmatched = self._match(key, qty)
+            if unmatched:
+                # 记录开始之前建立的持仓，开仓规则未知，按券商的成本价计算
+                cost = entry or price
+                closed.append((unmatched, cost, when, "unknown", self.regime))
+            for lot_qty, lot_price, lot_time, lot_reason, lot_regime in closed:
+                self._append("lots", {
+                    "entry_time": lot_time, "exit_time": when, "symbol": symbol, "qty": lot_qty,
+                    "entry_price": lot_price, "exit_price": price, "pnl": (price - lot_price) * lot_qty,
+                    "ret": price / lot_price - 1, "entry_reason": lot_reason,
+                    "exit_reason": reason, "strategy": strategy,
+                    "entry_regime": lot_regime, "exit_regime": self.regime,
+                })
+
+    def buy(self, symbol, qty, price, reason, strategy="legacy"):
+        self.write(1, symbol, qty, price, reason, strategy)
+
+    def sell(self, symbol, qty, price, reason, strategy="legacy", entry=None):
+        self.write(-1, symbol, qty, price, reason, strategy, entry)
+
+    def write(self, side, symbol, qty, price, reason, strategy="legacy", entry=None):
+        if not self.enabled or qty <= 0:
+            return
+        try:
+            self._record(side, symbol, int(qty), float(price), reason, strategy, entry)
+        except Exception as e:
+            # 记录出错不能影响交易
+            print(f"写入成交记录出错: {e}")
+
+
+# 全局成交记录
+trade_store = TradeStore()
@@ -0,0 +1,177 @@
+"""
+盘前准备
+
+开盘后的第一个周期原本要下载日线历史、计算指标、获取情绪数据和账户总值，这正是一天中价格波动最大的时候。
+每个交易日开盘前 WARMUP_LEAD 秒起执行一次盘前准备，提前完成这些工作：
+- 刷新市场数据和情绪分数，得到市场状态（开盘后沿用缓存，过期后在后台刷新，周期内不等待网络）
+- 与券商核对持仓，以券商为准修正风险管理器和策略状态中的记录
+- 下载日线历史，初始化K线引擎和当天的均线信号，预先计算 ATR
+- 查询账户总值
+- 对空仓的股票预先算出开盘后会触发的开仓规则和股数，记入 global_state["warmup"]
+
+开盘后的第一个周期只需要取实时价格和持仓：开仓规则与预算一致、价格变化不超过 WARMUP_PRICE_TOLERANCE 时
+按预算的金额下单，不再查询现金和账户总值（见 strategy.planned_quantity）。
+"""
+import time
+import datetime
+import pytz
+import clock
+import strategy
+from notifier import notify
+from metrics import metrics
+from config import *
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def session_open(day):
+    """某天的开盘时刻，与 RiskManager.check_market_hours 一致"""
+    opening = datetime.time(9, 0) if TRADE_EXTENDED_HOURS else datetime.time(9, 30)
+    return EASTERN.localize(datetime.datetime.combine(day, opening))
+
+
+def last_warmup_date():
+    return (strategy.global_state.get("warmup") or {}).get("date")
+
+
+def warmup_due(now=None):
+    """当前是否在盘前准备时段内，且今天还没有准备过"""
+    now = now or clock.now(EASTERN)
+    if not USE_WARMUP or now.weekday() >= 5 or last_warmup_date() == now.date().isoformat():
+        return False
+    opening = session_open(now.date())
+    return opening - datetime.timedelta(seconds=WARMUP_LEAD) <= now < opening
+
+
+def seconds_until_next_check(interval=3600, now=None):
+    """休市时距离下一次检查的秒数：最多 interval 秒，不错过盘前准备的开始时刻和开盘时刻"""
+    now = now or clock.now(EASTERN)
+    if now.weekday() >= 5:
+        return interval
+    opening = session_open(now.date())
+    targets = [opening]
+    if USE_WARMUP and last_warmup_date() != now.date().isoformat():
+        targets.append(opening - datetime.timedelta(seconds=WARMUP_LEAD))
+    waits = [(target - now).total_seconds() for target in targets if target > now]
+    return max(1, min([interval] + waits))
+
+
+def reconcile_position(symbol, risk_manager):
+    """按券商的持仓修正本地记录，返回 (持仓成本, 股数, 是否有修正)"""
+    if strategy.protective_orders is not None:
+        # 先处理隔夜成交的保护单，再与券商核对
+        strategy.apply_protective_fills(symbol)
+    entry, qty = strategy.get_position(symbol)
+    known = risk_manager.position_data.get(symbol, {})
+    state = strategy.states.get(symbol)
+
+    if qty <= 0:
+        if known.get('qty', 0) <= 0 and (state is None or state["layers"] == 0):
+            return None, 0, False
+        print(f"{symbol} 券商无持仓，清除本地记录的 {known.get('qty', 0)} 股")
+        risk_manager.position_data.pop(symbol, None)
+        if state is not None:
+            strategy.states[symbol] = strategy.new_symbol_state()
+        return None, 0, True
+
+    if known.get('qty') == qty:
+        return entry, qty, False
+    print(f"{symbol} 持仓与券商不一致（本地 {known.get('qty', 0)} 股，券商 {qty} 股），以券商为准")
+    risk_manager.position_data[symbol] = {
+        'entry_price': entry,
+        'qty': qty,
+        'highest_price': max(known.get('highest_price') or entry, entry),
+        'cost_basis': entry * qty,
+    }
+    state = strategy.states.setdefault(symbol, strategy.new_symbol_state())
+    if state["layers"] == 0:
+        state["layers"] = 1
+        state["entry_price"] = entry
+    return entry, qty, True
+
+
+def plan_entries(symbols, context, signals, prices):
+    """
+    预算空仓股票开盘后的开仓规则和股数
+
+    按处理顺序依次从盘前现金中扣除前面股票的预算金额，与周期内逐只下单时现金逐步减少一致。
+    返回 {symbol: {"reason", "price", "qty", "amount"}}。
+    """
+    orders = {}
+    if strategy.risk_manager.check_daily_loss_limit():
+        return orders
+    cash = strategy.get_cash()
+    for symbol in symbols:
+        if symbol not in prices:
+            continue
+        reason, percent = strategy.entry_rule(signals.get(symbol, 0), context.fg_signal)
+        price = prices[symbol]
+        qty = strategy.order_quantity(symbol, percent, price, context, cash=cash)
+        if qty <= 0:
+            continue
+        orders[symbol] = {"reason": reason, "price": price, "qty": qty, "amount": qty * price}
+        cash -= qty * price
+    return orders
+
+
+def run_warmup(risk_manager=None, market_monitor=None):
+    """执行盘前准备，结果记入并返回 strategy.global_state["warmup"]"""
+    started = time.perf_counter()
+    risk_manager = risk_manager or strategy.risk_manager
+    market_monitor = market_monitor or strategy.market_monitor
+    now = clock.now(EASTERN)
+
+    # 市场数据和情绪：刷新缓存，并得到开盘前的市场状态
+    try:
+        market_monitor.refresh()
+    except Exception as e:
+        print(f"盘前刷新市场数据出错: {e}")
+    context = strategy.market_context(market_monitor)
+
+    held = [symbol for symbol, state in strategy.states.items()
+            if state["layers"] > 0 and symbol not in strategy.TARGETS]
+    held += [symbol for symbol, position in risk_manager.position_data.items()
+             if position.get('qty', 0) > 0 and symbol not in strategy.TARGETS and symbol not in held]
+    symbols = strategy.TARGETS + held
+
+    signals, empty, reconciled = {}, {}, []
+    for symbol in symbols:
+        try:
+            entry, qty, changed = reconcile_position(symbol, risk_manager)
+            if changed:
+                reconciled.append(symbol)
+            # 下载日线历史并初始化K线引擎，当天的均线信号和 ATR 写入缓存
+            signals[symbol] = strategy.get_ma_signal(symbol)
+            if USE_ATR_STOP:
+                strategy.calculate_atr(symbol)
+            if qty <= 0 and symbol in strategy.TARGETS:
+                empty[symbol] = strategy.get_price(symbol)
+        except Exception as e:
+            metrics.count("errors")
+            print(f"{symbol} 盘前准备出错: {e}")
+
+    orders = {}
+    try:
+        equity = strategy.account_equity()
+        orders = plan_entries([symbol for symbol in symbols if symbol in empty], context, signals, empty)
+    except Exception as e:
+        equity = None
+        print(f"盘前预算开仓出错: {e}")
+
+    report = {
+        "date": now.date().isoformat(),
+        "seconds": round(time.perf_counter() - started, 3),
+        "market_status": context.market_status,
+        "fg_value": context.fg_value,
+        "equity": equity,
+        "signals": signals,
+        "reconciled": reconciled,
+        "orders": orders,
+    }
+    strategy.global_state["warmup"] = report
+
+    planned = ', '.join(f"{symbol} {order['qty']} 股（{order['reason']}）" for symbol, order in orders.items())
+    notify(f"盘前准备完成，耗时 {report['seconds']:.1f} 秒，市场状况: {context.market_status}"
+           + (f"，以券商为准修正持仓: {', '.join(reconciled)}" if reconciled else "")
+           + (f"，开盘候选买入: {planned}" if planned else ""))
+    return report